@@ -0,0 +1,476 @@
+#!/usr/bin/env python3
+"""
+Бенчмарки производительности операций с трассами.
+Запуск: python benchmark_routes.py [имя_бенчмарка ...]
+
+Все замеры выполняются на временной базе SQLite, рабочая база не затрагивается.
+"""
+
+import os
+import sys
+import random
+import tempfile
+import time
+import statistics
+import threading
+import tracemalloc
+import csv
+from io import BytesIO
+from collections import Counter
+from datetime import date
+
+import django
+
+# Настройка Django на временной базе данных
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'climbing_routes_project.settings')
+from django.conf import settings  # noqa: E402
+
+BENCH_DB_PATH = os.path.join(tempfile.mkdtemp(prefix='routes_bench_'), 'bench.sqlite3')
+settings.DATABASES['default']['NAME'] = BENCH_DB_PATH
+django.setup()
+
+from django.core.management import call_command  # noqa: E402
+from django.core.exceptions import ValidationError  # noqa: E402
+from django.db import connection, transaction  # noqa: E402
+from django.db.models import Count  # noqa: E402
+from django.http import HttpResponse  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+from rest_framework.parsers import JSONParser  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+from routes import renderers  # noqa: E402
+from routes.bulk import bulk_create_routes  # noqa: E402
+from routes.compact import build_compact_routes  # noqa: E402
+from routes.fuzzy import TrigramIndex  # noqa: E402
+from routes.suggest import RouteSuggestions  # noqa: E402
+from routes.models import Route  # noqa: E402
+from routes.serializers import RouteReadSerializer, RouteSerializer  # noqa: E402
+from routes.views import export_routes_csv  # noqa: E402
+
+DIFFICULTIES = [choice[0] for choice in Route.DifficultyLevel.choices]
+COLORS = ['красный', 'синий', 'зеленый', 'желтый']
+
+
+def make_route(lane, position):
+    """Трасса для синтетической нагрузки (по 4 трассы на дорожке)"""
+    route = Route(
+        route_number=(lane - 1) * 4 + position,
+        track_lane=lane,
+        name=f'Трасса {lane}-{position}',
+        difficulty=DIFFICULTIES[(lane + position) % len(DIFFICULTIES)],
+        color=COLORS[position - 1],
+        author=f'Автор {lane % 60}',
+        setup_date=date(2025, 9, 1),
+    )
+    route.refresh_derived_fields()
+    return route
+
+
+def populate(total_routes):
+    """Заполнить базу заданным количеством трасс, минуя валидацию"""
+    Route.objects.all().delete()
+    lanes = (total_routes + 3) // 4
+    routes = [
+        make_route(lane, position)
+        for lane in range(1, lanes + 1)
+        for position in range(1, 5)
+    ][:total_routes]
+    Route.objects.bulk_create(routes, batch_size=500)
+    return lanes
+
+
+def legacy_renumber():
+    """Прежняя перенумерация: вся таблица, по одному UPDATE на трассу"""
+    with transaction.atomic():
+        routes_by_lane = {}
+        for route in Route.objects.all().order_by('track_lane', 'id'):
+            routes_by_lane.setdefault(route.track_lane, []).append(route)
+        for lane, routes_on_lane in routes_by_lane.items():
+            for position, route in enumerate(routes_on_lane):
+                Route.objects.filter(pk=route.pk).update(route_number=(lane - 1) * 4 + position + 1)
+
+
+def timed(func, repeats):
+    """Медиана времени выполнения в миллисекундах"""
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def bench_renumber(sizes=(500, 2000, 8000), repeats=7):
+    """Задержка удаления одной трассы с последующей перенумерацией"""
+    print("\n🔢 Удаление трассы + перенумерация (медиана, мс)")
+    print(f"{'трасс':>8} | {'по дорожке':>11} | {'вся таблица':>12}")
+    print("-" * 38)
+    for size in sizes:
+        lanes = populate(size)
+
+        def delete_lane_scoped():
+            lane = random.randint(1, lanes)
+            route = Route.objects.filter(track_lane=lane).order_by('id').first()
+            if route is None:
+                return
+            with transaction.atomic():
+                route.delete()
+                Route.renumber_routes(lanes=[lane])
+
+        def delete_full_table():
+            lane = random.randint(1, lanes)
+            route = Route.objects.filter(track_lane=lane).order_by('id').first()
+            if route is None:
+                return
+            with transaction.atomic():
+                route.delete()
+                legacy_renumber()
+
+        scoped_ms = timed(delete_lane_scoped, repeats)
+        populate(size)
+        full_ms = timed(delete_full_table, repeats)
+        print(f"{size:>8} | {scoped_ms:>11.2f} | {full_ms:>12.2f}")
+
+
+def bench_bulk_create(sizes=(35, 70, 140), repeats=3):
+    """Массовое создание трасс: по одной через сериализатор против пакетной проверки
+
+    Скалодром вмещает 35 * 4 = 140 трасс, поэтому больший пакет не имеет смысла.
+    """
+    print("\n📦 Массовое создание трасс (медиана, мс / запросов к базе)")
+    print(f"{'трасс':>8} | {'по одной':>16} | {'пакетом':>16}")
+    print("-" * 46)
+    for size in sizes:
+        routes_data = [
+            {
+                'track_lane': i % 35 + 1,
+                'name': f'Пакет {i}',
+                'difficulty': DIFFICULTIES[i % len(DIFFICULTIES)],
+                'color': f'цвет {i}',
+                'author': 'Автор',
+                'setup_date': '01.09.2025',
+            }
+            for i in range(size)
+        ]
+
+        def one_by_one():
+            with transaction.atomic():
+                for route_data in routes_data:
+                    serializer = RouteSerializer(data=route_data)
+                    serializer.is_valid(raise_exception=True)
+                    serializer.save()
+
+        def batched():
+            bulk_create_routes(routes_data)
+
+        results = []
+        for func in (one_by_one, batched):
+            samples = []
+            for _ in range(repeats):
+                Route.objects.all().delete()
+                with CaptureQueriesContext(connection) as captured:
+                    samples.append(timed(func, 1))
+            results.append(f"{statistics.median(samples):>8.1f} / {len(captured):>5}")
+        print(f"{size:>8} | {results[0]:>16} | {results[1]:>16}")
+
+
+def stress_route_numbers(threads=8, lanes=10, attempts_per_thread=12):
+    """Параллельное создание трасс из нескольких потоков на общих дорожках
+
+    Каждый поток пытается добавить трассы на случайные дорожки из небольшого
+    набора, так что потоки постоянно конкурируют за одни и те же номера.
+    """
+    print(f"\n🧵 Параллельное создание трасс: {threads} потоков, {lanes} дорожек")
+    Route.objects.all().delete()
+    outcomes = Counter()
+    outcomes_lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def worker(worker_id):
+        rng = random.Random(worker_id)
+        barrier.wait()
+        try:
+            for attempt in range(attempts_per_thread):
+                try:
+                    Route.objects.create(
+                        track_lane=rng.randint(1, lanes),
+                        name=f'Поток {worker_id} - {attempt}',
+                        difficulty=rng.choice(DIFFICULTIES),
+                        color=f'цвет {worker_id}-{attempt}',
+                        author=f'Автор {worker_id}',
+                        setup_date=date(2025, 9, 1),
+                    )
+                    result = 'created'
+                except ValidationError:
+                    # Дорожка заполнена - ожидаемый отказ
+                    result = 'rejected'
+                except Exception as e:
+                    result = f'error: {type(e).__name__}: {e}'
+                with outcomes_lock:
+                    outcomes[result] += 1
+        finally:
+            connection.close()
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    numbers = list(Route.objects.values_list('route_number', flat=True))
+    duplicates = sorted(number for number, count in Counter(numbers).items() if count > 1)
+    overfull = [
+        lane for lane, count in Counter(Route.objects.values_list('track_lane', flat=True)).items()
+        if count > 4
+    ]
+    attempts = sum(outcomes.values())
+
+    print(f"   Создано: {outcomes['created']}, отклонено (дорожка заполнена): {outcomes['rejected']}")
+    for result, count in outcomes.items():
+        if result.startswith('error'):
+            print(f"   ❌ {result} x{count}")
+    print(f"   Пропускная способность: {attempts / elapsed:.1f} попыток/с, {outcomes['created'] / elapsed:.1f} трасс/с")
+    if duplicates or overfull:
+        print(f"   ❌ Повторяющиеся номера: {duplicates}, переполненные дорожки: {overfull}")
+    else:
+        print(f"   ✅ Все {len(numbers)} номеров уникальны, дорожки не переполнены")
+    return not duplicates and not overfull
+
+
+NAME_SYLLABLES = ['ка', 'ро', 'ве', 'ти', 'ла', 'мо', 'за', 'ни', 'ду', 'ше', 'гра', 'сто', 'пле', 'вор', 'лин']
+
+
+def misspell(text, rng):
+    """Одна опечатка: замена, пропуск или перестановка соседних букв"""
+    i = rng.randrange(1, len(text) - 1)
+    kind = rng.choice(('replace', 'drop', 'swap'))
+    if kind == 'replace':
+        return text[:i] + rng.choice('аеиоу') + text[i + 1:]
+    if kind == 'drop':
+        return text[:i] + text[i + 1:]
+    return text[:i - 1] + text[i] + text[i - 1] + text[i + 1:]
+
+
+def random_names(routes, rng):
+    """Названия из пар "слов" словаря в несколько тысяч слов"""
+    vocabulary = sorted({
+        ''.join(rng.choice(NAME_SYLLABLES) for _ in range(rng.randint(3, 4))) for _ in range(4000)
+    })
+    for route in routes:
+        route.name = ' '.join(rng.sample(vocabulary, 2)).capitalize()
+    Route.objects.bulk_update(routes, ['name'], batch_size=500)
+
+
+def bench_fuzzy(sizes=(1000, 10000, 30000), queries=200):
+    """Поиск по названию с опечаткой: триграммный индекс против icontains"""
+    print("\n🔎 Поиск с опечаткой (медиана на запрос, мс / найдено искомых)")
+    print(f"{'трасс':>8} | {'построение':>10} | {'индекс':>16} | {'icontains':>16}")
+    print("-" * 60)
+    rng = random.Random(17)
+    for size in sizes:
+        populate(size)
+        routes = list(Route.objects.only('id', 'name'))
+        random_names(routes, rng)
+
+        started = time.perf_counter()
+        index = TrigramIndex()
+        index.rebuild()
+        build_ms = (time.perf_counter() - started) * 1000
+
+        samples = [rng.choice(routes) for _ in range(queries)]
+        typos = [(route.pk, misspell(route.name, rng)) for route in samples]
+
+        results = []
+        for search in (
+            lambda text: [route_id for route_id, _ in index.search(text)],
+            lambda text: list(Route.objects.filter(name__icontains=text).values_list('id', flat=True)),
+        ):
+            durations = []
+            hits = 0
+            for route_id, text in typos:
+                started = time.perf_counter()
+                found = search(text)
+                durations.append((time.perf_counter() - started) * 1000)
+                hits += route_id in found
+            results.append(f"{statistics.median(durations):>7.3f} / {hits:>3}/{queries}")
+        print(f"{size:>8} | {build_ms:>10.0f} | {results[0]:>16} | {results[1]:>16}")
+
+
+def bench_suggest(sizes=(1000, 10000, 30000), queries=500):
+    """Подсказки по префиксу названия: массивы в памяти против icontains в базе"""
+    print("\n💡 Подсказки по префиксу названия (медиана на запрос, мс)")
+    print(f"{'трасс':>8} | {'построение':>10} | {'1-2 буквы':>10} | {'3+ букв':>10} | {'icontains':>10}")
+    print("-" * 62)
+    rng = random.Random(19)
+    for size in sizes:
+        populate(size)
+        routes = list(Route.objects.only('id', 'name'))
+        random_names(routes, rng)
+
+        started = time.perf_counter()
+        suggestions = RouteSuggestions()
+        suggestions.rebuild(version=None)
+        build_ms = (time.perf_counter() - started) * 1000
+
+        names = [rng.choice(routes).name for _ in range(queries)]
+        results = []
+        for prefixes, search in (
+            ([name[:rng.randint(1, 2)] for name in names], lambda prefix: suggestions.complete('name', prefix)),
+            ([name[:rng.randint(3, 8)] for name in names], lambda prefix: suggestions.complete('name', prefix)),
+            ([name[:rng.randint(3, 8)] for name in names], lambda prefix: list(
+                Route.objects.filter(name__icontains=prefix).values('name').annotate(count=Count('id'))
+                .order_by('-count', 'name')[:10]
+            )),
+        ):
+            durations = []
+            for prefix in prefixes:
+                started = time.perf_counter()
+                search(prefix)
+                durations.append((time.perf_counter() - started) * 1000)
+            results.append(statistics.median(durations))
+        print(f"{size:>8} | {build_ms:>10.0f} | {results[0]:>10.3f} | {results[1]:>10.3f} | {results[2]:>10.3f}")
+
+
+def bench_fields(size=8000, repeats=30):
+    """Страница списка трасс целиком против fields= с полями для дорожек"""
+    print("\n✂️  Список трасс, страница из 100 (медиана, мс / байт ответа)")
+    populate(size)
+    Route.objects.update(description='Описание трассы: зацепки, рельеф и особенности. ' * 10)
+    client = APIClient()
+    for label, query in (
+        ('все поля', ''),
+        ('fields=дорожка', '&fields=track_lane,route_number,difficulty,color'),
+    ):
+        url = f'/api/routes/?page_size=100{query}'
+        sizes = []
+
+        def request():
+            sizes.append(len(client.get(url).content))
+
+        print(f"   {label:>16}: {timed(request, repeats):>7.2f} мс / {sizes[-1]:>7} байт")
+
+
+def bench_serializer(sizes=(100, 1000, 5000), repeats=7):
+    """Сериализация списка трасс: RouteSerializer против строк values()"""
+    print("\n🧾 Сериализация списка трасс вместе с запросом (медиана, мс)")
+    print(f"{'трасс':>8} | {'RouteSerializer':>15} | {'values()':>10} | {'ускорение':>9}")
+    print("-" * 52)
+    populate(max(sizes))
+    for size in sizes:
+        queryset = Route.objects.order_by('id')[:size]
+        model_ms = timed(lambda: RouteSerializer(queryset, many=True).data, repeats)
+        rows_ms = timed(lambda: RouteReadSerializer().data(queryset), repeats)
+        print(f"{size:>8} | {model_ms:>15.2f} | {rows_ms:>10.2f} | {model_ms / rows_ms:>8.1f}x")
+
+
+def bench_renderers(sizes=(100, 1000, 5000), repeats=15):
+    """Кодирование и разбор списка трасс: json, orjson, MessagePack"""
+    codecs = [('json', JSONRenderer(), JSONParser()), ('orjson', renderers.ORJSONRenderer(), renderers.ORJSONParser())]
+    if renderers.msgpack is not None:
+        codecs.append(('msgpack', renderers.MessagePackRenderer(), renderers.MessagePackParser()))
+
+    print("\n📨 Кодирование / разбор списка трасс (медиана, мс)")
+    print(f"{'трасс':>8} | " + " | ".join(f"{name:>17}" for name, _, _ in codecs))
+    print("-" * (11 + 20 * len(codecs)))
+    populate(max(sizes))
+    for size in sizes:
+        data = {'results': RouteReadSerializer().data(Route.objects.order_by('id')[:size])}
+        cells = []
+        for name, renderer, parser in codecs:
+            content = renderer.render(data)
+            render_ms = timed(lambda: renderer.render(data), repeats)
+            parse_ms = timed(lambda: parser.parse(BytesIO(content)), repeats)
+            cells.append(f"{render_ms:>7.2f} / {parse_ms:>7.2f}")
+        print(f"{size:>8} | " + " | ".join(f"{cell:>17}" for cell in cells))
+
+
+def bench_compact(sizes=(140, 1000, 5000), repeats=15):
+    """Все трассы объектами против выгрузки по колонкам (без кеша)"""
+    renderer = renderers.ORJSONRenderer()
+    print("\n🗜️  Выгрузка всех трасс: построение и кодирование (медиана, мс / байт)")
+    print(f"{'трасс':>8} | {'объекты':>20} | {'колонки':>20} | {'меньше':>7}")
+    print("-" * 66)
+    for size in sizes:
+        populate(size)
+        cells = []
+        for build in (
+            lambda: RouteReadSerializer().data(Route.objects.order_by('track_lane', 'route_number')),
+            build_compact_routes,
+        ):
+            content = renderer.render(build())
+            cells.append((timed(lambda: renderer.render(build()), repeats), len(content)))
+        print(
+            f"{size:>8} | " + " | ".join(f"{ms:>7.2f} / {length:>10}" for ms, length in cells)
+            + f" | {cells[0][1] / cells[1][1]:>6.1f}x"
+        )
+
+
+def legacy_export_csv():
+    """Прежний экспорт CSV: весь файл в HttpResponse, трассы - объектами модели"""
+    routes = Route.objects.filter(is_active=True).order_by('route_number')
+    response = HttpResponse(content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="traссы_{len(routes)}_шт.csv"'
+    response.write('\ufeff')
+    writer = csv.writer(response)
+    writer.writerow(['№ Трассы', 'Дорожка', 'Название', 'Сложность', 'Цвет', 'Автор', 'Дата накрутки', 'Описание'])
+    for route in routes:
+        writer.writerow([
+            route.route_number, route.track_lane, route.name, route.difficulty, route.color, route.author,
+            route.setup_date.strftime('%d.%m.%Y') if route.setup_date else '', route.description or '',
+        ])
+    return len(response.content)
+
+
+def streaming_export_csv():
+    """Потоковый экспорт CSV: ответ читается порциями, как при отдаче клиенту"""
+    response = export_routes_csv(RequestFactory().get('/api/routes/export-csv/'))
+    return sum(len(chunk) for chunk in response.streaming_content)
+
+
+def bench_export(sizes=(5000, 20000, 40000), repeats=3):
+    """Экспорт CSV: время и пик памяти Python (tracemalloc)"""
+    print("\n📤 Экспорт CSV (медиана, мс / пик памяти, МБ)")
+    print(f"{'трасс':>8} | {'в памяти':>18} | {'потоком':>18}")
+    print("-" * 52)
+    for size in sizes:
+        populate(size)
+        Route.objects.update(description='Описание трассы: зацепки, рельеф и особенности. ' * 3)
+        cells = []
+        for export in (legacy_export_csv, streaming_export_csv):
+            milliseconds = timed(export, repeats)
+            tracemalloc.start()
+            export()
+            peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            tracemalloc.stop()
+            cells.append(f"{milliseconds:>8.1f} / {peak:>7.1f}")
+        print(f"{size:>8} | " + " | ".join(cells))
+
+
+BENCHMARKS = {
+    'renumber': bench_renumber,
+    'bulk_create': bench_bulk_create,
+    'stress': stress_route_numbers,
+    'fuzzy': bench_fuzzy,
+    'suggest': bench_suggest,
+    'fields': bench_fields,
+    'serializer': bench_serializer,
+    'renderers': bench_renderers,
+    'compact': bench_compact,
+    'export': bench_export,
+}
+
+
+def main(names):
+    call_command('migrate', verbosity=0)
+    for name in names or BENCHMARKS:
+        if name not in BENCHMARKS:
+            print(f"❌ Неизвестный бенчмарк: {name}. Доступны: {', '.join(BENCHMARKS)}")
+            continue
+        BENCHMARKS[name]()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
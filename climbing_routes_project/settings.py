@@ -80,6 +80,9 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Тестовая база - файл, как и рабочая: общая база в памяти на конкурентную
+        # запись из потоков отвечает "table is locked", не дожидаясь блокировки
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
@@ -130,13 +133,25 @@ STATICFILES_DIRS = [
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # REST Framework settings
+# JSON кодируется и разбирается через orjson, MessagePack (application/msgpack) -
+# через msgpack (routes/renderers.py, обе библиотеки - в requirements.txt)
+API_RENDERER_CLASSES = [
+    'routes.renderers.ORJSONRenderer',
+    'routes.renderers.MessagePackRenderer',
+]
+API_PARSER_CLASSES = [
+    'routes.renderers.ORJSONParser',
+    'rest_framework.parsers.FormParser',
+    'rest_framework.parsers.MultiPartParser',
+    'routes.renderers.MessagePackParser',
+]
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
-    'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
-    ],
+    'DEFAULT_RENDERER_CLASSES': API_RENDERER_CLASSES,
+    'DEFAULT_PARSER_CLASSES': API_PARSER_CLASSES,
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20
 }
@@ -163,7 +178,7 @@ LOGGING = {
         'file': {
             'level': 'INFO',
             'class': 'logging.FileHandler',
-            'filename': 'climbing_routes.log',
+            'filename': BASE_DIR / 'climbing_routes.log',
             'formatter': 'verbose',
         },
         'console': {
@@ -61,7 +61,7 @@ def demo_quick_test():
     
     # 3. Поиск по сложности
     print(f"\n3️⃣ Поиск средних трасс...")
-    response = requests.get(f"{BASE_URL}/routes/search/?difficulty=medium")
+    response = requests.get(f"{BASE_URL}/routes/search/?difficulty=medium&count=exact")
     if response.status_code == 200:
         results = response.json()
         print(f"   🔍 Найдено средних трасс: {results['count']}")
@@ -39,7 +39,7 @@ def export_routes_to_hosting():
                 'difficulty': route.difficulty,
                 'author': route.author,
                 'color': route.color,
-                'setup_date': str(route.setup_date) if route.setup_date else '',
+                'setup_date': route.setup_date.strftime('%d.%m.%Y') if route.setup_date else '',
                 'description': route.description or '',
                 'is_active': route.is_active
             }
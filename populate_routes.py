@@ -57,8 +57,7 @@ def populate_routes():
                 
                 # Генерируем случайную дату в последние 6 месяцев
                 days_ago = random.randint(1, 180)
-                setup_date = datetime.now() - timedelta(days=days_ago)
-                setup_date_str = setup_date.strftime('%d.%m.%Y')
+                setup_date = (datetime.now() - timedelta(days=days_ago)).date()
                 
                 # Создаем описание
                 description = f"Трасса на дорожке {lane}, позиция {position}. Сложность: {difficulty}"
@@ -71,7 +70,7 @@ def populate_routes():
                     difficulty=difficulty,
                     color=color,
                     author=author,
-                    setup_date=setup_date_str,
+                    setup_date=setup_date,
                     description=description,
                     is_active=random.choice([True, True, True, False])  # 75% активных
                 )
@@ -0,0 +1,308 @@
+"""
+Пакетная проверка правил дорожек для массовых операций с трассами.
+
+Вместо запросов к базе для каждой трассы снимок затронутых дорожек загружается
+один раз, а правила (вместимость, цвет, дубликаты) проверяются в памяти - с учетом
+трасс, уже принятых в этом же пакете.
+"""
+
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.db import IntegrityError, transaction
+
+from .models import Route, RouteLaneSlot, lane_integrity_error, validate_setup_date
+from .normalize import search_key
+from .serializers import RouteSerializer
+
+# Размер пачки INSERT/UPDATE при массовых операциях
+BULK_BATCH_SIZE = 500
+
+# Поля трассы, которые нужны для проверки правил дорожки
+SNAPSHOT_FIELDS = ('track_lane', 'route_number', 'name', 'difficulty', 'color', 'color_key', 'fingerprint')
+
+
+def route_row(route):
+    """Строка снимка для трассы (в том же виде, что и Route.lane_neighbours())"""
+    return {field: getattr(route, field) for field in SNAPSHOT_FIELDS}
+
+
+def validation_errors(error):
+    """Ошибки ValidationError в виде словаря, как их возвращает API"""
+    if hasattr(error, 'error_dict'):
+        return error.message_dict
+    return {NON_FIELD_ERRORS: error.messages}
+
+
+class LaneSnapshot:
+    """Трассы на затронутых дорожках и смежных с ними
+
+    Трассы хранятся по ключу: для сохраненных - pk, для новых - любой другой
+    уникальный ключ (например, индекс в пакете).
+    """
+
+    def __init__(self, rows=()):
+        self._lanes = {}
+        self._keys = {}
+        for row in rows:
+            row = dict(row)
+            self.put(row.pop('pk'), row)
+
+    @classmethod
+    def load(cls, lanes):
+        """Загрузить одним запросом дорожки ``lanes`` вместе со смежными"""
+        lanes_to_load = set()
+        for lane in lanes:
+            if lane:
+                lanes_to_load.update((lane - 1, lane, lane + 1))
+        if not lanes_to_load:
+            return cls()
+        return cls(Route.objects.filter(track_lane__in=lanes_to_load).values('pk', *SNAPSHOT_FIELDS))
+
+    def put(self, key, row):
+        """Добавить трассу или заменить ее данные"""
+        self.remove(key)
+        self._lanes.setdefault(row['track_lane'], {})[key] = row
+        self._keys[key] = row['track_lane']
+
+    def remove(self, key):
+        lane = self._keys.pop(key, None)
+        if lane is not None:
+            del self._lanes[lane][key]
+
+    def lane_numbers(self, lane, exclude=None):
+        """Занятые номера на дорожке"""
+        return [row['route_number'] for key, row in self._lanes.get(lane, {}).items() if key != exclude]
+
+    def neighbours(self, route, exclude=None):
+        """Соседи трассы для Route.validate_rules(): вся ее дорожка и дубликаты на смежных"""
+        result = []
+        for lane in route.neighbouring_lanes():
+            for key, row in self._lanes.get(lane, {}).items():
+                if key == exclude:
+                    continue
+                if lane == route.track_lane or row['fingerprint'] == route.fingerprint:
+                    result.append(row)
+        result.sort(key=lambda row: (row['track_lane'], row['route_number'] or 0))
+        return result
+
+    def validate(self, route, key):
+        """Проверить трассу по правилам модели и снимку; при успехе записать ее в снимок
+
+        Вызывает ValidationError так же, как Route.full_clean().
+        """
+        route.refresh_derived_fields()
+        errors = {}
+        try:
+            route.clean_fields()
+        except ValidationError as e:
+            errors = e.update_error_dict(errors)
+        try:
+            route.validate_rules(self.neighbours(route, exclude=key))
+        except ValidationError as e:
+            errors = e.update_error_dict(errors)
+        if errors:
+            raise ValidationError(errors)
+        self.put(key, route_row(route))
+
+
+def bulk_create_routes(routes_data):
+    """Массовое создание трасс одной пачкой INSERT
+
+    Каждый элемент проверяется сериализатором и правилами модели по снимку
+    дорожек, номера назначаются по снимку. Возвращает (созданные трассы, ошибки);
+    ошибки - в формате ответа API: {'index', 'data', 'errors'}.
+    """
+    candidates = []
+    errors = []
+    for i, route_data in enumerate(routes_data):
+        serializer = RouteSerializer(data=route_data)
+        if serializer.is_valid():
+            validated_data = dict(serializer.validated_data)
+            validated_data.pop('route_number', None)
+            candidates.append((i, route_data, Route(**validated_data)))
+        else:
+            errors.append({'index': i, 'data': route_data, 'errors': serializer.errors})
+
+    created = []
+    with transaction.atomic():
+        lanes = {route.track_lane for _, _, route in candidates}
+        # Блокировка дорожек до конца транзакции, как в Route.save()
+        RouteLaneSlot.lock_lanes(lanes)
+        snapshot = LaneSnapshot.load(lanes)
+        for i, route_data, route in candidates:
+            key = ('new', i)
+            route.route_number = route.free_route_number(snapshot.lane_numbers(route.track_lane))
+            try:
+                snapshot.validate(route, key)
+            except ValidationError as e:
+                errors.append({'index': i, 'data': route_data, 'errors': validation_errors(e)})
+                continue
+            created.append(route)
+        # Правила дорожек проверены по снимку под блокировкой; ограничения базы
+        # сработают только при записи в обход блокировки - тогда откатывается весь пакет
+        Route.objects.bulk_create(created, batch_size=BULK_BATCH_SIZE)
+
+    errors.sort(key=lambda error: error['index'])
+    return created, errors
+
+
+def parse_route_id(route_id):
+    """ID трассы из запроса как int или None
+
+    Принимаются только целые числа и строки из цифр: int() молча округлил бы
+    1.5 и отказал бы только на "1.9", а в JSON true - тоже целое число.
+    """
+    if isinstance(route_id, bool):
+        return None
+    if isinstance(route_id, int):
+        return route_id
+    if isinstance(route_id, str) and route_id.strip().isdecimal():
+        return int(route_id)
+    return None
+
+
+def parse_route_ids(route_ids):
+    """Разделить ID из запроса на корректные (int) и некорректные"""
+    valid_ids = {}
+    invalid_ids = []
+    for route_id in route_ids:
+        pk = parse_route_id(route_id)
+        if pk is None:
+            invalid_ids.append(route_id)
+        else:
+            valid_ids[route_id] = pk
+    return valid_ids, invalid_ids
+
+
+def bulk_delete_routes(route_ids):
+    """Удалить трассы одним DELETE ... WHERE id IN и перенумеровать затронутые дорожки
+
+    Возвращает (количество удаленных трасс, ID, которые не найдены) - ID
+    возвращаются в том виде, в каком пришли в запросе.
+    """
+    valid_ids, not_found_ids = parse_route_ids(route_ids)
+    with transaction.atomic():
+        lanes = dict(Route.objects.filter(pk__in=set(valid_ids.values())).values_list('pk', 'track_lane'))
+        not_found_ids += [route_id for route_id, pk in valid_ids.items() if pk not in lanes]
+        if not lanes:
+            return 0, not_found_ids
+        deleted_count, _ = Route.objects.filter(pk__in=lanes).delete()
+        Route.renumber_routes(lanes=set(lanes.values()))
+    return deleted_count, not_found_ids
+
+
+def bulk_update_routes(updates_data):
+    """Массовое обновление трасс одним bulk_update
+
+    Изменения проверяются сериализатором и правилами модели по снимку дорожек
+    (старых и новых), в порядке следования в запросе. Одна трасса может
+    встретиться в пакете только один раз. Возвращает (обновленные трассы,
+    ошибки); ошибки - в формате ответа API.
+    """
+    errors = []
+    requested = []
+    for update_data in updates_data:
+        route_id = update_data.get('id')
+        if not route_id:
+            errors.append({'data': update_data, 'error': 'Не указан ID трассы'})
+        else:
+            requested.append((route_id, parse_route_id(route_id), update_data))
+
+    with transaction.atomic():
+        routes = Route.objects.in_bulk({pk for _, pk, _ in requested if pk is not None})
+        changes = []
+        seen = set()
+        for route_id, pk, update_data in requested:
+            route = routes.get(pk)
+            if route is None:
+                errors.append({'id': route_id, 'error': 'Трасса не найдена'})
+                continue
+            if pk in seen:
+                errors.append({'id': route_id, 'data': update_data, 'error': 'Трасса уже указана в этом пакете'})
+                continue
+            seen.add(pk)
+            serializer = RouteSerializer(route, data=update_data, partial=True)
+            if not serializer.is_valid():
+                errors.append({'id': route_id, 'data': update_data, 'errors': serializer.errors})
+                continue
+            changes.append((route, route_id, update_data, serializer.validated_data))
+
+        lanes = {route.track_lane for route, _, _, _ in changes}
+        lanes.update(data['track_lane'] for _, _, _, data in changes if 'track_lane' in data)
+        RouteLaneSlot.lock_lanes(lanes)
+        snapshot = LaneSnapshot.load(lanes)
+
+        updated = {}
+        fields = {'fingerprint', 'difficulty_rank', 'author_key', 'color_key'}
+        for route, route_id, update_data, validated_data in changes:
+            previous = {field: getattr(route, field) for field in validated_data}
+            for field, value in validated_data.items():
+                setattr(route, field, value)
+            try:
+                snapshot.validate(route, route.pk)
+            except ValidationError as e:
+                for field, value in previous.items():
+                    setattr(route, field, value)
+                route.refresh_derived_fields()
+                errors.append({'id': route_id, 'data': update_data, 'errors': validation_errors(e)})
+                continue
+            fields.update(validated_data)
+            updated[route.pk] = (route, route_id, update_data)
+
+        fields = sorted(fields)
+        try:
+            with transaction.atomic():
+                Route.objects.bulk_update([route for route, _, _ in updated.values()], fields, batch_size=BULK_BATCH_SIZE)
+        except IntegrityError:
+            # Ограничения базы проверяются построчно в порядке id, а снимок - в порядке
+            # запроса, поэтому перестановка цветов или трасс между заполненными дорожками
+            # может не пройти одним UPDATE. Тогда трассы записываются по одной в порядке
+            # запроса, и ошибка достается только тем, которые нарушают правила и так
+            for pk, (route, route_id, update_data) in list(updated.items()):
+                try:
+                    with transaction.atomic():
+                        Route.objects.bulk_update([route], fields)
+                except IntegrityError as exc:
+                    error = lane_integrity_error(exc, route.track_lane, route.color)
+                    if error is None:
+                        raise
+                    del updated[pk]
+                    errors.append({'id': route_id, 'data': update_data, 'errors': validation_errors(error)})
+
+    return [route for route, _, _ in updated.values()], errors
+
+
+# Поля, которые можно менять одним UPDATE по фильтру: они не участвуют в
+# правилах дорожек. Дата накрутки проверяется в filter_update_values, ключ
+# поиска автора там же пересчитывается
+FILTER_UPDATE_FIELDS = ('is_active', 'author', 'setup_date', 'description')
+
+
+def filter_update_values(fields):
+    """Значения для UPDATE по фильтру вместе с производными полями трассы
+
+    UPDATE идет в обход Route.full_clean(), поэтому правила отдельных полей
+    проверяются здесь; при нарушении - ValidationError с ошибками по полям.
+    """
+    values = dict(fields)
+    if 'setup_date' in values:
+        try:
+            validate_setup_date(values['setup_date'])
+        except ValidationError as e:
+            raise ValidationError({'setup_date': e.messages})
+    if 'author' in values:
+        values['author_key'] = search_key(values['author'])
+    return values
+
+
+def delete_routes_where(queryset):
+    """Удалить все трассы из выборки одним DELETE и перенумеровать затронутые дорожки
+
+    Возвращает количество удаленных трасс.
+    """
+    with transaction.atomic():
+        lanes = set(queryset.order_by().values_list('track_lane', flat=True).distinct())
+        if not lanes:
+            return 0
+        deleted_count, _ = queryset.delete()
+        Route.renumber_routes(lanes=lanes)
+    return deleted_count
@@ -0,0 +1,42 @@
+"""
+Кеширование производных данных трасс по версии данных.
+
+Версия - номер последней строки журнала изменений (RouteChangeLog), который
+ведут триггеры базы. Любая запись в таблицу трасс меняет версию, поэтому
+закешированные значения не нужно сбрасывать вручную: ключ просто перестает
+совпадать.
+"""
+
+from django.core.cache import cache
+from django.db import connection
+
+from .models import RouteChangeLog
+from .triggers import TRIGGER_VENDORS
+
+# Время жизни значений в кеше (секунды); устаревшие версии вытесняются по нему
+CACHE_TIMEOUT = 60 * 60
+
+
+def data_version():
+    """Текущая версия данных трасс или None, если журнал изменений не ведется"""
+    if connection.vendor not in TRIGGER_VENDORS:
+        return None
+    return RouteChangeLog.current_version()
+
+
+def cached_for_version(key, build, version=None):
+    """Значение ``build()``, закешированное под текущей версией данных
+
+    ``version`` можно передать, если она уже получена в этом запросе. Без журнала
+    изменений значение вычисляется каждый раз.
+    """
+    if version is None:
+        version = data_version()
+    if version is None:
+        return build()
+    cache_key = f'routes:{key}:v{version}'
+    value = cache.get(cache_key)
+    if value is None:
+        value = build()
+        cache.set(cache_key, value, CACHE_TIMEOUT)
+    return value
@@ -0,0 +1,88 @@
+"""
+Компактная выгрузка трасс по колонкам (GET /api/routes/compact/).
+
+Вместо списка объектов, где одни и те же автор и цвет повторяются сотни раз,
+каждое поле отдается одним массивом, а авторы, цвета и категории сложности -
+словарями: в колонках только их номера. Клиент (главная страница, мобильные
+приложения) фильтрует трассы сравнением целых чисел.
+
+Выгрузка строится одним запросом values_list и кешируется по версии данных и
+ключу фильтра (см. routes/cache.py).
+"""
+
+from datetime import date
+
+from .cache import cached_for_version
+from .filters import RouteFilter
+from .models import Route
+
+# Категории сложности по рангу: номер в колонке grade - ранг категории
+# (Route.DIFFICULTY_RANKS), 0 - неизвестная категория '-'
+COMPACT_GRADES = [Route.DifficultyLevel.GRADE_UNKNOWN.value] + list(Route.DIFFICULTY_RANKS)
+
+# Колонки выгрузки и поля трассы, из которых они берутся
+COMPACT_COLUMNS = (
+    ('id', 'id'),
+    ('lane', 'track_lane'),
+    ('number', 'route_number'),
+    ('grade', 'difficulty_rank'),
+    ('color', 'color'),
+    ('author', 'author'),
+    ('name', 'name'),
+    ('setup', 'setup_date'),
+)
+
+# Начало отсчета дней в колонке setup (дата накрутки)
+EPOCH = date(1970, 1, 1)
+
+
+def dictionary_encode(values):
+    """Словарь значений (по алфавиту) и номера значений в словаре"""
+    dictionary = sorted(set(values))
+    ids = {value: index for index, value in enumerate(dictionary)}
+    return dictionary, [ids[value] for value in values]
+
+
+def build_compact_routes(queryset=None):
+    """Выгрузка трасс (по умолчанию всех) по колонкам
+
+    Колонки: id, lane, number, grade (ранг категории, индекс в grades), color и
+    author (индексы в colors и authors), name, setup (дней с 1970-01-01 или
+    null). Трассы идут по дорожкам и номерам.
+    """
+    if queryset is None:
+        queryset = Route.objects.all()
+    rows = queryset.order_by('track_lane', 'route_number', 'id').values_list(
+        *[field for _, field in COMPACT_COLUMNS]
+    )
+    columns = dict(zip(
+        [column for column, _ in COMPACT_COLUMNS],
+        [list(values) for values in zip(*rows)] or [[] for _ in COMPACT_COLUMNS],
+    ))
+
+    authors, columns['author'] = dictionary_encode(columns['author'])
+    colors, columns['color'] = dictionary_encode(columns['color'])
+    columns['grade'] = [rank or 0 for rank in columns['grade']]
+    columns['setup'] = [
+        (setup_date - EPOCH).days if setup_date is not None else None
+        for setup_date in columns['setup']
+    ]
+    return {
+        'count': len(columns['id']),
+        'columns': columns,
+        'authors': authors,
+        'colors': colors,
+        'grades': COMPACT_GRADES,
+    }
+
+
+def cached_compact_routes(params=None):
+    """Выгрузка трасс по колонкам из кеша текущей версии данных
+
+    ``params`` - фильтры трасс (кешируются по каноническому ключу фильтра).
+    Вызывает RouteFilterError, если параметры фильтра некорректны.
+    """
+    route_filter = RouteFilter.compile(params or {})
+    return cached_for_version(
+        f'compact:{route_filter.cache_key}', lambda: build_compact_routes(route_filter.apply())
+    )
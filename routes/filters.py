@@ -0,0 +1,303 @@
+"""
+Фильтры трасс по параметрам запроса.
+
+Один набор фильтров используется списком трасс, расширенным поиском,
+статистикой, фасетами, экспортом CSV и массовыми операциями по фильтру.
+Параметры описаны декларативно (ROUTE_FILTERS): каждый один раз проверяется и
+приводится к каноническому значению, из канонических значений строятся и
+условия запроса, и ключ кеша.
+
+Параметры difficulty, author, color и track_lane принимают несколько значений
+через запятую или повтором параметра (difficulty=6a,6b) - подходит любое из
+них. Списки и диапазоны одного измерения (difficulty + difficulty_min/max,
+track_lane + lane_min/lane_max) сводятся к одному условию.
+"""
+
+import hashlib
+from collections import namedtuple
+from datetime import date, datetime
+
+from django.db.models import Q
+
+from .fuzzy import fuzzy_search
+from .models import Route, RouteSearchToken
+from .normalize import key_prefix_condition, search_key
+from .search import fulltext_condition
+
+# Форматы дат накрутки, принимаемые фильтрами setup_after/setup_before
+SETUP_DATE_FILTER_FORMATS = ['%d.%m.%Y', '%Y-%m-%d']
+
+# Значения параметров-флагов
+TRUE_VALUES = ('true', '1', 'yes')
+FALSE_VALUES = ('false', '0', 'no')
+
+# Условие, которому не соответствует ни одна трасса (запрос к базе не выполняется)
+NOTHING = Q(pk__in=[])
+
+
+class RouteFilterError(ValueError):
+    """Некорректное значение параметра фильтра"""
+
+
+def parse_setup_date(value):
+    """Разобрать дату накрутки из параметра запроса (DD.MM.YYYY или YYYY-MM-DD)"""
+    for date_format in SETUP_DATE_FILTER_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), date_format).date()
+        except ValueError:
+            continue
+    raise ValueError(f'Некорректная дата накрутки: {value}')
+
+
+def parse_text(param, value):
+    return value.strip() or None
+
+
+def parse_key(param, value):
+    return search_key(value) or None
+
+
+def parse_difficulty(param, value):
+    value = value.strip()
+    if value not in Route.DifficultyLevel.values:
+        raise RouteFilterError(f'Некорректный уровень сложности: {value}')
+    return value
+
+
+def parse_difficulty_bound(param, value):
+    value = value.strip()
+    if value not in Route.DIFFICULTY_RANKS:
+        raise RouteFilterError(f'Некорректная граница сложности {param}: {value}')
+    return Route.DIFFICULTY_RANKS[value]
+
+
+def parse_lane(param, value):
+    try:
+        return int(value)
+    except ValueError:
+        raise RouteFilterError(f'Некорректный номер дорожки в параметре {param}: {value}')
+
+
+def parse_flag(param, value):
+    value = value.strip().lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise RouteFilterError(f'Некорректное значение {param}: {value}, ожидается true или false')
+
+
+def parse_created(param, value):
+    try:
+        return datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    except ValueError:
+        raise RouteFilterError(f'Некорректный формат даты для {param}')
+
+
+def parse_setup(param, value):
+    try:
+        return parse_setup_date(value)
+    except ValueError:
+        raise RouteFilterError(f'Некорректный формат даты для {param}, ожидается DD.MM.YYYY')
+
+
+# Описание параметра фильтра: имя, разбор значения (None - параметр не задан)
+# и принимает ли параметр несколько значений
+FilterParam = namedtuple('FilterParam', ['name', 'parse', 'multiple'])
+
+ROUTE_FILTERS = (
+    # Полнотекстовый поиск по названию, автору, цвету и описанию
+    FilterParam('q', parse_text, False),
+    # Нечеткий поиск по названию и автору (с опечатками)
+    FilterParam('fuzzy', parse_text, False),
+    # Поиск по названию (name - в расширенном поиске, search - в списке трасс)
+    FilterParam('name', parse_text, False),
+    FilterParam('search', parse_text, False),
+    # Автор и цвет: начало любого слова ключа поиска (без учета регистра, ё и алфавита)
+    FilterParam('author', parse_key, True),
+    FilterParam('color', parse_key, True),
+    # Сложность: категории и диапазон по рангу категории (границы включительно)
+    FilterParam('difficulty', parse_difficulty, True),
+    FilterParam('difficulty_min', parse_difficulty_bound, False),
+    FilterParam('difficulty_max', parse_difficulty_bound, False),
+    FilterParam('is_active', parse_flag, False),
+    # Дорожки и диапазон дорожек (границы включительно)
+    FilterParam('track_lane', parse_lane, True),
+    FilterParam('lane_min', parse_lane, False),
+    FilterParam('lane_max', parse_lane, False),
+    # Даты создания и накрутки (от / до включительно)
+    FilterParam('created_after', parse_created, False),
+    FilterParam('created_before', parse_created, False),
+    FilterParam('setup_after', parse_setup, False),
+    FilterParam('setup_before', parse_setup, False),
+)
+
+# Все параметры фильтра трасс
+FILTER_PARAMS = tuple(spec.name for spec in ROUTE_FILTERS)
+
+
+def raw_values(params, name, multiple):
+    """Непустые строковые значения параметра
+
+    ``params`` - QueryDict (параметр может повторяться) или словарь из тела
+    запроса (значения могут быть не строками или списками). Значения
+    параметров со списком разделяются еще и по запятым.
+    """
+    if hasattr(params, 'getlist'):
+        values = params.getlist(name)
+    else:
+        value = params.get(name, None)
+        values = value if isinstance(value, (list, tuple)) else [] if value is None else [value]
+    values = [str(value) for value in values if value is not None]
+    if multiple:
+        values = [part for value in values for part in value.split(',')]
+    return [value for value in values if value.strip()]
+
+
+def canonical_text(value):
+    """Каноническое значение параметра в виде строки для ключа кеша"""
+    if isinstance(value, tuple):
+        return ','.join(canonical_text(item) for item in value)
+    if isinstance(value, bool):
+        return str(value).lower()
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def range_condition(field, low, high):
+    """Условие "поле в диапазоне" (границы включительно, None - без границы)
+
+    Пустой диапазон не доходит до базы. Даты с часовым поясом и без него
+    заранее не сравниваются - это делает база.
+    """
+    try:
+        if low is not None and high is not None and low > high:
+            return NOTHING
+    except TypeError:
+        pass
+    condition = Q()
+    if low is not None:
+        condition &= Q(**{f'{field}__gte': low})
+    if high is not None:
+        condition &= Q(**{f'{field}__lte': high})
+    return condition
+
+
+def in_range(rank, low, high):
+    if low is None and high is None:
+        return True
+    return rank is not None and (low is None or rank >= low) and (high is None or rank <= high)
+
+
+class RouteFilter:
+    """Проверенный набор фильтров трасс
+
+    ``values`` - канонические значения параметров: {параметр: значение}, списки -
+    отсортированные кортежи без повторов.
+    """
+
+    def __init__(self, values):
+        self.values = values
+
+    @classmethod
+    def compile(cls, params):
+        """Разобрать параметры запроса; RouteFilterError - при некорректном значении"""
+        values = {}
+        for spec in ROUTE_FILTERS:
+            parsed = [spec.parse(spec.name, value) for value in raw_values(params, spec.name, spec.multiple)]
+            parsed = [value for value in parsed if value is not None]
+            if parsed:
+                values[spec.name] = tuple(sorted(set(parsed))) if spec.multiple else parsed[-1]
+        return cls(values)
+
+    @property
+    def cache_key(self):
+        """Ключ набора фильтров для кеша, одинаковый для равнозначных запросов
+
+        Учитываются только параметры фильтра в порядке ROUTE_FILTERS и в
+        каноническом виде, так что порядок параметров и значений, регистр,
+        алфавит автора и посторонние параметры запроса на ключ не влияют.
+        """
+        items = [
+            f'{spec.name}={canonical_text(self.values[spec.name])}'
+            for spec in ROUTE_FILTERS
+            if spec.name in self.values
+        ]
+        return hashlib.sha1('&'.join(items).encode('utf-8')).hexdigest()
+
+    def conditions(self):
+        """Условия фильтра по измерениям: {измерение: Q}
+
+        Измерения (q, fuzzy, name, author, color, difficulty, is_active, lane,
+        created, setup) нужны фасетному поиску: счетчики по измерению считаются
+        без его собственного условия.
+        """
+        values = self.values
+        conditions = {}
+
+        if 'q' in values:
+            conditions['q'] = fulltext_condition(values['q'])
+        if 'fuzzy' in values:
+            conditions['fuzzy'] = Q(id__in=[route_id for route_id, _ in fuzzy_search(values['fuzzy'])])
+        names = [values[param] for param in ('name', 'search') if param in values]
+        if names:
+            conditions['name'] = Q(*[Q(name__icontains=name) for name in names])
+        # Начало любого слова автора или цвета - диапазоны по индексу RouteSearchToken
+        for param in ('author', 'color'):
+            if param in values:
+                tokens = RouteSearchToken.objects.filter(
+                    Q(*[key_prefix_condition('token', key) for key in values[param]], _connector=Q.OR),
+                    field=param,
+                )
+                conditions[param] = Q(id__in=tokens.values('route_id'))
+
+        # Список категорий сразу сужается диапазоном рангов: одно условие IN
+        low, high = values.get('difficulty_min'), values.get('difficulty_max')
+        if 'difficulty' in values:
+            difficulties = [
+                difficulty for difficulty in values['difficulty']
+                if in_range(Route.DIFFICULTY_RANKS.get(difficulty), low, high)
+            ]
+            conditions['difficulty'] = Q(difficulty__in=difficulties) if difficulties else NOTHING
+        elif low is not None or high is not None:
+            conditions['difficulty'] = range_condition('difficulty_rank', low, high)
+
+        if 'is_active' in values:
+            conditions['is_active'] = Q(is_active=values['is_active'])
+
+        low, high = values.get('lane_min'), values.get('lane_max')
+        if 'track_lane' in values:
+            lanes = [lane for lane in values['track_lane'] if in_range(lane, low, high)]
+            conditions['lane'] = Q(track_lane__in=lanes) if lanes else NOTHING
+        elif low is not None or high is not None:
+            conditions['lane'] = range_condition('track_lane', low, high)
+
+        for dimension, field, after, before in (
+            ('created', 'created_at', 'created_after', 'created_before'),
+            ('setup', 'setup_date', 'setup_after', 'setup_before'),
+        ):
+            if after in values or before in values:
+                conditions[dimension] = range_condition(field, values.get(after), values.get(before))
+
+        return {dimension: condition for dimension, condition in conditions.items() if condition is not None}
+
+    def apply(self, queryset=None):
+        """Отфильтровать трассы (по умолчанию - все)"""
+        if queryset is None:
+            queryset = Route.objects.all()
+        return queryset.filter(*self.conditions().values())
+
+
+def filter_routes(params, queryset=None):
+    """Отфильтровать трассы по параметрам запроса
+
+    ``params`` - QueryDict или словарь из тела запроса. Вызывает RouteFilterError
+    с сообщением для клиента, если значение параметра некорректно.
+    """
+    return RouteFilter.compile(params).apply(queryset)
+
+
+def filter_cache_key(params):
+    """Нормализованный ключ набора фильтров для кеша (см. RouteFilter.cache_key)"""
+    return RouteFilter.compile(params).cache_key
@@ -0,0 +1,207 @@
+"""
+Нечеткий поиск трасс по названию и автору (триграммный индекс в памяти).
+
+Индекс строится один раз на процесс и догоняет базу по журналу изменений
+трасс (RouteChangeLog): перед поиском перечитываются только трассы, изменившиеся
+после последнего обновления индекса. Так учитываются и сохранения через
+Route.save(), и массовые операции, и записи из других процессов.
+
+Слова сравниваются по ключу поиска (routes/normalize.py), так что регистр,
+ё/е и алфавит (Sasha/Саша) не важны. Сходство слов - как similarity() в
+pg_trgm: доля общих триграмм от объединения множеств триграмм двух слов.
+Каждое слово запроса сравнивается со словами названия и автора по отдельности,
+чтобы опечатка в одном слове длинного названия не тонула в остальных словах.
+"""
+
+import threading
+from collections import Counter
+
+from django.db import connection
+from django.db.models import Case, FloatField, Value, When
+
+from .models import Route, RouteChangeLog
+from .normalize import search_words
+
+# Минимальное сходство для попадания в результаты
+FUZZY_THRESHOLD = 0.3
+
+# Максимальное количество результатов нечеткого поиска
+FUZZY_LIMIT = 200
+
+# Поля трассы, по которым строится индекс
+FUZZY_FIELDS = ('name', 'author')
+
+
+def trigrams(words):
+    """Множество триграмм слов (как в pg_trgm: два пробела в начале слова, один в конце)"""
+    result = set()
+    for word in words:
+        padded = f'  {word} '
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+class TrigramIndex:
+    """Триграммный индекс слов названий и авторов трасс
+
+    Индексируются различные слова, а не трассы: одинаковые слова у разных трасс
+    ("вертикаль", фамилия автора) - одна запись со множеством трасс, поэтому
+    списки триграмм растут со словарем, а не с количеством трасс.
+    """
+
+    def __init__(self):
+        self.reset()
+        self.lock = threading.Lock()
+
+    def reset(self):
+        """Пустой индекс, еще не построенный по базе"""
+        self.built = False
+        self.version = 0
+        self.postings = {}
+        self.words = {}
+        self.route_words = {}
+
+    def add_route(self, route_id, values):
+        """Проиндексировать трассу; ``values`` - значения FUZZY_FIELDS"""
+        self.remove_route(route_id)
+        words = {word for value in values for word in search_words(value)}
+        for word in words:
+            entry = self.words.get(word)
+            if entry is None:
+                grams = trigrams([word])
+                entry = self.words[word] = (set(), len(grams), grams)
+                for gram in grams:
+                    self.postings.setdefault(gram, set()).add(word)
+            entry[0].add(route_id)
+        self.route_words[route_id] = words
+
+    def remove_route(self, route_id):
+        for word in self.route_words.pop(route_id, ()):
+            routes, _, grams = self.words[word]
+            routes.discard(route_id)
+            if routes:
+                continue
+            del self.words[word]
+            for gram in grams:
+                postings = self.postings[gram]
+                postings.discard(word)
+                if not postings:
+                    del self.postings[gram]
+
+    def load_routes(self, route_ids=None):
+        """Перечитать трассы из базы (все или указанные) одним запросом"""
+        queryset = Route.objects.order_by()
+        if route_ids is not None:
+            queryset = queryset.filter(pk__in=route_ids)
+        found = set()
+        for route_id, *values in queryset.values_list('id', *FUZZY_FIELDS).iterator(chunk_size=2000):
+            self.add_route(route_id, values)
+            found.add(route_id)
+        # Трассы, которых больше нет в базе, удаляются из индекса
+        for route_id in set(route_ids or ()) - found:
+            self.remove_route(route_id)
+
+    def rebuild(self):
+        """Построить индекс заново по всем трассам
+
+        Индекс помечается построенным только после загрузки всех трасс: если
+        загрузка прервется, следующий поиск начнет построение сначала.
+        """
+        self.reset()
+        version = RouteChangeLog.current_version()
+        self.load_routes()
+        self.version = version
+        self.built = True
+
+    def refresh(self):
+        """Догнать базу по журналу изменений (обычно - один пустой запрос)"""
+        if not self.built:
+            self.rebuild()
+            return
+        changes = list(
+            RouteChangeLog.objects.filter(id__gt=self.version).order_by('id').values_list('id', 'route_id')
+        )
+        if not changes:
+            return
+        # Журнал очищается с начала: если строки версии индекса уже нет (или нет
+        # самой первой строки для пустого индекса), часть изменений потеряна
+        if self.version:
+            pruned = not RouteChangeLog.objects.filter(id=self.version).exists()
+        else:
+            pruned = changes[0][0] != 1
+        if pruned:
+            self.rebuild()
+            return
+        self.load_routes({route_id for _, route_id in changes})
+        self.version = changes[-1][0]
+
+    def similar_words(self, word, threshold):
+        """Слова индекса, похожие на ``word``: {слово: сходство}"""
+        query = trigrams([word])
+        overlaps = Counter()
+        for gram in query:
+            postings = self.postings.get(gram)
+            if postings:
+                overlaps.update(postings)
+        similar = {}
+        for candidate, overlap in overlaps.items():
+            similarity = overlap / (len(query) + self.words[candidate][1] - overlap)
+            if similarity >= threshold:
+                similar[candidate] = similarity
+        return similar
+
+    def search(self, text, threshold=FUZZY_THRESHOLD, limit=FUZZY_LIMIT):
+        """Трассы, похожие на ``text``: список (id трассы, сходство) по убыванию сходства
+
+        Сходство трассы - среднее по словам запроса сходство с самым похожим
+        словом трассы (слово без похожих дает 0).
+        """
+        query_words = list(dict.fromkeys(search_words(text)))
+        if not query_words:
+            return []
+        scores = Counter()
+        for word in query_words:
+            best = {}
+            for candidate, similarity in self.similar_words(word, threshold).items():
+                for route_id in self.words[candidate][0]:
+                    if similarity > best.get(route_id, 0):
+                        best[route_id] = similarity
+            scores.update(best)
+        matches = [
+            (route_id, score / len(query_words))
+            for route_id, score in scores.items()
+            if score / len(query_words) >= threshold
+        ]
+        return sorted(matches, key=lambda item: (-item[1], item[0]))[:limit]
+
+
+# Индексы процесса по базам данных (в тестах база своя)
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def route_trigram_index():
+    """Триграммный индекс трасс текущего процесса, актуальный на текущую версию данных"""
+    name = str(connection.settings_dict['NAME'])
+    with _indexes_lock:
+        index = _indexes.setdefault(name, TrigramIndex())
+    with index.lock:
+        index.refresh()
+    return index
+
+
+def fuzzy_search(text, threshold=FUZZY_THRESHOLD, limit=FUZZY_LIMIT):
+    """Нечеткий поиск трасс: список (id трассы, сходство) по убыванию сходства"""
+    index = route_trigram_index()
+    with index.lock:
+        return index.search(text, threshold, limit)
+
+
+def fuzzy_similarity(text):
+    """Выражение сходства трассы с ``text`` для сортировки (0 - не похожа)"""
+    matches = fuzzy_search(text)
+    return Case(
+        *[When(id=route_id, then=Value(similarity)) for route_id, similarity in matches],
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
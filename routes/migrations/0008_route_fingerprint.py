@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-17 17:46
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def fill_fingerprints(apps, schema_editor):
+    """Заполнить отпечатки для существующих трасс"""
+    Route = apps.get_model('routes', 'Route')
+    routes = list(Route.objects.only('id', 'name', 'difficulty', 'color'))
+    for route in routes:
+        normalized = '\x1f'.join([
+            (route.name or '').strip().lower(),
+            route.difficulty or '',
+            (route.color or '').strip().lower(),
+        ])
+        route.fingerprint = hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+    Route.objects.bulk_update(routes, ['fingerprint'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routes', '0007_alter_route_route_number'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='route',
+            name='fingerprint',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, help_text='Нормализованный отпечаток названия, сложности и цвета', max_length=40, verbose_name='Отпечаток'),
+        ),
+        migrations.RunPython(fill_fingerprints, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 4.2.7 on 2026-10-17 17:47
+
+from datetime import datetime
+
+from django.db import migrations, models
+
+SETUP_DATE_FORMATS = ['%d.%m.%Y', '%Y-%m-%d', '%d.%m.%y']
+
+
+def parse_setup_dates(apps, schema_editor):
+    """Перенести строковые даты накрутки (DD.MM.YYYY) в поле типа date
+
+    Значения, которые не удалось распознать, остаются пустыми и выводятся в отчет.
+    """
+    Route = apps.get_model('routes', 'Route')
+    routes = list(Route.objects.only('id', 'setup_date'))
+    unparsed = []
+    for route in routes:
+        raw_value = (route.setup_date or '').strip()
+        for date_format in SETUP_DATE_FORMATS:
+            try:
+                route.setup_date_parsed = datetime.strptime(raw_value, date_format).date()
+                break
+            except ValueError:
+                continue
+        else:
+            unparsed.append((route.id, route.setup_date))
+    Route.objects.bulk_update(routes, ['setup_date_parsed'], batch_size=500)
+
+    if unparsed:
+        print(f"\n  ⚠️ Не удалось распознать дату накрутки у {len(unparsed)} трасс (поле оставлено пустым):")
+        for route_id, raw_value in unparsed:
+            print(f"    ID {route_id}: {raw_value!r}")
+
+
+def format_setup_dates(apps, schema_editor):
+    """Обратное преобразование: дата -> строка DD.MM.YYYY"""
+    Route = apps.get_model('routes', 'Route')
+    routes = list(Route.objects.only('id', 'setup_date_parsed'))
+    for route in routes:
+        route.setup_date = route.setup_date_parsed.strftime('%d.%m.%Y') if route.setup_date_parsed else ''
+    Route.objects.bulk_update(routes, ['setup_date'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routes', '0008_route_fingerprint'),
+    ]
+
+    operations = [
+        # Значение по умолчанию нужно только для обратимости удаления старого поля
+        migrations.AlterField(
+            model_name='route',
+            name='setup_date',
+            field=models.CharField(default='', help_text='Дата когда трасса была накручена (DD.MM.YYYY)', max_length=10, verbose_name='Дата накрутки'),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='setup_date_parsed',
+            field=models.DateField(null=True, blank=True),
+        ),
+        migrations.RunPython(parse_setup_dates, format_setup_dates),
+        migrations.RemoveField(
+            model_name='route',
+            name='setup_date',
+        ),
+        migrations.RenameField(
+            model_name='route',
+            old_name='setup_date_parsed',
+            new_name='setup_date',
+        ),
+        migrations.AlterField(
+            model_name='route',
+            name='setup_date',
+            field=models.DateField(blank=True, db_index=True, help_text='Дата когда трасса была накручена (в API - DD.MM.YYYY)', null=True, verbose_name='Дата накрутки'),
+        ),
+    ]
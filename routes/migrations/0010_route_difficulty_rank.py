@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-17 17:48
+
+from django.db import migrations, models
+
+
+def fill_difficulty_ranks(apps, schema_editor):
+    """Заполнить ранг сложности для существующих трасс"""
+    Route = apps.get_model('routes', 'Route')
+    choices = [value for value, label in Route._meta.get_field('difficulty').choices]
+    for rank, value in enumerate(choices, start=1):
+        if value != '-':
+            Route.objects.filter(difficulty=value).update(difficulty_rank=rank)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routes', '0009_route_setup_date_datefield'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='route',
+            name='difficulty_rank',
+            field=models.PositiveSmallIntegerField(blank=True, db_index=True, editable=False, help_text='Порядковый номер категории сложности', null=True, verbose_name='Ранг сложности'),
+        ),
+        migrations.RunPython(fill_difficulty_ranks, migrations.RunPython.noop),
+    ]
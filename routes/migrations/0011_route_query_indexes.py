@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-17 17:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routes', '0010_route_difficulty_rank'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='route',
+            index=models.Index(fields=['track_lane', 'route_number'], name='route_lane_number_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='route',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['track_lane', 'route_number'], name='route_active_lane_number_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='route',
+            index=models.Index(fields=['author', 'is_active'], name='route_author_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='route',
+            index=models.Index(fields=['color', 'is_active'], name='route_color_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='route',
+            index=models.Index(fields=['difficulty', 'is_active'], name='route_difficulty_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='route',
+            index=models.Index(fields=['created_at'], name='route_created_at_idx'),
+        ),
+    ]
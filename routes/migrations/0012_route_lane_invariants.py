@@ -0,0 +1,47 @@
+# Generated by Django 4.2.7 on 2026-10-17 17:50
+
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.functions.text
+
+
+def check_lane_invariants(apps, schema_editor):
+    """Перед созданием ограничений убедиться, что текущие данные им соответствуют"""
+    Route = apps.get_model('routes', 'Route')
+    problems = []
+    overfull = (
+        Route.objects.values('track_lane')
+        .annotate(total=Count('id'))
+        .filter(total__gt=4)
+        .order_by('track_lane')
+    )
+    for row in overfull:
+        problems.append(f"дорожка {row['track_lane']}: {row['total']} трасс (максимум 4)")
+    same_color = (
+        Route.objects.annotate(color_lower=django.db.models.functions.text.Lower('color'))
+        .values('track_lane', 'color_lower')
+        .annotate(total=Count('id'))
+        .filter(total__gt=1)
+        .order_by('track_lane')
+    )
+    for row in same_color:
+        problems.append(f"дорожка {row['track_lane']}: {row['total']} трасс цвета '{row['color_lower']}'")
+    if problems:
+        raise RuntimeError(
+            'Данные нарушают правила дорожек, исправьте их перед миграцией:\n  ' + '\n  '.join(problems)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routes', '0011_route_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_lane_invariants, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='route',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('color'), models.F('track_lane'), name='route_lane_color_unique', violation_error_message='На дорожке уже есть трасса такого цвета'),
+        ),
+    ]
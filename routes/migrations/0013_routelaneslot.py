@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-17 17:51
+
+from django.db import migrations, models
+
+
+def create_lane_slots(apps, schema_editor):
+    """Создать строки-блокировки для всех 35 дорожек"""
+    RouteLaneSlot = apps.get_model('routes', 'RouteLaneSlot')
+    RouteLaneSlot.objects.bulk_create(
+        [RouteLaneSlot(track_lane=lane) for lane in range(1, 36)],
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routes', '0012_route_lane_invariants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteLaneSlot',
+            fields=[
+                ('track_lane', models.PositiveIntegerField(primary_key=True, serialize=False, verbose_name='№ дорожки')),
+                ('allocations', models.PositiveBigIntegerField(default=0, help_text='Сколько раз на дорожке назначался номер трассы', verbose_name='Выдано номеров')),
+            ],
+            options={
+                'verbose_name': 'Блокировка дорожки',
+                'verbose_name_plural': 'Блокировки дорожек',
+                'ordering': ['track_lane'],
+            },
+        ),
+        migrations.RunPython(create_lane_slots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-17 18:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routes', '0013_routelaneslot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteChangeLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('route_id', models.BigIntegerField(verbose_name='ID трассы')),
+                ('action', models.CharField(choices=[('I', 'Добавление'), ('U', 'Изменение'), ('D', 'Удаление')], max_length=1, verbose_name='Действие')),
+            ],
+            options={
+                'verbose_name': 'Изменение трассы',
+                'verbose_name_plural': 'Журнал изменений трасс',
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7 on 2026-10-17 18:09
+
+from django.db import migrations
+
+
+def create_fulltext_index(apps, schema_editor):
+    """Полнотекстовый индекс трасс: FTS5 в SQLite, GIN в PostgreSQL
+
+    Триггеры синхронизации FTS5 устанавливаются после миграций (routes/triggers.py).
+    """
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            if not cursor.fetchone()[0]:
+                print('\n   SQLite собран без FTS5, поиск q= будет работать через LIKE')
+                return
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS routes_route_fts USING fts5("
+            "name, author, color, description, "
+            "content='routes_route', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute("INSERT INTO routes_route_fts(routes_route_fts) VALUES ('rebuild')")
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS route_fulltext_idx ON routes_route USING GIN ("
+            "to_tsvector('simple', coalesce(routes_route.name, '') || ' ' || coalesce(routes_route.author, '') || ' ' || "
+            "coalesce(routes_route.color, '') || ' ' || coalesce(routes_route.description, '')))"
+        )
+
+
+def drop_fulltext_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS routes_route_fts')
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS route_fulltext_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routes', '0014_routechangelog'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-17 18:14
+
+from django.db import migrations, models
+
+from routes.normalize import search_key
+
+
+def fill_search_keys(apps, schema_editor):
+    """Заполнить ключи поиска автора и цвета для существующих трасс"""
+    Route = apps.get_model('routes', 'Route')
+    routes = list(Route.objects.only('id', 'author', 'color'))
+    for route in routes:
+        route.author_key = search_key(route.author)
+        route.color_key = search_key(route.color)
+    Route.objects.bulk_update(routes, ['author_key', 'color_key'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routes', '0015_route_fulltext_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='route',
+            name='author_key',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, help_text='Автор в нижнем регистре, латиницей, без лишних пробелов', max_length=300, verbose_name='Ключ поиска автора'),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='color_key',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, help_text='Цвет в нижнем регистре, латиницей, без лишних пробелов', max_length=150, verbose_name='Ключ поиска цвета'),
+        ),
+        migrations.RunPython(fill_search_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.7 on 2026-10-17 18:28
+
+from django.db import migrations, models
+from django.db.models import Count
+
+from routes.normalize import search_key
+
+
+def check_lane_colors(apps, schema_editor):
+    """Пересчитать ключи цвета и убедиться, что цвета на дорожках не повторяются
+
+    Прежнее ограничение сравнивало цвета через lower() базы, который в SQLite
+    не переводит кириллицу в нижний регистр, поэтому в данных могли остаться
+    трассы "Красный" и "красный" на одной дорожке.
+    """
+    Route = apps.get_model('routes', 'Route')
+    routes = list(Route.objects.only('id', 'color', 'color_key'))
+    stale = [route for route in routes if route.color_key != search_key(route.color)]
+    for route in stale:
+        route.color_key = search_key(route.color)
+    Route.objects.bulk_update(stale, ['color_key'], batch_size=500)
+
+    same_color = (
+        Route.objects.values('track_lane', 'color_key')
+        .annotate(total=Count('id'))
+        .filter(total__gt=1)
+        .order_by('track_lane')
+    )
+    problems = [
+        f"дорожка {row['track_lane']}: {row['total']} трасс цвета '{row['color_key']}'"
+        for row in same_color
+    ]
+    if problems:
+        raise RuntimeError(
+            'Данные нарушают правила дорожек, исправьте их перед миграцией:\n  ' + '\n  '.join(problems)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routes', '0016_route_search_keys'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_lane_colors, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name='route',
+            name='route_lane_color_unique',
+        ),
+        migrations.AddConstraint(
+            model_name='route',
+            constraint=models.UniqueConstraint(fields=('track_lane', 'color_key'), name='route_lane_color_unique', violation_error_message='На дорожке уже есть трасса такого цвета'),
+        ),
+    ]
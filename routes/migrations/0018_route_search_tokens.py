@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-17 18:38
+
+from django.db import migrations, models
+
+from routes.normalize import key_word_starts
+
+
+def fill_search_tokens(apps, schema_editor):
+    """Заполнить начала слов ключей автора и цвета для уже существующих трасс"""
+    Route = apps.get_model('routes', 'Route')
+    RouteSearchToken = apps.get_model('routes', 'RouteSearchToken')
+    tokens = [
+        RouteSearchToken(route_id=route_id, field=field, token=token)
+        for route_id, author_key, color_key in Route.objects.values_list('id', 'author_key', 'color_key').iterator()
+        for field, key in (('author', author_key), ('color', color_key))
+        for token in key_word_starts(key)
+    ]
+    RouteSearchToken.objects.bulk_create(tokens, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routes', '0017_route_lane_color_key_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('route_id', models.BigIntegerField(db_index=True, verbose_name='ID трассы')),
+                ('field', models.CharField(choices=[('author', 'Автор'), ('color', 'Цвет')], max_length=10, verbose_name='Поле')),
+                ('token', models.CharField(max_length=300, verbose_name='Начало слова ключа')),
+            ],
+            options={
+                'verbose_name': 'Слово ключа поиска',
+                'verbose_name_plural': 'Слова ключей поиска',
+                'indexes': [models.Index(fields=['field', 'token'], name='route_token_field_token_idx')],
+            },
+        ),
+        migrations.RunPython(fill_search_tokens, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,131 @@
-from django.db import models
+import hashlib
+from datetime import date
+
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Max, Q
 from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.contrib.auth.hashers import make_password, check_password
 
+from .normalize import key_word_starts, search_key
+
+
+# Максимальное количество трасс на одной дорожке
+LANE_CAPACITY = 4
+
+# Имена ограничений дорожки в базе данных (см. Route.Meta и routes/triggers.py)
+LANE_COLOR_CONSTRAINT = 'route_lane_color_unique'
+# SQLite называет в ошибке не ограничение по полям, а его колонки
+LANE_COLOR_COLUMNS = 'routes_route.track_lane, routes_route.color_key'
+LANE_CAPACITY_ERROR = 'route_lane_capacity_exceeded'
+
+# Сколько последних строк журнала изменений трасс хранится в базе
+CHANGE_LOG_RETENTION = 10000
+
+
+def lane_capacity_message(track_lane):
+    return f'На дорожке {track_lane} уже максимальное количество трасс ({LANE_CAPACITY})'
+
+
+def lane_color_message(track_lane, color):
+    return f"На дорожке {track_lane} уже есть трасса с цветом '{color}'"
+
+
+def validate_setup_date(setup_date):
+    """Дата накрутки не может быть в будущем (ValidationError)"""
+    if setup_date and setup_date > date.today():
+        raise ValidationError("Дата накрутки не может быть в будущем")
+
+
+def lane_integrity_error(exc, track_lane, color):
+    """Перевести нарушение ограничений дорожки в базе в ошибку валидации
+
+    Возвращает ValidationError в том же виде, что и full_clean() для проверок
+    Route.clean(), или None, если IntegrityError не относится к правилам дорожки.
+    """
+    message = str(exc)
+    if LANE_CAPACITY_ERROR in message:
+        return ValidationError({NON_FIELD_ERRORS: [lane_capacity_message(track_lane)]})
+    if LANE_COLOR_CONSTRAINT in message or LANE_COLOR_COLUMNS in message:
+        return ValidationError({NON_FIELD_ERRORS: [lane_color_message(track_lane, color)]})
+    return None
+
+
+def route_fingerprint(name, difficulty, color):
+    """Нормализованный отпечаток трассы для поиска дубликатов
+
+    Название и цвет сравниваются без учета регистра и лишних пробелов,
+    сложность - как есть.
+    """
+    normalized = '\x1f'.join([
+        (name or '').strip().lower(),
+        difficulty or '',
+        (color or '').strip().lower(),
+    ])
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+
+# Ключи поиска, производные от полей трассы (см. Route.refresh_derived_fields)
+SEARCH_KEY_FIELDS = {'author': 'author_key', 'color': 'color_key'}
+
+
+class RouteQuerySet(models.QuerySet):
+    """Выборка трасс, которая поддерживает ключи поиска при записи в обход save()
+
+    На ключе цвета держится уникальность цвета на дорожке, поэтому UPDATE
+    автора или цвета пересчитывает и ключ, а вместе с ним - начала слов в
+    RouteSearchToken (их удаление вместе с трассой - триггер базы).
+    """
+
+    def update(self, **kwargs):
+        for field, key_field in SEARCH_KEY_FIELDS.items():
+            if field in kwargs and key_field not in kwargs:
+                if not isinstance(kwargs[field], str):
+                    raise ValueError(f'Поле {field} можно обновить только строкой: ключ {key_field} вычисляется в Python')
+                kwargs[key_field] = search_key(kwargs[field])
+        # Выражения (Case из bulk_update) пропускаются: начала слов для них пишет bulk_update
+        fields = [field for field, key_field in SEARCH_KEY_FIELDS.items() if isinstance(kwargs.get(key_field), str)]
+        if not fields:
+            return super().update(**kwargs)
+        with transaction.atomic(using=self.db, savepoint=False):
+            route_ids = list(self.order_by().values_list('pk', flat=True))
+            updated = super().update(**kwargs)
+            RouteSearchToken.replace(
+                (route_id, field, kwargs[SEARCH_KEY_FIELDS[field]]) for route_id in route_ids for field in fields
+            )
+        return updated
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        fields = list(fields)
+        changed = [field for field in SEARCH_KEY_FIELDS if field in fields]
+        if not changed:
+            return super().bulk_update(objs, fields, batch_size=batch_size)
+        objs = list(objs)
+        for field in changed:
+            key_field = SEARCH_KEY_FIELDS[field]
+            for obj in objs:
+                setattr(obj, key_field, search_key(getattr(obj, field)))
+            if key_field not in fields:
+                fields.append(key_field)
+        with transaction.atomic(using=self.db, savepoint=False):
+            updated = super().bulk_update(objs, fields, batch_size=batch_size)
+            RouteSearchToken.replace(
+                (obj.pk, field, getattr(obj, SEARCH_KEY_FIELDS[field])) for obj in objs for field in changed
+            )
+        return updated
+
+    def bulk_create(self, objs, *args, **kwargs):
+        with transaction.atomic(using=self.db, savepoint=False):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            RouteSearchToken.replace(
+                ((obj.pk, field, search_key(getattr(obj, field)))
+                 for obj in objs if obj.pk is not None
+                 for field in SEARCH_KEY_FIELDS),
+                created=True,
+            )
+        return objs
+
 
 class Route(models.Model):
     """Модель трассы на скалодроме"""
@@ -32,6 +155,13 @@ class Route(models.Model):
         GRADE_8C = '8c', '8c'
         GRADE_9A = '9a', '9a'
         GRADE_UNKNOWN = '-', '-'
+
+    # Порядковый номер категории сложности (по возрастанию); у неизвестной категории '-' ранга нет
+    DIFFICULTY_RANKS = {
+        value: rank
+        for rank, value in enumerate(DifficultyLevel.values, start=1)
+        if value != '-'
+    }
     
     # Номер трассы (автоматический, последовательный)
     route_number = models.PositiveIntegerField(
@@ -61,6 +191,16 @@ class Route(models.Model):
         help_text='Уровень сложности трассы'
     )
     
+    # Ранг сложности для сортировки и диапазонных фильтров (заполняется автоматически)
+    difficulty_rank = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        db_index=True,
+        verbose_name='Ранг сложности',
+        help_text='Порядковый номер категории сложности'
+    )
+    
     # Цвет трассы
     color = models.CharField(
         max_length=50,
@@ -76,10 +216,12 @@ class Route(models.Model):
     )
     
     # Дата накрутки
-    setup_date = models.CharField(
-        max_length=10,
+    setup_date = models.DateField(
+        null=True,
+        blank=True,
+        db_index=True,
         verbose_name='Дата накрутки',
-        help_text='Дата когда трасса была накручена (DD.MM.YYYY)'
+        help_text='Дата когда трасса была накручена (в API - DD.MM.YYYY)'
     )
     
     # Описание
@@ -97,6 +239,39 @@ class Route(models.Model):
         help_text='Активна ли трасса (не скручена)'
     )
     
+    # Отпечаток для поиска дубликатов (заполняется автоматически)
+    fingerprint = models.CharField(
+        max_length=40,
+        blank=True,
+        default='',
+        editable=False,
+        db_index=True,
+        verbose_name='Отпечаток',
+        help_text='Нормализованный отпечаток названия, сложности и цвета'
+    )
+
+    # Ключи поиска по автору и цвету (заполняются автоматически, см. routes/normalize.py)
+    author_key = models.CharField(
+        max_length=300,
+        blank=True,
+        default='',
+        editable=False,
+        db_index=True,
+        verbose_name='Ключ поиска автора',
+        help_text='Автор в нижнем регистре, латиницей, без лишних пробелов'
+    )
+    color_key = models.CharField(
+        max_length=150,
+        blank=True,
+        default='',
+        editable=False,
+        db_index=True,
+        verbose_name='Ключ поиска цвета',
+        help_text='Цвет в нижнем регистре, латиницей, без лишних пробелов'
+    )
+
+    objects = RouteQuerySet.as_manager()
+
     # Дата создания записи
     created_at = models.DateTimeField(
         default=timezone.now,
@@ -108,103 +283,343 @@ class Route(models.Model):
         verbose_name = 'Трасса'
         verbose_name_plural = 'Трассы'
         ordering = ['track_lane', 'route_number']
-        constraints = []
+        constraints = [
+            # Не больше одной трассы каждого цвета на дорожке. Цвета сравниваются
+            # по ключу, вычисленному в Python: lower() в SQLite не переводит в
+            # нижний регистр кириллицу. Вместимость дорожки (не больше
+            # LANE_CAPACITY трасс) проверяет триггер из routes/triggers.py
+            models.UniqueConstraint(
+                fields=['track_lane', 'color_key'],
+                name=LANE_COLOR_CONSTRAINT,
+                violation_error_message='На дорожке уже есть трасса такого цвета',
+            ),
+        ]
+        # Индексы подобраны под запросы представлений API и страниц
+        indexes = [
+            # Порядок по умолчанию, подсчет и выборка трасс на дорожке
+            models.Index(fields=['track_lane', 'route_number'], name='route_lane_number_idx'),
+            # Главная страница: только активные трассы в порядке дорожек
+            models.Index(
+                fields=['track_lane', 'route_number'],
+                condition=Q(is_active=True),
+                name='route_active_lane_number_idx',
+            ),
+            # Списки авторов и цветов со счетчиками активных трасс
+            models.Index(fields=['author', 'is_active'], name='route_author_active_idx'),
+            models.Index(fields=['color', 'is_active'], name='route_color_active_idx'),
+            # Фильтр и статистика по категории сложности
+            models.Index(fields=['difficulty', 'is_active'], name='route_difficulty_active_idx'),
+            # Расширенный поиск: сортировка и диапазон по дате создания
+            models.Index(fields=['created_at'], name='route_created_at_idx'),
+        ]
 
     def __str__(self):
         return f"№{self.route_number} - {self.name} ({self.get_difficulty_display()}) - {self.author}"
     
+    # Ключи поиска на момент загрузки из базы: начала слов перезаписываются, только если ключ изменился
+    _loaded_keys = {}
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        route = super().from_db(db, field_names, values)
+        route._loaded_keys = {
+            field: getattr(route, key_field)
+            for field, key_field in SEARCH_KEY_FIELDS.items()
+            if key_field in field_names
+        }
+        return route
+
     def save(self, *args, **kwargs):
         """Переопределяем save для автоматического назначения номера трассы"""
-        if not self.route_number and self.track_lane:
-            # Вычисляем номер трассы на основе дорожки и позиции на дорожке
-            # Формула: (track_lane - 1) * 4 + position_on_lane + 1
-            existing_routes_on_lane = Route.objects.filter(track_lane=self.track_lane).exclude(pk=self.pk)
-            position_on_lane = existing_routes_on_lane.count()  # 0, 1, 2, 3
-            self.route_number = (self.track_lane - 1) * 4 + position_on_lane + 1
-        # Запускаем полную валидацию модели перед сохранением, чтобы ограничения сработали везде
-        self.full_clean()
-        super().save(*args, **kwargs)
-    
+        try:
+            with transaction.atomic():
+                if not self.route_number and self.track_lane:
+                    # Номер назначается под блокировкой дорожки: параллельные вставки
+                    # на ту же дорожку ждут окончания этой транзакции
+                    RouteLaneSlot.lock_lanes([self.track_lane])
+                    self.route_number = self.free_route_number()
+                self.refresh_derived_fields()
+                # Запускаем полную валидацию модели перед сохранением, чтобы ограничения сработали везде.
+                # Ограничения дорожки проверяет сама база, отдельные запросы для них не нужны
+                self.full_clean(validate_constraints=False)
+                keys = {field: getattr(self, key_field) for field, key_field in SEARCH_KEY_FIELDS.items()}
+                changed = [field for field in keys if self._loaded_keys.get(field) != keys[field]]
+                created = self._state.adding
+                super().save(*args, **kwargs)
+                if changed:
+                    RouteSearchToken.replace(((self.pk, field, keys[field]) for field in changed), created=created)
+                self._loaded_keys = keys
+        except IntegrityError as exc:
+            # Гонка с параллельной записью: база отклонила трассу по правилам дорожки
+            error = lane_integrity_error(exc, self.track_lane, self.color)
+            if error is None:
+                raise
+            raise error from exc
+
+    def free_route_number(self, taken_numbers=None):
+        """Первый свободный номер на дорожке трассы
+
+        Номер вычисляется по формуле (track_lane - 1) * LANE_CAPACITY + позиция на дорожке,
+        позиция - первая незанятая, начиная с 1. ``taken_numbers`` - уже занятые
+        номера на дорожке; если не переданы, выбираются из базы.
+        """
+        if taken_numbers is None:
+            taken_numbers = Route.objects.filter(track_lane=self.track_lane).exclude(pk=self.pk).values_list(
+                'route_number', flat=True
+            )
+        first_number = (self.track_lane - 1) * LANE_CAPACITY + 1
+        taken_numbers = set(taken_numbers)
+        route_number = first_number
+        while route_number in taken_numbers:
+            route_number += 1
+        return route_number
+
+    def refresh_derived_fields(self):
+        """Пересчитать поля, производные от данных трассы"""
+        self.fingerprint = route_fingerprint(self.name, self.difficulty, self.color)
+        self.difficulty_rank = self.DIFFICULTY_RANKS.get(self.difficulty)
+        self.author_key = search_key(self.author)
+        self.color_key = search_key(self.color)
+
+    def neighbouring_lanes(self):
+        """Дорожка трассы и смежные с ней (±1)"""
+        lanes = [self.track_lane]
+        if self.track_lane > 1:
+            lanes.append(self.track_lane - 1)
+        if self.track_lane < 35:
+            lanes.append(self.track_lane + 1)
+        return lanes
+
+    def lane_neighbours(self):
+        """Трассы, нужные для проверки правил дорожки, одним индексным запросом
+
+        Возвращает все трассы той же дорожки и трассы смежных дорожек
+        с тем же отпечатком.
+        """
+        if not self.track_lane:
+            return []
+        return list(
+            Route.objects
+            .filter(
+                Q(track_lane=self.track_lane)
+                | Q(track_lane__in=self.neighbouring_lanes(), fingerprint=self.fingerprint)
+            )
+            .exclude(pk=self.pk)
+            .values('track_lane', 'route_number', 'name', 'difficulty', 'color', 'color_key', 'fingerprint')
+        )
+
     def clean(self):
         """Валидация модели"""
-        from django.core.exceptions import ValidationError
-        from datetime import datetime, date
-        
+        self.refresh_derived_fields()
+        self.validate_rules(self.lane_neighbours())
+
+    def validate_rules(self, neighbours):
+        """Проверить правила дорожки по заранее выбранным соседним трассам
+
+        ``neighbours`` - словари с полями track_lane, name, difficulty, color,
+        color_key и fingerprint, как их возвращает lane_neighbours().
+        """
+        same_lane = [r for r in neighbours if r['track_lane'] == self.track_lane]
+
         # Проверяем, что на одной дорожке не больше 4 трасс
         if self.track_lane:
-            existing_routes = Route.objects.filter(track_lane=self.track_lane).exclude(pk=self.pk)
-            if existing_routes.count() >= 4:
-                raise ValidationError(f'На дорожке {self.track_lane} уже максимальное количество трасс (4)')
+            if len(same_lane) >= LANE_CAPACITY:
+                raise ValidationError(lane_capacity_message(self.track_lane))
 
-            # Запрет двух трасс одного цвета на одной дорожке (без учета регистра)
+            # Запрет двух трасс одного цвета на одной дорожке (по ключу цвета,
+            # как в ограничении базы)
             if self.color:
-                same_color_qs = Route.objects.filter(
-                    track_lane=self.track_lane,
-                    color__iexact=self.color
-                ).exclude(pk=self.pk)
-                if same_color_qs.exists():
-                    raise ValidationError(
-                        f"На дорожке {self.track_lane} уже есть трасса с цветом '{self.color}'"
-                    )
+                if any(r['color_key'] == self.color_key for r in same_lane):
+                    raise ValidationError(lane_color_message(self.track_lane, self.color))
 
-        # Дата накрутки не может быть в будущем (ожидается формат DD.MM.YYYY)
-        if self.setup_date:
-            try:
-                parsed = datetime.strptime(self.setup_date.strip(), "%d.%m.%Y").date()
-                if parsed > date.today():
-                    raise ValidationError("Дата накрутки не может быть в будущем")
-            except ValueError:
-                # Формат даты проверяется на уровне сериализатора; здесь дублируем защиту
-                raise ValidationError("Дата накрутки должна быть в формате DD.MM.YYYY")
+        validate_setup_date(self.setup_date)
         
         # Проверяем дубликаты на той же и смежных дорожках (±1)
         # Критерии дубликата: совпадают название (без учета регистра и лишних пробелов),
-        # сложность и цвет (без учета регистра и пробелов)
+        # сложность и цвет (без учета регистра и пробелов) - то есть отпечаток
         if self.track_lane and self.name and self.difficulty and self.color:
-            normalized_name = (self.name or '').strip().lower()
-            normalized_color = (self.color or '').strip().lower()
-            lanes_to_check = [self.track_lane]
-            if self.track_lane > 1:
-                lanes_to_check.append(self.track_lane - 1)
-            if self.track_lane < 35:
-                lanes_to_check.append(self.track_lane + 1)
-            duplicates_qs = (
-                Route.objects
-                .filter(track_lane__in=lanes_to_check)
-                .exclude(pk=self.pk)
-            )
-            for r in duplicates_qs:
-                if (r.name or '').strip().lower() == normalized_name \
-                   and (r.difficulty or '') == self.difficulty \
-                   and (r.color or '').strip().lower() == normalized_color:
-                    adjacent_note = 'смежной ' if r.track_lane != self.track_lane else ''
+            for r in neighbours:
+                if r['fingerprint'] == self.fingerprint:
+                    adjacent_note = 'смежной ' if r['track_lane'] != self.track_lane else ''
                     raise ValidationError(
-                        f"Похожая трасса уже существует на {adjacent_note}дорожке {r.track_lane}: {r.name} ({r.difficulty}, {r.color})"
+                        f"Похожая трасса уже существует на {adjacent_note}дорожке {r['track_lane']}: {r['name']} ({r['difficulty']}, {r['color']})"
                     )
-        
-    
+
     @classmethod
-    def renumber_routes(cls):
-        """Перенумеровать все трассы по дорожкам"""
-        from django.db import transaction
-        
+    def renumber_routes(cls, lanes=None):
+        """Перенумеровать трассы по дорожкам
+
+        Если передан ``lanes``, пересчитываются только указанные дорожки.
+        Новые номера вычисляются одним оконным запросом, а в базу записываются
+        только трассы, номер которых действительно изменился.
+        Возвращает количество перенумерованных трасс.
+        """
+        from django.db.models import Window
+        from django.db.models.functions import RowNumber
+
+        queryset = cls.objects.all()
+        if lanes is not None:
+            lanes = {lane for lane in lanes if lane}
+            if not lanes:
+                return 0
+            queryset = queryset.filter(track_lane__in=lanes)
+
         with transaction.atomic():
-            # Получаем все трассы и создаем список для перенумерации
-            all_routes = list(cls.objects.all().order_by('track_lane', 'id'))
-            
-            # Группируем трассы по дорожкам
-            routes_by_lane = {}
-            for route in all_routes:
-                if route.track_lane not in routes_by_lane:
-                    routes_by_lane[route.track_lane] = []
-                routes_by_lane[route.track_lane].append(route)
-            
-            # Перенумеровываем трассы
-            for lane, routes_on_lane in routes_by_lane.items():
-                for position, route in enumerate(routes_on_lane):
-                    new_route_number = (lane - 1) * 4 + position + 1
-                    # Обновляем напрямую в базе данных, минуя save()
-                    cls.objects.filter(pk=route.pk).update(route_number=new_route_number)
+            # Позиция трассы на дорожке определяется порядком создания (id)
+            stale_numbers = (
+                queryset
+                .annotate(position=Window(
+                    expression=RowNumber(),
+                    partition_by=[F('track_lane')],
+                    order_by=F('id').asc(),
+                ))
+                .annotate(expected_number=(F('track_lane') - 1) * LANE_CAPACITY + F('position'))
+                .exclude(route_number=F('expected_number'))
+                .order_by()
+                .values_list('pk', 'expected_number')
+            )
+            stale_routes = [
+                cls(pk=pk, route_number=route_number)
+                for pk, route_number in stale_numbers
+            ]
+            # Обновляем напрямую в базе данных, минуя save()
+            cls.objects.bulk_update(stale_routes, ['route_number'], batch_size=500)
+
+        return len(stale_routes)
+
+
+class RouteLaneSlot(models.Model):
+    """Строка-блокировка дорожки для атомарного назначения номеров трасс"""
+
+    track_lane = models.PositiveIntegerField(
+        primary_key=True,
+        verbose_name='№ дорожки'
+    )
+
+    allocations = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name='Выдано номеров',
+        help_text='Сколько раз на дорожке назначался номер трассы'
+    )
+
+    class Meta:
+        verbose_name = 'Блокировка дорожки'
+        verbose_name_plural = 'Блокировки дорожек'
+        ordering = ['track_lane']
+
+    def __str__(self):
+        return f"Дорожка {self.track_lane}"
+
+    @classmethod
+    def lock_lanes(cls, lanes):
+        """Заблокировать дорожки до конца текущей транзакции
+
+        UPDATE строк дорожек берет блокировку на запись: в SQLite - на всю базу,
+        в PostgreSQL - на строки указанных дорожек. Вызывать внутри transaction.atomic().
+        """
+        lanes = sorted({lane for lane in lanes if lane})
+        if not lanes:
+            return
+        locked = cls.objects.filter(track_lane__in=lanes).update(allocations=F('allocations') + 1)
+        if locked < len(lanes):
+            cls.objects.bulk_create([cls(track_lane=lane) for lane in lanes], ignore_conflicts=True)
+            cls.objects.filter(track_lane__in=lanes).update(allocations=F('allocations') + 1)
+
+
+class RouteSearchToken(models.Model):
+    """Начало слова в ключе поиска автора или цвета трассы
+
+    Для ключа "sasha torubarin" хранятся "sasha torubarin" и "torubarin", так
+    что фильтр "начало любого слова" - диапазон по индексу (field, token).
+    Строки пишет Python вместе с ключами (Route.save() и RouteQuerySet), при
+    удалении трассы их удаляет триггер базы (routes/triggers.py).
+    """
+
+    class Field(models.TextChoices):
+        AUTHOR = 'author', 'Автор'
+        COLOR = 'color', 'Цвет'
+
+    route_id = models.BigIntegerField(
+        db_index=True,
+        verbose_name='ID трассы'
+    )
+
+    field = models.CharField(
+        max_length=10,
+        choices=Field.choices,
+        verbose_name='Поле'
+    )
+
+    token = models.CharField(
+        max_length=300,
+        verbose_name='Начало слова ключа'
+    )
+
+    class Meta:
+        verbose_name = 'Слово ключа поиска'
+        verbose_name_plural = 'Слова ключей поиска'
+        indexes = [
+            models.Index(fields=['field', 'token'], name='route_token_field_token_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_field_display()} трассы {self.route_id}: {self.token}"
+
+    @classmethod
+    def replace(cls, keys, created=False):
+        """Заменить начала слов трасс; ``keys`` - тройки (id трассы, поле, ключ поиска)
+
+        ``created`` - трассы только что добавлены, удалять у них нечего.
+        """
+        route_ids = {}
+        tokens = []
+        for route_id, field, key in keys:
+            route_ids.setdefault(field, set()).add(route_id)
+            tokens.extend(cls(route_id=route_id, field=field, token=token) for token in key_word_starts(key))
+        if route_ids and not created:
+            cls.objects.filter(
+                Q(*[Q(field=field, route_id__in=ids) for field, ids in route_ids.items()], _connector=Q.OR)
+            ).delete()
+        if tokens:
+            cls.objects.bulk_create(tokens)
+
+
+class RouteChangeLog(models.Model):
+    """Журнал изменений таблицы трасс
+
+    Строки пишут триггеры базы (routes/triggers.py) на каждую вставку, изменение
+    и удаление трассы - в том числе через QuerySet.update()/delete() и массовые
+    операции. Номер последней строки служит версией данных для кешей, старые
+    строки удаляются теми же триггерами (хранятся последние CHANGE_LOG_RETENTION).
+    """
+
+    class Action(models.TextChoices):
+        INSERT = 'I', 'Добавление'
+        UPDATE = 'U', 'Изменение'
+        DELETE = 'D', 'Удаление'
+
+    route_id = models.BigIntegerField(
+        verbose_name='ID трассы'
+    )
+
+    action = models.CharField(
+        max_length=1,
+        choices=Action.choices,
+        verbose_name='Действие'
+    )
+
+    class Meta:
+        verbose_name = 'Изменение трассы'
+        verbose_name_plural = 'Журнал изменений трасс'
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.get_action_display()} трассы {self.route_id}"
+
+    @classmethod
+    def current_version(cls):
+        """Версия данных трасс: номер последнего изменения (0, если изменений не было)"""
+        return cls.objects.aggregate(version=Max('id'))['version'] or 0
 
 
 class AdminUser(models.Model):
@@ -0,0 +1,76 @@
+"""
+Нормализация текста для поиска трасс.
+
+Авторы и цвета приходят из разных источников в разном написании: "Красный",
+"красный ", "Sasha" и "Саша". Ключ поиска сводит такие варианты к одному виду:
+регистр и ё/е не различаются, пробелы схлопываются, кириллица
+транслитерируется в латиницу, а неоднозначные латинские сочетания (kh/h, x/ks,
+j/y, w/v...) приводятся к одному написанию. Ключи хранятся в индексированных
+полях трассы (author_key, color_key), а начала их слов - в таблице
+RouteSearchToken, по которой фильтры ищут начало любого слова через индекс.
+"""
+
+import re
+
+from django.db.models import Q
+
+# Транслитерация кириллицы в латиницу (упрощенная, по произношению)
+CYRILLIC_TO_LATIN = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ж': 'zh', 'з': 'z',
+    'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p',
+    'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'h', 'ц': 'ts', 'ч': 'ch',
+    'ш': 'sh', 'щ': 'sch', 'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+    'і': 'i', 'ї': 'yi', 'є': 'ye',
+}
+
+# Варианты латинского написания, приводимые к одному (по порядку)
+LATIN_VARIANTS = (
+    ('shch', 'sch'),
+    ('kh', 'h'),
+    ('x', 'ks'),
+    ('w', 'v'),
+    ('ph', 'f'),
+    ('ck', 'k'),
+    ('tz', 'ts'),
+    ('j', 'y'),
+)
+
+_TRANSLITERATION = str.maketrans(CYRILLIC_TO_LATIN)
+
+
+def normalize_text(value):
+    """Текст без учета регистра и ё, с одиночными пробелами между словами"""
+    return ' '.join((value or '').casefold().replace('ё', 'е').split())
+
+
+def search_key(value):
+    """Ключ поиска: нормализованный текст в латинице с единым написанием вариантов"""
+    key = normalize_text(value).translate(_TRANSLITERATION)
+    for variant, replacement in LATIN_VARIANTS:
+        key = key.replace(variant, replacement)
+    return key
+
+
+def key_prefix_condition(field, key):
+    """Условие "ключ поля начинается с ``key``" (уже ключ поиска) в виде диапазона
+
+    Диапазон [key, следующая строка после всех строк с этим префиксом) работает
+    через обычный B-tree индекс в любой СУБД, в отличие от LIKE.
+    """
+    upper = key[:-1] + chr(ord(key[-1]) + 1)
+    return Q(**{f'{field}__gte': key, f'{field}__lt': upper})
+
+
+def key_word_starts(key):
+    """Окончания ключа, начинающиеся с начала каждого его слова
+
+    "sasha torubarin" -> ["sasha torubarin", "torubarin"], "svetlo-zelenyy" ->
+    ["svetlo-zelenyy", "zelenyy"]: поиск начала любого слова сводится к поиску
+    по началу одной из этих строк.
+    """
+    return list(dict.fromkeys(key[match.start():] for match in re.finditer(r'\b\w', key)))
+
+
+def search_words(value):
+    """Слова ключа поиска"""
+    return re.findall(r'\w+', search_key(value))
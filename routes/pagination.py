@@ -0,0 +1,256 @@
+"""
+Курсорная (keyset) пагинация трасс.
+
+Страница выбирается условием "после ключа последней строки" по активной
+сортировке, а не OFFSET, поэтому глубокие страницы стоят столько же, сколько
+первая. Курсор - непрозрачная строка (base64 от JSON с ключом строки и
+сортировкой), клиент получает его в полях next/previous ответа.
+"""
+
+import base64
+import json
+from collections import OrderedDict
+from datetime import date, datetime
+
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import F, Q
+from rest_framework.exceptions import ParseError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .cache import CACHE_TIMEOUT, cached_for_version
+from .filters import filter_cache_key
+from .models import Route
+
+# Сортировка списка трасс по умолчанию (как Route.Meta.ordering) с уникальным ключом
+DEFAULT_ORDERING = ('track_lane', 'route_number', 'id')
+
+# Сортировки расширенного поиска: параметр ordering -> ключ пагинации
+SEARCH_ORDERINGS = {
+    'name': ('name', 'id'),
+    '-name': ('-name', '-id'),
+    'author': ('author', 'id'),
+    '-author': ('-author', '-id'),
+    # Сложность сортируется по рангу категории, трассы без категории - в конце
+    'difficulty': ('difficulty_rank', 'id'),
+    '-difficulty': ('-difficulty_rank', 'id'),
+    'created_at': ('created_at', 'id'),
+    '-created_at': ('-created_at', '-id'),
+    'setup_date': ('setup_date', 'id'),
+    '-setup_date': ('-setup_date', '-id'),
+    # Релевантность полнотекстового поиска (только вместе с q), лучшие - первыми
+    'relevance': ('-search_rank', 'id'),
+    # Сходство нечеткого поиска (только вместе с fuzzy), самые похожие - первыми
+    'similarity': ('-similarity', 'id'),
+}
+
+
+# Режимы подсчета общего количества (параметр count)
+COUNT_MODES = ('none', 'estimate', 'exact')
+
+# Оценка без сохраненного значения считает не больше стольких трасс
+COUNT_ESTIMATE_LIMIT = 1000
+
+
+def filtered_count(queryset, params, mode):
+    """Общее количество трасс выборки: (количество, оценка ли это)
+
+    ``queryset`` - трассы, отфильтрованные по ``params`` (filter_routes). exact -
+    точный COUNT(*), закешированный по набору фильтров и версии данных; estimate -
+    последнее известное точное значение для этого набора фильтров (возможно, уже
+    устаревшее), а если его нет - подсчет, ограниченный COUNT_ESTIMATE_LIMIT.
+    """
+    key = filter_cache_key(params)
+    latest_key = f'routes:count-latest:{key}'
+    if mode == 'exact':
+        def build():
+            count = queryset.count()
+            cache.set(latest_key, count, CACHE_TIMEOUT)
+            return count
+
+        return cached_for_version(f'count:{key}', build), False
+    count = cache.get(latest_key)
+    if count is None:
+        count = queryset.order_by()[:COUNT_ESTIMATE_LIMIT].count()
+    return count, True
+
+
+class InvalidCursor(ParseError):
+    default_detail = 'Некорректный курсор страницы'
+
+
+def cursor_value(value):
+    """Значение ключа для JSON курсора"""
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+class RouteCursorPagination(BasePagination):
+    """Курсорная пагинация по составному ключу сортировки
+
+    ``ordering`` - поля ключа (с '-' для убывания), последнее поле должно быть
+    уникальным (id). Поля, допускающие NULL, сортируются с NULL в конце.
+    Общее количество возвращается только по запросу: count=exact или
+    count=estimate (см. filtered_count), по умолчанию - count=none.
+    """
+
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    # Номер страницы постраничного режима: списком трасс не принимается, поиском - принимается
+    page_query_param = 'page'
+    count_query_param = 'count'
+
+    def __init__(self, ordering=DEFAULT_ORDERING):
+        self.ordering = tuple(ordering)
+        self.keys = []
+        for name in self.ordering:
+            field_name = name.lstrip('-')
+            try:
+                field = Route._meta.pk if field_name == 'id' else Route._meta.get_field(field_name)
+            except FieldDoesNotExist:
+                # Аннотация выборки (например, релевантность поиска), значения не NULL
+                field = None
+            self.keys.append((field_name, name.startswith('-'), field is not None and field.null, field))
+        # Колонки ключа: их нужно выбрать вместе со строками (values()), чтобы строить курсоры
+        self.key_names = [field_name for field_name, _, _, _ in self.keys]
+
+    def get_page_size(self, request):
+        """Размер страницы из запроса, ограниченный max_page_size"""
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size < 1:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_count_mode(self, request):
+        """Режим подсчета из запроса (неизвестное значение - без подсчета)"""
+        mode = request.query_params.get(self.count_query_param, 'none')
+        return mode if mode in COUNT_MODES else 'none'
+
+    def order_by(self, reverse=False):
+        """Выражения ORDER BY для ключа (reverse - обратный порядок для предыдущей страницы)"""
+        expressions = []
+        for field_name, descending, nullable, _ in self.keys:
+            field = F(field_name)
+            order = field.desc if descending != reverse else field.asc
+            if nullable:
+                # NULL в конце при прямом порядке и, соответственно, в начале при обратном
+                expressions.append(order(**({'nulls_first': True} if reverse else {'nulls_last': True})))
+            else:
+                expressions.append(order())
+        return expressions
+
+    def beyond(self, field_name, descending, nullable, value, reverse):
+        """Условие "строго после значения" по одному полю ключа (reverse - "строго до")"""
+        if not reverse:
+            if value is None:
+                # NULL в конце: после NULL по этому полю ничего нет
+                return None
+            condition = Q(**{f'{field_name}__lt' if descending else f'{field_name}__gt': value})
+            return condition | Q(**{f'{field_name}__isnull': True}) if nullable else condition
+        if value is None:
+            return Q(**{f'{field_name}__isnull': False}) if nullable else None
+        return Q(**{f'{field_name}__gt' if descending else f'{field_name}__lt': value})
+
+    def position_filter(self, values, reverse):
+        """Условие "строки после (или до) ключа ``values``" по всему составному ключу"""
+        condition = None
+        equal = Q()
+        for (field_name, descending, nullable, _), value in zip(self.keys, values):
+            beyond = self.beyond(field_name, descending, nullable, value, reverse)
+            if beyond is not None:
+                condition = equal & beyond if condition is None else condition | (equal & beyond)
+            equal &= Q(**{f'{field_name}__isnull': True}) if value is None else Q(**{field_name: value})
+        return condition if condition is not None else Q(pk__in=[])
+
+    def encode_cursor(self, row, reverse):
+        """Курсор строки: экземпляра трассы или словаря из values()"""
+        get = row.get if isinstance(row, dict) else lambda name: getattr(row, name)
+        values = [cursor_value(get(field_name)) for field_name in self.key_names]
+        payload = json.dumps({'o': ','.join(self.ordering), 'v': values, 'r': reverse}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, request):
+        """Ключ и направление из курсора запроса или None для первой страницы"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)).decode('utf-8'))
+            if payload['o'] != ','.join(self.ordering) or len(payload['v']) != len(self.keys):
+                raise InvalidCursor('Курсор относится к другой сортировке')
+            values = [
+                value if value is None or field is None else field.to_python(value)
+                for (_, _, _, field), value in zip(self.keys, payload['v'])
+            ]
+            return values, bool(payload['r'])
+        except InvalidCursor:
+            raise
+        except Exception:
+            raise InvalidCursor()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.count = None
+        self.count_estimated = False
+        if self.get_count_mode(request) != 'none':
+            self.count, self.count_estimated = filtered_count(
+                queryset, request.query_params, self.get_count_mode(request)
+            )
+
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor[1])
+        if cursor:
+            queryset = queryset.filter(self.position_filter(*cursor))
+        rows = list(queryset.order_by(*self.order_by(reverse))[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        # При движении назад следующая страница есть всегда (мы пришли с нее)
+        self.has_next = has_more if not reverse else True
+        self.has_previous = cursor is not None if not reverse else has_more
+        self.rows = rows
+        return rows
+
+    def page_link(self, row, reverse):
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(row, reverse))
+
+    def get_next_link(self):
+        if not self.has_next or not self.rows:
+            return None
+        return self.page_link(self.rows[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.rows:
+            # Пустая страница после конца списка: назад - к началу
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self.page_link(self.rows[0], reverse=True)
+
+    def get_paginated_data(self, data):
+        response_data = OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('page_size', self.page_size),
+        ])
+        if self.count is not None:
+            response_data['count'] = self.count
+            if self.count_estimated:
+                response_data['count_estimated'] = True
+        response_data['results'] = data
+        return response_data
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
@@ -0,0 +1,100 @@
+"""
+Быстрые рендереры и парсеры API: JSON через orjson и MessagePack.
+
+Формат выбирается стандартным согласованием DRF: ответ - по заголовку Accept
+(или ?format=msgpack), тело запроса - по Content-Type. msgpack обязателен
+(рендерер и парсер всегда подключены в настройках), без orjson JSON
+кодируется стандартным JSONRenderer DRF.
+
+Типы, которые не кодируются нативно (Decimal, даты, ленивые строки перевода),
+приводятся тем же кодировщиком, что и в JSONRenderer DRF, поэтому ответы
+совпадают с прежними байт в байт.
+"""
+
+import codecs
+
+import msgpack
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson необязателен
+    orjson = None
+
+# Кодирование типов, которые orjson и msgpack не знают (как в JSONRenderer DRF)
+encode_default = JSONEncoder().default
+
+# U+2028 и U+2029 экранируются, как в JSONRenderer DRF (JSON остается подмножеством JavaScript)
+LINE_SEPARATORS = ((b'\xe2\x80\xa8', b'\\u2028'), (b'\xe2\x80\xa9', b'\\u2029'))
+
+
+class ORJSONRenderer(JSONRenderer):
+    """JSON через orjson; с отступами или без orjson - стандартный JSONRenderer"""
+
+    # Ключи-числа (распределения по дорожкам) - строками, как в json; даты и
+    # время кодирует encode_default, как JSONRenderer DRF (с Z для UTC)
+    options = (orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME) if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            content = orjson.dumps(data, default=encode_default, option=self.options)
+        except orjson.JSONEncodeError:
+            # Например, целые больше 64 бит - их кодирует только стандартный json
+            return super().render(data, accepted_media_type, renderer_context)
+        for separator, escaped in LINE_SEPARATORS:
+            if separator in content:
+                content = content.replace(separator, escaped)
+        return content
+
+
+class ORJSONParser(JSONParser):
+    """Разбор JSON через orjson (без orjson - стандартный JSONParser)"""
+
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        content = stream.read() if stream is not None else b''
+        if codecs.lookup(encoding).name != 'utf-8':
+            content = content.decode(encoding)
+        try:
+            return orjson.loads(content)
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
+
+
+class MessagePackRenderer(BaseRenderer):
+    """Ответы в MessagePack (Accept: application/msgpack или ?format=msgpack)"""
+
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=encode_default, use_bin_type=True, datetime=False)
+
+
+class MessagePackParser(BaseParser):
+    """Тело запроса в MessagePack (Content-Type: application/msgpack)"""
+
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read() if stream is not None else b'', raw=False, strict_map_key=False)
+        except (ValueError, TypeError) as exc:
+            raise ParseError('MessagePack parse error - %s' % str(exc))
@@ -0,0 +1,106 @@
+"""
+Полнотекстовый поиск трасс по названию, автору, цвету и описанию (параметр q).
+
+SQLite: виртуальная таблица FTS5 routes_route_fts с внешним содержимым
+(content='routes_route'), синхронизируется триггерами из routes/triggers.py;
+токенизатор unicode61 сравнивает без учета регистра, в том числе кириллицу.
+PostgreSQL: GIN-индекс по to_tsvector с тем же выражением, что и в запросе.
+Для остальных СУБД (или SQLite без FTS5) - поиск через icontains.
+"""
+
+import re
+
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from .triggers import SQLITE_FTS_TABLE
+
+# Поля полнотекстового индекса и их веса в ранжировании (название важнее описания)
+FTS_FIELDS = ('name', 'author', 'color', 'description')
+FTS_WEIGHTS = (10.0, 5.0, 2.0, 1.0)
+
+# Выражение документа для PostgreSQL - должно совпадать с выражением GIN-индекса
+POSTGRESQL_DOCUMENT = (
+    "to_tsvector('simple', coalesce(routes_route.name, '') || ' ' || coalesce(routes_route.author, '') || ' ' || "
+    "coalesce(routes_route.color, '') || ' ' || coalesce(routes_route.description, ''))"
+)
+
+# Наличие таблицы FTS5 по базам (таблица создается миграцией и потом не исчезает)
+_fts_available = {}
+
+
+def search_terms(text):
+    """Слова запроса в нижнем регистре (знаки препинания и операторы отбрасываются)"""
+    return re.findall(r'\w+', (text or '').casefold())
+
+
+def fts_available():
+    """Есть ли таблица FTS5 в текущей базе SQLite"""
+    name = str(connection.settings_dict['NAME'])
+    if name not in _fts_available:
+        _fts_available[name] = SQLITE_FTS_TABLE in connection.introspection.table_names()
+    return _fts_available[name]
+
+
+def fulltext_backend():
+    """Способ полнотекстового поиска для текущей базы: fts5, postgresql или like"""
+    if connection.vendor == 'sqlite' and fts_available():
+        return 'fts5'
+    if connection.vendor == 'postgresql':
+        return 'postgresql'
+    return 'like'
+
+
+def fts5_match(terms):
+    """Выражение MATCH: все слова, каждое - как префикс"""
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def postgresql_tsquery(terms):
+    """Запрос to_tsquery: все слова, каждое - как префикс"""
+    return ' & '.join(f'{term}:*' for term in terms)
+
+
+def fulltext_condition(text):
+    """Условие "трасса подходит под запрос q" или None для пустого запроса"""
+    terms = search_terms(text)
+    if not terms:
+        return None
+    backend = fulltext_backend()
+    if backend == 'fts5':
+        return Q(id__in=RawSQL(f'SELECT rowid FROM {SQLITE_FTS_TABLE} WHERE {SQLITE_FTS_TABLE} MATCH %s', [fts5_match(terms)]))
+    if backend == 'postgresql':
+        return Q(id__in=RawSQL(
+            f"SELECT routes_route.id FROM routes_route WHERE {POSTGRESQL_DOCUMENT} @@ to_tsquery('simple', %s)",
+            [postgresql_tsquery(terms)],
+        ))
+    condition = Q()
+    for term in terms:
+        condition &= Q(*[Q(**{f'{field}__icontains': term}) for field in FTS_FIELDS], _connector=Q.OR)
+    return condition
+
+
+def relevance(text):
+    """Выражение релевантности для сортировки (больше - лучше)
+
+    SQLite: -bm25 с весами FTS_WEIGHTS; PostgreSQL: ts_rank; без полнотекстового
+    индекса релевантность у всех трасс одинаковая.
+    """
+    terms = search_terms(text)
+    backend = fulltext_backend() if terms else 'like'
+    if backend == 'fts5':
+        weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+        return RawSQL(
+            f'(SELECT -bm25({SQLITE_FTS_TABLE}, {weights}) FROM {SQLITE_FTS_TABLE} '
+            f'WHERE {SQLITE_FTS_TABLE} MATCH %s AND {SQLITE_FTS_TABLE}.rowid = routes_route.id)',
+            [fts5_match(terms)],
+            output_field=FloatField(),
+        )
+    if backend == 'postgresql':
+        return RawSQL(
+            f"ts_rank({POSTGRESQL_DOCUMENT}, to_tsquery('simple', %s))",
+            [postgresql_tsquery(terms)],
+            output_field=FloatField(),
+        )
+    return Value(0.0, output_field=FloatField())
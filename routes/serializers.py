@@ -1,13 +1,44 @@
-from rest_framework import serializers
+from operator import itemgetter
+
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+from django.conf import settings
+from django.utils import timezone
 from .models import Route
 import csv
 from django.http import HttpResponse
 
+SETUP_DATE_FORMAT = '%d.%m.%Y'
+
+# Параметры выбора полей ответа (sparse fieldsets)
+FIELDS_PARAM = 'fields'
+EXCLUDE_PARAM = 'exclude'
+
+# Поля модели, из которых вычисляются поля ответа с другим именем
+SERIALIZER_SOURCE_FIELDS = {'difficulty_display': ('difficulty',)}
+
+
+class FieldsetError(ValueError):
+    """Неизвестное поле в параметре fields/exclude"""
+
 
 class RouteSerializer(serializers.ModelSerializer):
     """Сериализатор для модели Route"""
     difficulty_display = serializers.CharField(source='get_difficulty_display', read_only=True)
+    # В базе хранится дата, в API по-прежнему используется формат DD.MM.YYYY
+    setup_date = serializers.DateField(
+        format=SETUP_DATE_FORMAT,
+        input_formats=[SETUP_DATE_FORMAT],
+        error_messages={'invalid': 'Дата должна быть в формате DD.MM.YYYY'},
+    )
     
+    def __init__(self, *args, fields=None, **kwargs):
+        """``fields`` - поля ответа (см. requested_fields), None - все поля"""
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
     class Meta:
         model = Route
         fields = [
@@ -69,11 +100,87 @@ class RouteSerializer(serializers.ModelSerializer):
         if value < 1 or value > 35:
             raise serializers.ValidationError("Номер дорожки должен быть от 1 до 35")
         return value
-    
-    def validate_setup_date(self, value):
-        """Валидация даты накрутки"""
-        import re
-        # Проверяем формат DD.MM.YYYY
-        if not re.match(r'^\d{2}\.\d{2}\.\d{4}$', value):
-            raise serializers.ValidationError("Дата должна быть в формате DD.MM.YYYY")
-        return value
+
+
+def requested_fields(params):
+    """Поля ответа из параметров fields= и exclude= (через запятую) или None - все поля
+
+    Вызывает FieldsetError, если указано неизвестное поле.
+    """
+    fields_value = params.get(FIELDS_PARAM, '')
+    exclude_value = params.get(EXCLUDE_PARAM, '')
+    if not fields_value and not exclude_value:
+        return None
+    available = RouteSerializer.Meta.fields
+    fields = [name.strip() for name in fields_value.split(',') if name.strip()] or list(available)
+    excluded = {name.strip() for name in exclude_value.split(',') if name.strip()}
+    unknown = [name for name in [*fields, *sorted(excluded)] if name not in available]
+    if unknown:
+        raise FieldsetError(f'Неизвестные поля: {", ".join(unknown)}. Доступны: {", ".join(available)}')
+    return [name for name in available if name in fields and name not in excluded]
+
+
+def route_model_fields(fields, extra=()):
+    """Поля модели для .only(): нужные полям ответа ``fields`` и ``extra`` (ключ сортировки)"""
+    names = {'id', *extra}
+    for name in fields:
+        names.update(SERIALIZER_SOURCE_FIELDS.get(name, (name,)))
+    return sorted(names)
+
+
+def datetime_formatter():
+    """Функция форматирования даты и времени так же, как DateTimeField DRF
+
+    Для настроек по умолчанию (ISO 8601, USE_TZ) часовой пояс определяется
+    один раз на весь список, а не для каждой строки.
+    """
+    if api_settings.DATETIME_FORMAT != ISO_8601 or not settings.USE_TZ:
+        return serializers.DateTimeField().to_representation
+    current_timezone = timezone.get_current_timezone()
+
+    def format_datetime(value):
+        if value is None:
+            return None
+        value = value.astimezone(current_timezone).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+    return format_datetime
+
+
+class RouteReadSerializer:
+    """Быстрая сериализация списков трасс только для чтения
+
+    Строит словари прямо из строк values(), минуя экземпляры модели и объекты
+    полей DRF; результат совпадает с RouteSerializer байт в байт (см. тест
+    паритета). ``fields`` - поля ответа (см. requested_fields), None - все поля.
+    """
+
+    def __init__(self, fields=None):
+        # Порядок полей - как в RouteSerializer, независимо от порядка в ``fields``
+        self.fields = [name for name in RouteSerializer.Meta.fields if fields is None or name in fields]
+        self.columns = route_model_fields(self.fields)
+
+    def rows(self, queryset, extra=()):
+        """Строки-словари с нужными колонками и ``extra`` (например, ключом сортировки)"""
+        return queryset.values(*self.columns, *[name for name in extra if name not in self.columns])
+
+    def getters(self):
+        """Поля ответа и функции получения их значений из строки"""
+        labels = dict(Route.DifficultyLevel.choices)
+        format_datetime = datetime_formatter()
+        special = {
+            'difficulty_display': lambda row: labels.get(row['difficulty'], row['difficulty']),
+            'setup_date': lambda row: (
+                row['setup_date'].strftime(SETUP_DATE_FORMAT) if row['setup_date'] is not None else None
+            ),
+            'created_at': lambda row: format_datetime(row['created_at']),
+        }
+        return [(name, special.get(name) or itemgetter(name)) for name in self.fields]
+
+    def serialize(self, rows):
+        getters = self.getters()
+        return [{name: get(row) for name, get in getters} for row in rows]
+
+    def data(self, queryset):
+        """Сериализованные трассы выборки"""
+        return self.serialize(self.rows(queryset))
@@ -0,0 +1,179 @@
+"""
+Агрегированная статистика по трассам.
+
+Все распределения строятся из одного группирующего запроса: трасс на скалодроме
+немного (35 дорожек по 4 трассы), поэтому групп тоже немного, и дальше они
+складываются в Python.
+"""
+
+from django.db.models import BooleanField, Count, ExpressionWrapper, Q
+
+from .cache import cached_for_version
+from .filters import RouteFilter
+from .models import Route
+
+# Фасеты поиска: измерение фильтра -> поле трассы
+FACET_FIELDS = {
+    'difficulty': 'difficulty',
+    'color': 'color',
+    'author': 'author',
+    'lane': 'track_lane',
+    'is_active': 'is_active',
+}
+
+# Дополнительные разрезы статистики (параметр breakdown)
+STATS_BREAKDOWNS = ('lane', 'active')
+
+
+def route_stats_groups(queryset=None):
+    """Количество трасс по группам (дорожка, сложность, цвет, активность) - один запрос"""
+    if queryset is None:
+        queryset = Route.objects.all()
+    return list(
+        queryset.order_by()
+        .values('track_lane', 'difficulty', 'color', 'is_active')
+        .annotate(count=Count('id'))
+    )
+
+
+def build_route_stats(queryset=None):
+    """Полная статистика по трассам (по умолчанию - всем) со всеми разрезами"""
+    difficulty_labels = dict(Route.DifficultyLevel.choices)
+    total_routes = 0
+    active_routes = 0
+    difficulty_counts = dict.fromkeys(difficulty_labels, 0)
+    color_counts = {}
+    lane_counts = {}
+    status_counts = {
+        status: {'difficulty': {}, 'color': {}}
+        for status in ('active', 'inactive')
+    }
+
+    for group in route_stats_groups(queryset):
+        count = group['count']
+        total_routes += count
+        if group['is_active']:
+            active_routes += count
+        difficulty_counts[group['difficulty']] = difficulty_counts.get(group['difficulty'], 0) + count
+        color_counts[group['color']] = color_counts.get(group['color'], 0) + count
+
+        lane = lane_counts.setdefault(group['track_lane'], {'total': 0, 'active': 0})
+        lane['total'] += count
+        if group['is_active']:
+            lane['active'] += count
+
+        status = status_counts['active' if group['is_active'] else 'inactive']
+        status['difficulty'][group['difficulty']] = status['difficulty'].get(group['difficulty'], 0) + count
+        status['color'][group['color']] = status['color'].get(group['color'], 0) + count
+
+    return {
+        'total_routes': total_routes,
+        'active_routes': active_routes,
+        'inactive_routes': total_routes - active_routes,
+        'difficulty_distribution': {
+            difficulty: {'label': difficulty_labels.get(difficulty, difficulty), 'count': count}
+            for difficulty, count in difficulty_counts.items()
+        },
+        'color_distribution': dict(sorted(color_counts.items())),
+        'lane_distribution': dict(sorted(lane_counts.items())),
+        'status_distribution': status_counts,
+    }
+
+
+def cached_route_stats(breakdowns=(), params=None):
+    """Статистика по трассам из кеша текущей версии данных
+
+    ``breakdowns`` - дополнительные разрезы из STATS_BREAKDOWNS: lane - по
+    дорожкам, active - распределения отдельно для активных и неактивных трасс.
+    ``params`` - фильтры трасс (кешируются по каноническому ключу фильтра).
+    Вызывает RouteFilterError, если параметры фильтра некорректны.
+    """
+    route_filter = RouteFilter.compile(params or {})
+    stats = dict(cached_for_version(
+        f'stats:{route_filter.cache_key}', lambda: build_route_stats(route_filter.apply())
+    ))
+    if 'lane' not in breakdowns:
+        del stats['lane_distribution']
+    if 'active' not in breakdowns:
+        del stats['status_distribution']
+    return stats
+
+
+def dimension_counts(field, queryset=None):
+    """Значения поля (автор, цвет) с количеством трасс - один группирующий запрос
+
+    ``queryset`` - уже отфильтрованные трассы (по умолчанию все).
+    """
+    if queryset is None:
+        queryset = Route.objects.all()
+    groups = (
+        queryset.order_by(field)
+        .values(field)
+        .annotate(total_routes=Count('id'), active_routes=Count('id', filter=Q(is_active=True)))
+    )
+    return [
+        {
+            'name': group[field],
+            'total_routes': group['total_routes'],
+            'active_routes': group['active_routes'],
+            'inactive_routes': group['total_routes'] - group['active_routes'],
+        }
+        for group in groups
+    ]
+
+
+def build_facets(conditions):
+    """Счетчики фасетов под фильтром ``conditions`` (результат RouteFilter.conditions)
+
+    Счетчики каждого фасета считаются с учетом всех остальных фильтров, но без
+    его собственного. Все фасеты строятся одним группирующим запросом: условия
+    фасетных измерений не фильтруют выборку, а вычисляются как флаги для каждой
+    группы, и группы складываются в Python.
+    """
+    base_conditions = [condition for dimension, condition in conditions.items() if dimension not in FACET_FIELDS]
+    flags = {
+        f'match_{dimension}': ExpressionWrapper(conditions[dimension], output_field=BooleanField())
+        for dimension in FACET_FIELDS
+        if dimension in conditions
+    }
+    groups = (
+        Route.objects.filter(*base_conditions)
+        .annotate(**flags)
+        .order_by()
+        .values(*FACET_FIELDS.values(), *flags)
+        .annotate(count=Count('id'))
+    )
+
+    counts = {dimension: {} for dimension in FACET_FIELDS}
+    for group in groups:
+        matched = {flag for flag in flags if group[flag]}
+        for dimension, field in FACET_FIELDS.items():
+            if all(flag in matched for flag in flags if flag != f'match_{dimension}'):
+                counts[dimension][group[field]] = counts[dimension].get(group[field], 0) + group['count']
+
+    difficulty_labels = dict(Route.DifficultyLevel.choices)
+    return {
+        'difficulty': [
+            {'value': difficulty, 'label': difficulty_labels.get(difficulty, difficulty), 'count': count}
+            for difficulty, count in sorted(
+                counts['difficulty'].items(), key=lambda item: Route.DIFFICULTY_RANKS.get(item[0], 0)
+            )
+        ],
+        'color': [{'value': value, 'count': count} for value, count in sorted(counts['color'].items())],
+        'author': [{'value': value, 'count': count} for value, count in sorted(counts['author'].items())],
+        'lane': [{'value': value, 'count': count} for value, count in sorted(counts['lane'].items())],
+        'is_active': [
+            {'value': value, 'count': counts['is_active'][value]}
+            for value in (True, False)
+            if value in counts['is_active']
+        ],
+    }
+
+
+def cached_facets(params):
+    """Фасеты для параметров фильтра из кеша текущей версии данных
+
+    Вызывает RouteFilterError, если параметры фильтра некорректны.
+    """
+    route_filter = RouteFilter.compile(params)
+    return cached_for_version(f'facets:{route_filter.cache_key}', lambda: build_facets(route_filter.conditions()))
@@ -0,0 +1,129 @@
+"""
+Автодополнение названий, авторов и цветов трасс (GET /api/routes/suggest/).
+
+Подсказки берутся из отсортированных массивов ключей поиска в памяти процесса
+(routes/normalize.py), поиск префикса - bisect, без запросов к базе. Значения с
+одинаковым ключом ("Красный", "красный ", "krasnyy") - одна подсказка с общим
+счетчиком трасс. Значение находится и по началу любого своего слова: "тору"
+подсказывает "Саша Торубарин".
+
+Массивы перестраиваются при смене версии данных (см. routes/cache.py); версия
+проверяется не чаще SUGGEST_REFRESH_INTERVAL, так что между проверками
+подсказки не обращаются к базе совсем.
+"""
+
+import heapq
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+
+from django.db import connection
+
+from .cache import data_version
+from .models import Route
+from .normalize import search_key
+
+# Поля трассы, для которых есть подсказки
+SUGGEST_FIELDS = ('name', 'author', 'color')
+
+# Количество подсказок по умолчанию и максимальное
+SUGGEST_LIMIT = 10
+SUGGEST_MAX_LIMIT = 50
+
+# Для префиксов не длиннее стольких символов лучшие подсказки вычисляются заранее:
+# под короткий префикс попадает слишком много значений
+SUGGEST_PRECOMPUTED_PREFIX = 2
+
+# Как часто (секунды) проверять версию данных
+SUGGEST_REFRESH_INTERVAL = 1.0
+
+
+class PrefixIndex:
+    """Подсказки для одного поля: отсортированные ключи и лучшие значения префиксов"""
+
+    def __init__(self, values):
+        spellings = {}
+        for value in values:
+            key = search_key(value)
+            if key:
+                spellings.setdefault(key, Counter())[' '.join(value.split())] += 1
+
+        # Подсказка - самое частое написание значения и общее количество трасс
+        self.suggestions = []
+        entries = []
+        for key, counter in spellings.items():
+            suggestion = len(self.suggestions)
+            spelling = min(counter, key=lambda spelling: (-counter[spelling], spelling))
+            self.suggestions.append((spelling, sum(counter.values())))
+            entries.append((key, suggestion))
+            entries.extend((key[i + 1:], suggestion) for i, char in enumerate(key) if char == ' ')
+        entries.sort()
+        self.keys = [key for key, _ in entries]
+        self.entries = [suggestion for _, suggestion in entries]
+
+        self.precomputed = {}
+        for key, suggestion in entries:
+            for length in range(SUGGEST_PRECOMPUTED_PREFIX + 1):
+                self.precomputed.setdefault(key[:length], set()).add(suggestion)
+        self.precomputed = {prefix: self.best(found, SUGGEST_MAX_LIMIT) for prefix, found in self.precomputed.items()}
+
+    def best(self, found, limit):
+        """Лучшие подсказки: больше трасс - выше, при равенстве - по алфавиту"""
+        return heapq.nsmallest(
+            limit, found, key=lambda suggestion: (-self.suggestions[suggestion][1], self.suggestions[suggestion][0])
+        )
+
+    def complete(self, prefix, limit=SUGGEST_LIMIT):
+        """Подсказки для префикса: список (значение, количество трасс)"""
+        key = search_key(prefix)
+        if len(key) <= SUGGEST_PRECOMPUTED_PREFIX:
+            found = self.precomputed.get(key, [])[:limit]
+        else:
+            start = bisect_left(self.keys, key)
+            end = bisect_left(self.keys, key[:-1] + chr(ord(key[-1]) + 1), start)
+            found = self.best(set(self.entries[start:end]), limit)
+        return [self.suggestions[suggestion] for suggestion in found]
+
+
+class RouteSuggestions:
+    """Подсказки по всем полям SUGGEST_FIELDS на одну версию данных"""
+
+    def __init__(self):
+        self.version = None
+        self.checked_at = None
+        self.fields = {}
+        self.lock = threading.Lock()
+
+    def rebuild(self, version):
+        columns = list(zip(*Route.objects.order_by().values_list(*SUGGEST_FIELDS))) or [()] * len(SUGGEST_FIELDS)
+        self.fields = {field: PrefixIndex(values) for field, values in zip(SUGGEST_FIELDS, columns)}
+        self.version = version
+
+    def refresh(self):
+        """Перестроить подсказки, если версия данных изменилась (или журнал не ведется)"""
+        now = time.monotonic()
+        if self.checked_at is not None and now - self.checked_at < SUGGEST_REFRESH_INTERVAL:
+            return
+        version = data_version()
+        if self.checked_at is None or version is None or version != self.version:
+            self.rebuild(version)
+        self.checked_at = now
+
+    def complete(self, field, prefix, limit=SUGGEST_LIMIT):
+        return self.fields[field].complete(prefix, limit)
+
+
+# Подсказки процесса по базам данных (в тестах база своя)
+_suggestions = {}
+_suggestions_lock = threading.Lock()
+
+
+def route_suggestions():
+    """Подсказки текущего процесса, актуальные на текущую версию данных"""
+    name = str(connection.settings_dict['NAME'])
+    with _suggestions_lock:
+        suggestions = _suggestions.setdefault(name, RouteSuggestions())
+    with suggestions.lock:
+        suggestions.refresh()
+    return suggestions
@@ -0,0 +1,1530 @@
+import threading
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from email.header import decode_header, make_header
+from io import BytesIO
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q
+from django.http import QueryDict
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import ErrorDetail, ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from . import fuzzy, renderers, suggest
+from .bulk import LaneSnapshot, bulk_update_routes
+from .filters import RouteFilter, filter_routes
+from .models import LANE_CAPACITY, Route, RouteChangeLog, RouteLaneSlot, RouteSearchToken, lane_capacity_message
+from .normalize import search_key
+from .serializers import RouteReadSerializer, RouteSerializer
+
+
+def make_route(lane, name, color, difficulty='6a', **extra):
+    """Создать трассу через save(), чтобы номер назначился автоматически"""
+    return Route.objects.create(
+        track_lane=lane,
+        name=name,
+        difficulty=difficulty,
+        color=color,
+        author=extra.pop('author', 'Иван Петров'),
+        setup_date=extra.pop('setup_date', date(2025, 9, 1)),
+        **extra
+    )
+
+
+class RenumberRoutesTests(TestCase):
+    """Перенумерация трасс по дорожкам"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.lane_one = [
+            make_route(1, 'Старт', 'красный'),
+            make_route(1, 'Вертикаль', 'синий'),
+            make_route(1, 'Координация', 'зеленый'),
+        ]
+        self.lane_two = [
+            make_route(2, 'Карниз', 'красный'),
+            make_route(2, 'Траверс', 'синий'),
+        ]
+
+    def numbers(self, lane):
+        return list(
+            Route.objects.filter(track_lane=lane).order_by('id').values_list('route_number', flat=True)
+        )
+
+    def test_delete_renumbers_only_affected_lane(self):
+        Route.objects.filter(pk=self.lane_two[0].pk).update(route_number=99)
+
+        response = self.client.delete(f'/api/routes/{self.lane_one[0].pk}/')
+
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.numbers(1), [1, 2])
+        # Дорожка 2 не затронута удалением и не перенумеровывается
+        self.assertEqual(self.numbers(2), [99, 6])
+
+    def test_renumber_skips_rows_with_correct_number(self):
+        Route.objects.filter(pk=self.lane_one[1].pk).delete()
+
+        with self.assertNumQueries(4):
+            # SAVEPOINT, оконный запрос, один UPDATE для единственной сдвинутой трассы, RELEASE
+            changed = Route.renumber_routes(lanes=[1, 2])
+
+        self.assertEqual(changed, 1)
+        self.assertEqual(self.numbers(1), [1, 2])
+        self.assertEqual(self.numbers(2), [5, 6])
+
+    def test_renumber_all_lanes(self):
+        Route.objects.update(route_number=0)
+
+        Route.renumber_routes()
+
+        self.assertEqual(self.numbers(1), [1, 2, 3])
+        self.assertEqual(self.numbers(2), [5, 6])
+
+    def test_bulk_delete_renumbers_affected_lanes(self):
+        response = self.client.delete(
+            '/api/routes/bulk/',
+            {'route_ids': [self.lane_one[0].pk, self.lane_two[0].pk]},
+            format='json',
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['deleted_count'], 2)
+        self.assertEqual(self.numbers(1), [1, 2])
+        self.assertEqual(self.numbers(2), [5])
+
+
+class RouteNumberAllocationTests(TestCase):
+    """Назначение номеров трасс под блокировкой дорожки"""
+
+    def test_numbers_follow_lane_positions(self):
+        routes = [make_route(3, f'Трасса {i}', color) for i, color in enumerate(['красный', 'синий', 'зеленый'])]
+
+        self.assertEqual([r.route_number for r in routes], [9, 10, 11])
+
+    def test_gap_on_lane_is_reused(self):
+        first, second, third = [make_route(3, f'Трасса {i}', c) for i, c in enumerate(['красный', 'синий', 'зеленый'])]
+        Route.objects.filter(pk=second.pk).delete()
+
+        route = make_route(3, 'Новая', 'желтый')
+
+        self.assertEqual(route.route_number, 10)
+        self.assertEqual(
+            sorted(Route.objects.filter(track_lane=3).values_list('route_number', flat=True)),
+            [9, 10, 11],
+        )
+
+    def test_allocation_locks_lane_slot(self):
+        make_route(3, 'Трасса', 'красный')
+
+        self.assertEqual(RouteLaneSlot.objects.get(track_lane=3).allocations, 1)
+
+    def test_missing_lane_slot_is_created(self):
+        RouteLaneSlot.objects.filter(track_lane=4).delete()
+
+        with transaction.atomic():
+            RouteLaneSlot.lock_lanes([4])
+
+        self.assertTrue(RouteLaneSlot.objects.filter(track_lane=4).exists())
+
+
+class RouteValidationTests(TestCase):
+    """Правила дорожки, проверяемые при сохранении трассы"""
+
+    def setUp(self):
+        make_route(5, 'Вертикаль', 'Красный', difficulty='6b')
+
+    def test_fingerprint_is_normalized(self):
+        route = Route.objects.get()
+        same = Route(name='  вертикаль ', difficulty='6b', color='КРАСНЫЙ ')
+        same.refresh_derived_fields()
+
+        self.assertEqual(route.fingerprint, same.fingerprint)
+
+    def test_lane_rules_use_single_query(self):
+        # Блокировка дорожки, занятые номера, выборка соседей для валидации, INSERT трассы
+        # и начал слов ее автора и цвета в точке сохранения
+        with self.assertNumQueries(7):
+            make_route(5, 'Карниз', 'синий')
+
+    def test_duplicate_on_adjacent_lane(self):
+        with self.assertRaisesMessage(ValidationError, 'смежной дорожке 5: Вертикаль (6b, Красный)'):
+            make_route(6, ' вертикаль', 'красный ', difficulty='6b')
+
+    def test_same_color_is_case_insensitive(self):
+        with self.assertRaisesMessage(ValidationError, "На дорожке 5 уже есть трасса с цветом 'красный'"):
+            make_route(5, 'Траверс', 'красный')
+
+    def test_lane_capacity(self):
+        for name, color in [('Первая', 'синий'), ('Вторая', 'зеленый'), ('Третья', 'желтый')]:
+            make_route(5, name, color)
+
+        with self.assertRaisesMessage(ValidationError, 'На дорожке 5 уже максимальное количество трасс (4)'):
+            make_route(5, 'Пятая', 'белый')
+
+
+class SetupDateTests(TestCase):
+    """Дата накрутки: формат API и фильтрация по диапазону"""
+
+    def setUp(self):
+        self.client = APIClient()
+        today = date.today()
+        self.fresh = make_route(1, 'Свежая', 'красный', setup_date=today - timedelta(days=10))
+        self.middle = make_route(2, 'Средняя', 'красный', setup_date=today - timedelta(days=60))
+        self.old = make_route(3, 'Старая', 'красный', setup_date=today - timedelta(days=120))
+
+    def test_api_keeps_dd_mm_yyyy_format(self):
+        response = self.client.post('/api/routes/', {
+            'track_lane': 10,
+            'name': 'Новая',
+            'difficulty': '6a',
+            'color': 'синий',
+            'author': 'Иван Петров',
+            'setup_date': '01.09.2025',
+        }, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['setup_date'], '01.09.2025')
+        self.assertEqual(Route.objects.get(pk=response.data['id']).setup_date, date(2025, 9, 1))
+
+    def test_api_rejects_other_formats(self):
+        response = self.client.post('/api/routes/', {
+            'track_lane': 10,
+            'name': 'Новая',
+            'difficulty': '6a',
+            'color': 'синий',
+            'author': 'Иван Петров',
+            'setup_date': '2025-09-01',
+        }, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['setup_date'], ['Дата должна быть в формате DD.MM.YYYY'])
+
+    def test_setup_date_range_filter(self):
+        after = (date.today() - timedelta(days=90)).strftime('%d.%m.%Y')
+        before = (date.today() - timedelta(days=30)).isoformat()
+
+        response = self.client.get('/api/routes/search/', {'setup_after': after, 'setup_before': before})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['id'] for r in response.data['results']], [self.middle.pk])
+
+    def test_setup_date_filter_rejects_garbage(self):
+        response = self.client.get('/api/routes/search/', {'setup_after': 'вчера'})
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_home_page_age_counts(self):
+        response = self.client.get('/')
+
+        self.assertEqual(response.context['new_routes'], 1)
+        self.assertEqual(response.context['old_routes'], 1)
+
+
+class DifficultyRankTests(TestCase):
+    """Ранг сложности: диапазонные фильтры и сортировка"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.routes = {
+            difficulty: make_route(lane, f'Трасса {difficulty}', 'красный', difficulty=difficulty)
+            for lane, difficulty in enumerate(['7a', '-', '6a+', '6b', '5+', '6c+'], start=1)
+        }
+
+    def test_rank_follows_difficulty_levels(self):
+        self.assertLess(self.routes['6a+'].difficulty_rank, self.routes['6b'].difficulty_rank)
+        self.assertLess(self.routes['6c+'].difficulty_rank, self.routes['7a'].difficulty_rank)
+        self.assertIsNone(self.routes['-'].difficulty_rank)
+
+    def test_rank_follows_difficulty_change(self):
+        route = self.routes['5+']
+        route.difficulty = '8a'
+        route.save()
+
+        self.assertEqual(route.difficulty_rank, Route.DIFFICULTY_RANKS['8a'])
+
+    def test_search_range_and_rank_ordering(self):
+        response = self.client.get('/api/routes/search/', {
+            'difficulty_min': '6b',
+            'difficulty_max': '7a',
+            'ordering': 'difficulty',
+        })
+
+        self.assertEqual([r['difficulty'] for r in response.data['results']], ['6b', '6c+', '7a'])
+
+    def test_unknown_grade_sorts_last(self):
+        response = self.client.get('/api/routes/search/', {'ordering': '-difficulty'})
+
+        self.assertEqual(
+            [r['difficulty'] for r in response.data['results']],
+            ['7a', '6c+', '6b', '6a+', '5+', '-'],
+        )
+
+    def test_list_range_filter(self):
+        response = self.client.get('/api/routes/', {'difficulty_max': '6a+'})
+
+        self.assertEqual(sorted(r['difficulty'] for r in response.data['results']), ['5+', '6a+'])
+
+    def test_invalid_range_bound(self):
+        self.assertEqual(self.client.get('/api/routes/search/', {'difficulty_min': '-'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/routes/', {'difficulty_min': '10z'}).status_code, 400)
+
+
+class QueryPlanTests(TestCase):
+    """Запросы основных страниц и endpoints не сканируют таблицу трасс целиком"""
+
+    # Отфильтрованные выборки: каждая таблица читается только поиском по индексу (SEARCH)
+    FILTERED_ENDPOINTS = [
+        '/api/routes/?difficulty=6a',
+        '/api/routes/?author=sasha',
+        '/api/routes/search/?color=krasn',
+        '/api/routes/search/?created_after=2025-01-01T00:00:00%2B03:00',
+    ]
+
+    # Намеренно нефильтрованные ленты и сводки: читают все (активные) трассы,
+    # поэтому допускается SCAN, но только по индексу в нужном порядке
+    UNFILTERED_ENDPOINTS = [
+        '/',
+        '/api/routes/',
+        '/api/routes/?is_active=true',
+        '/api/routes/search/',
+        '/api/routes/authors/',
+        '/api/routes/colors/',
+        '/api/stats/',
+    ]
+
+    def setUp(self):
+        self.client = APIClient()
+        for lane in range(1, 6):
+            make_route(lane, f'Трасса {lane}', 'красный', author=f'Автор {lane}')
+            make_route(lane, f'Вторая {lane}', 'синий', difficulty='6b', is_active=lane % 2 == 0)
+
+    def query_plans(self, queries):
+        """Строки EXPLAIN QUERY PLAN для выборок из таблиц трасс"""
+        plans = []
+        with connection.cursor() as cursor:
+            for query in queries:
+                sql = query['sql']
+                if not sql.startswith('SELECT') or 'routes_route' not in sql:
+                    continue
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plans.extend((row[-1], sql) for row in cursor.fetchall())
+        return plans
+
+    def table_scans(self, queries):
+        """Любой перебор таблицы (SCAN), в том числе по индексу"""
+        return [f'{detail}: {sql}' for detail, sql in self.query_plans(queries) if detail.startswith('SCAN ')]
+
+    def full_scans(self, queries):
+        """Перебор таблицы трасс без индекса"""
+        return [
+            f'{detail}: {sql}' for detail, sql in self.query_plans(queries)
+            if detail.startswith('SCAN routes_route') and ' USING ' not in detail
+        ]
+
+    def test_filtered_endpoints_search_indexes(self):
+        for url in self.FILTERED_ENDPOINTS:
+            with self.subTest(url=url), CaptureQueriesContext(connection) as captured:
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(self.table_scans(captured.captured_queries), [])
+
+    def test_unfiltered_endpoints_scan_indexes(self):
+        for url in self.UNFILTERED_ENDPOINTS:
+            with self.subTest(url=url), CaptureQueriesContext(connection) as captured:
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(self.full_scans(captured.captured_queries), [])
+
+    def test_route_save_uses_indexes(self):
+        with CaptureQueriesContext(connection) as captured:
+            make_route(3, 'Новая', 'зеленый')
+
+        self.assertEqual(self.table_scans(captured.captured_queries), [])
+
+
+class ConcurrentCreateTests(TransactionTestCase):
+    """Параллельное создание трасс из нескольких потоков под блокировкой дорожки"""
+
+    THREADS = 6
+    ATTEMPTS = 5
+    LANES = (31, 32, 33)
+
+    def create_in_parallel(self):
+        """Создать трассы из THREADS потоков на общих дорожках; результаты - (дорожка, ошибка или None)"""
+        results = []
+        results_lock = threading.Lock()
+        barrier = threading.Barrier(self.THREADS)
+
+        def worker(worker_id):
+            barrier.wait()
+            try:
+                for attempt in range(self.ATTEMPTS):
+                    lane = self.LANES[(worker_id + attempt) % len(self.LANES)]
+                    try:
+                        make_route(lane, f'Поток {worker_id}-{attempt}', f'цвет {worker_id}-{attempt}')
+                        result = (lane, None)
+                    except ValidationError as e:
+                        result = (lane, e)
+                    except Exception as e:
+                        result = (lane, f'{type(e).__name__}: {e}')
+                    with results_lock:
+                        results.append(result)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_lane_lock_keeps_numbers_unique_and_capacity(self):
+        results = self.create_in_parallel()
+
+        self.assertEqual(len(results), self.THREADS * self.ATTEMPTS)
+        unexpected = [error for _, error in results if error is not None and not isinstance(error, ValidationError)]
+        self.assertEqual(unexpected, [])
+        for lane in self.LANES:
+            with self.subTest(lane=lane):
+                numbers = list(Route.objects.filter(track_lane=lane).values_list('route_number', flat=True))
+                self.assertEqual(len(numbers), LANE_CAPACITY)
+                self.assertEqual(len(set(numbers)), len(numbers))
+                attempts = [error for result_lane, error in results if result_lane == lane]
+                rejected = [error for error in attempts if error is not None]
+                self.assertEqual(len(rejected), len(attempts) - LANE_CAPACITY)
+                for error in rejected:
+                    self.assertEqual(error.messages, [lane_capacity_message(lane)])
+
+
+class LaneConstraintTests(TestCase):
+    """Правила дорожки, которые обеспечивает сама база данных"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.routes = [
+            make_route(7, name, color)
+            for name, color in [('Первая', 'red'), ('Вторая', 'синий'), ('Третья', 'зеленый'), ('Четвертая', 'желтый')]
+        ]
+        self.other = make_route(8, 'Соседка', 'white')
+
+    def test_queryset_update_cannot_overfill_lane(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Route.objects.filter(pk=self.other.pk).update(track_lane=7)
+
+    def test_queryset_update_cannot_repeat_color(self):
+        blue = make_route(8, 'Другая', 'blue')
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Route.objects.filter(pk=blue.pk).update(color='WHITE')
+
+    def test_cyrillic_color_case_is_folded(self):
+        # lower() в SQLite не меняет регистр кириллицы; ограничение стоит на ключе цвета
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Route.objects.filter(pk=self.other.pk).update(track_lane=7, color='Синий')
+        blue = make_route(8, 'Другая', 'голубой')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Route.objects.filter(pk=blue.pk).update(color='WHITE ')
+        blue.color = 'Белый'
+        self.other.color = 'белый'
+        Route.objects.bulk_update([self.other], ['color'])
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Route.objects.bulk_update([blue], ['color'])
+
+        with mock.patch.object(Route, 'lane_neighbours', return_value=[]):
+            with self.assertRaisesMessage(ValidationError, "На дорожке 8 уже есть трасса с цветом 'БЕЛЫЙ'"):
+                make_route(8, 'Белая', 'БЕЛЫЙ')
+
+    def test_race_is_reported_with_validation_message(self):
+        # Имитируем гонку: проверка в clean() не видит параллельно добавленных трасс
+        with mock.patch.object(Route, 'lane_neighbours', return_value=[]):
+            with self.assertRaisesMessage(ValidationError, 'На дорожке 7 уже максимальное количество трасс (4)'):
+                make_route(7, 'Пятая', 'черный')
+            with self.assertRaisesMessage(ValidationError, "На дорожке 8 уже есть трасса с цветом 'WHITE'"):
+                make_route(8, 'Белая', 'WHITE')
+
+    def test_api_returns_validation_message_on_race(self):
+        with mock.patch.object(Route, 'lane_neighbours', return_value=[]):
+            response = self.client.post('/api/routes/', {
+                'track_lane': 7,
+                'name': 'Пятая',
+                'difficulty': '6a',
+                'color': 'черный',
+                'author': 'Иван Петров',
+                'setup_date': '01.09.2025',
+            }, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'__all__': ['На дорожке 7 уже максимальное количество трасс (4)']})
+
+
+class BulkCreateTests(TestCase):
+    """Массовое создание трасс с проверкой пакета в памяти"""
+
+    def setUp(self):
+        self.client = APIClient()
+        make_route(9, 'Вертикаль', 'красный', difficulty='6b')
+
+    def payload(self, lane, name, color, difficulty='6a'):
+        return {
+            'track_lane': lane,
+            'name': name,
+            'difficulty': difficulty,
+            'color': color,
+            'author': 'Иван Петров',
+            'setup_date': '01.09.2025',
+        }
+
+    def test_batch_uses_constant_number_of_queries(self):
+        routes = [self.payload(lane, f'Трасса {lane}-{i}', color)
+                  for lane in range(20, 30) for i, color in enumerate(['red', 'blue', 'green'])]
+
+        # SAVEPOINT, блокировка дорожек, снимок дорожек, INSERT трасс и начал слов, RELEASE
+        with self.assertNumQueries(6):
+            response = self.client.post('/api/routes/bulk/', {'routes': routes}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['created_routes']), 30)
+        self.assertEqual(
+            list(Route.objects.filter(track_lane=20).order_by('id').values_list('route_number', flat=True)),
+            [77, 78, 79],
+        )
+
+    def test_conflicts_inside_batch_are_reported_per_item(self):
+        routes = [
+            self.payload(9, 'Карниз', 'синий'),
+            self.payload(9, 'Траверс', 'СИНИЙ'),
+            self.payload(10, 'вертикаль ', 'Красный', difficulty='6b'),
+            self.payload(9, 'Третья', 'зеленый'),
+            self.payload(9, 'Четвертая', 'желтый'),
+            self.payload(9, 'Пятая', 'белый'),
+            self.payload(11, '', 'черный'),
+        ]
+
+        response = self.client.post('/api/routes/bulk/', {'routes': routes}, format='json')
+
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([route['name'] for route in response.data['created_routes']], ['Карниз', 'Третья', 'Четвертая'])
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2, 5, 6])
+        errors = response.data['errors']
+        self.assertEqual(errors[0]['errors'], {'__all__': ["На дорожке 9 уже есть трасса с цветом 'СИНИЙ'"]})
+        self.assertIn('смежной дорожке 9: Вертикаль', errors[1]['errors']['__all__'][0])
+        self.assertEqual(errors[2]['errors'], {'__all__': ['На дорожке 9 уже максимальное количество трасс (4)']})
+        self.assertIn('name', errors[3]['errors'])
+        self.assertEqual(
+            sorted(Route.objects.filter(track_lane=9).values_list('route_number', flat=True)),
+            [33, 34, 35, 36],
+        )
+
+    def test_ids_only(self):
+        response = self.client.post(
+            '/api/routes/bulk/?ids_only=true',
+            {'routes': [self.payload(12, 'Карниз', 'синий'), self.payload(12, 'Траверс', 'белый')]},
+            format='json',
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('created_routes', response.data)
+        self.assertEqual(
+            response.data['created_ids'],
+            list(Route.objects.filter(track_lane=12).order_by('id').values_list('id', flat=True)),
+        )
+
+
+class BulkDeleteUpdateTests(TestCase):
+    """Массовое удаление и обновление трасс на уровне множеств"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.routes = [
+            make_route(lane, f'Трасса {lane}-{i}', color)
+            for lane in (13, 14, 15)
+            for i, color in enumerate(['red', 'blue', 'green'])
+        ]
+
+    def numbers(self, lane):
+        return list(Route.objects.filter(track_lane=lane).order_by('id').values_list('route_number', flat=True))
+
+    def test_delete_uses_single_delete_statement(self):
+        ids = [self.routes[0].pk, self.routes[4].pk, 9999]
+
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.delete('/api/routes/bulk/', {'route_ids': ids}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['deleted_count'], 2)
+        self.assertEqual(response.data['not_found_ids'], [9999])
+        deletes = [q['sql'] for q in captured.captured_queries if q['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), 1)
+        self.assertEqual(self.numbers(13), [49, 50])
+        self.assertEqual(self.numbers(14), [53, 54])
+        self.assertEqual(self.numbers(15), [57, 58, 59])
+
+    def test_update_batch_uses_constant_number_of_queries(self):
+        updates = [{'id': route.pk, 'author': 'Анна Смирнова'} for route in self.routes]
+
+        # SAVEPOINT, выборка трасс, блокировка дорожек, снимок, точка сохранения с UPDATE
+        # и заменой начал слов автора (DELETE и INSERT), RELEASE
+        with self.assertNumQueries(10):
+            response = self.client.post('/api/routes/bulk-update/', {'updates': updates}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['updated_routes']), 9)
+        self.assertEqual(Route.objects.filter(author='Анна Смирнова').count(), 9)
+
+    def test_update_reports_errors_per_item(self):
+        first, second = self.routes[0], self.routes[1]
+        updates = [
+            {'id': first.pk, 'name': 'Новое имя', 'difficulty': '7a'},
+            {'id': second.pk, 'color': 'RED'},
+            {'id': 9999, 'name': 'Нет такой'},
+            {'name': 'Без ID'},
+            {'id': second.pk, 'difficulty': 'нет'},
+        ]
+
+        response = self.client.post('/api/routes/bulk-update/', {'updates': updates}, format='json')
+
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([route['name'] for route in response.data['updated_routes']], ['Новое имя'])
+        errors = response.data['errors']
+        self.assertEqual(len(errors), 4)
+        self.assertIn({'data': {'name': 'Без ID'}, 'error': 'Не указан ID трассы'}, errors)
+        self.assertIn({'id': 9999, 'error': 'Трасса не найдена'}, errors)
+        color_error = next(error for error in errors if error.get('data', {}).get('color') == 'RED')
+        self.assertEqual(color_error['errors'], {'__all__': ["На дорожке 13 уже есть трасса с цветом 'RED'"]})
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.name, first.difficulty_rank), ('Новое имя', Route.DIFFICULTY_RANKS['7a']))
+        self.assertEqual(second.color, 'blue')
+
+    def test_update_rejects_fractional_and_duplicate_ids(self):
+        first, second = self.routes[0], self.routes[1]
+        updates = [
+            {'id': first.pk + 0.5, 'name': 'Дробный'},
+            {'id': f'{second.pk}.9', 'name': 'Дробная строка'},
+            {'id': str(second.pk), 'name': 'Строкой'},
+            {'id': second.pk, 'name': 'Повтор'},
+        ]
+
+        response = self.client.post('/api/routes/bulk-update/', {'updates': updates}, format='json')
+
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([route['name'] for route in response.data['updated_routes']], ['Строкой'])
+        self.assertEqual(response.data['errors'], [
+            {'id': first.pk + 0.5, 'error': 'Трасса не найдена'},
+            {'id': f'{second.pk}.9', 'error': 'Трасса не найдена'},
+            {'id': second.pk, 'data': updates[3], 'error': 'Трасса уже указана в этом пакете'},
+        ])
+        first.refresh_from_db()
+        self.assertEqual(first.name, 'Трасса 13-0')
+
+    def test_update_applies_colour_swap_in_request_order(self):
+        red, blue = self.routes[0], self.routes[1]
+        # База проверяет уникальность цвета в порядке id: red получил бы синий раньше, чем blue - белый
+        updates = [{'id': blue.pk, 'color': 'white'}, {'id': red.pk, 'color': 'blue'}]
+
+        response = self.client.post('/api/routes/bulk-update/', {'updates': updates}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            list(Route.objects.filter(pk__in=[red.pk, blue.pk]).order_by('pk').values_list('color', flat=True)),
+            ['blue', 'white'],
+        )
+
+    def test_update_maps_database_conflicts_to_items(self):
+        first, second, other = self.routes[0], self.routes[1], self.routes[3]
+        updates = [{'id': second.pk, 'color': 'red'}, {'id': other.pk, 'name': 'Переименована'}]
+
+        # Снимок не видит конфликта (как при записи в обход блокировки дорожки)
+        with mock.patch.object(LaneSnapshot, 'validate'):
+            response = self.client.post('/api/routes/bulk-update/', {'updates': updates}, format='json')
+
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([route['id'] for route in response.data['updated_routes']], [other.pk])
+        self.assertEqual(response.data['errors'], [{
+            'id': second.pk, 'data': updates[0],
+            'errors': {'__all__': ["На дорожке 13 уже есть трасса с цветом 'red'"]},
+        }])
+        second.refresh_from_db()
+        self.assertEqual(second.color, 'blue')
+
+
+class BulkWhereTests(TestCase):
+    """Массовое изменение трасс по фильтру одним запросом к базе"""
+
+    def setUp(self):
+        self.client = APIClient()
+        for lane in (10, 11, 12, 16):
+            make_route(lane, f'Трасса {lane}', 'red')
+            make_route(lane, f'Вторая {lane}', 'blue', setup_date=date(2025, 3, 1))
+
+    def post(self, payload):
+        return self.client.post('/api/routes/bulk-where/', payload, format='json')
+
+    def test_dry_run_counts_without_changes(self):
+        response = self.post({'filter': {'lane_min': 10, 'lane_max': 15}, 'action': 'delete', 'dry_run': True})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['matched_count'], 6)
+        self.assertEqual(Route.objects.count(), 8)
+
+    def test_update_runs_single_statement(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.post({
+                'filter': {'setup_before': '01.06.2025'},
+                'action': 'update',
+                'fields': {'is_active': False},
+            })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated_count'], 4)
+        self.assertEqual([q['sql'].split()[0] for q in captured.captured_queries], ['UPDATE'])
+        self.assertEqual(Route.objects.filter(is_active=False).count(), 4)
+
+    def test_delete_renumbers_affected_lanes(self):
+        response = self.post({'filter': {'lane_min': 10, 'lane_max': 15, 'color': 'red'}, 'action': 'delete'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['deleted_count'], 3)
+        self.assertEqual(
+            list(Route.objects.filter(track_lane=11).values_list('route_number', flat=True)),
+            [41],
+        )
+        self.assertEqual(Route.objects.filter(track_lane=16).count(), 2)
+
+    def test_rejects_unsafe_requests(self):
+        cases = [
+            {'filter': {}, 'action': 'delete'},
+            {'filter': {'lane_min': 10}, 'action': 'drop'},
+            {'filter': {'lane_min': 'десять'}, 'action': 'delete'},
+            {'filter': {'lane_min': 10}, 'action': 'update', 'fields': {'track_lane': 3}},
+            {'filter': {'lane_min': 10}, 'action': 'update', 'fields': {'setup_date': '2025-01-01'}},
+            # Опечатка в имени параметра и фильтр, из которого ничего не осталось
+            {'filter': {'bogus': 'x'}, 'action': 'delete'},
+            {'filter': {'lane_mn': 10}, 'action': 'update', 'fields': {'is_active': False}},
+            {'filter': {'author': '  ', 'color': ',', 'q': ' '}, 'action': 'delete'},
+            {'filter': {'difficulty': []}, 'action': 'delete'},
+        ]
+        for payload in cases:
+            with self.subTest(payload=payload):
+                self.assertEqual(self.post(payload).status_code, 400)
+        self.assertEqual(Route.objects.filter(is_active=True).count(), 8)
+
+    def test_update_rejects_future_setup_date(self):
+        response = self.post({'filter': {'lane_min': 10}, 'action': 'update', 'fields': {'setup_date': '01.01.2099'}})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'setup_date': ['Дата накрутки не может быть в будущем']})
+        self.assertFalse(Route.objects.filter(setup_date__year=2099).exists())
+
+        response = self.post({'filter': {'lane_min': 16}, 'action': 'update', 'fields': {'setup_date': '01.02.2025'}})
+        self.assertEqual(response.data['updated_count'], 2)
+
+
+class RouteStatsTests(TestCase):
+    """Статистика одним группирующим запросом с кешем по версии данных"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        make_route(17, 'Первая', 'red')
+        make_route(17, 'Вторая', 'blue', difficulty='7a', is_active=False)
+        make_route(18, 'Третья', 'red', difficulty='7a')
+
+    def test_stats_use_one_aggregate_query_and_cache(self):
+        # Версия данных и один группирующий запрос
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/stats/')
+        # Повторный запрос - только версия данных
+        with self.assertNumQueries(1):
+            self.client.get('/api/stats/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_routes'], 3)
+        self.assertEqual(response.data['active_routes'], 2)
+        self.assertEqual(response.data['inactive_routes'], 1)
+        self.assertEqual(response.data['difficulty_distribution']['7a'], {'label': '7a', 'count': 2})
+        self.assertEqual(response.data['difficulty_distribution']['8a']['count'], 0)
+        self.assertEqual(response.data['color_distribution'], {'blue': 1, 'red': 2})
+        self.assertNotIn('lane_distribution', response.data)
+
+    def test_any_write_bumps_data_version(self):
+        self.client.get('/api/stats/')
+
+        Route.objects.filter(track_lane=18).update(is_active=False)
+
+        response = self.client.get('/api/stats/')
+        self.assertEqual(response.data['active_routes'], 1)
+
+    def test_breakdowns(self):
+        response = self.client.get('/api/stats/?breakdown=lane,active')
+
+        self.assertEqual(response.data['lane_distribution'], {17: {'total': 2, 'active': 1}, 18: {'total': 1, 'active': 1}})
+        self.assertEqual(response.data['status_distribution']['inactive'], {'difficulty': {'7a': 1}, 'color': {'blue': 1}})
+        self.assertEqual(self.client.get('/api/stats/?breakdown=author').status_code, 400)
+
+
+class DimensionEndpointsTests(TestCase):
+    """Списки авторов и цветов одним группирующим запросом"""
+
+    def setUp(self):
+        self.client = APIClient()
+        make_route(19, 'Первая', 'red', author='Анна')
+        make_route(19, 'Вторая', 'blue', author='Борис', difficulty='7a', is_active=False)
+        make_route(20, 'Третья', 'red', author='Анна', difficulty='7a')
+        make_route(25, 'Четвертая', 'green', author='Борис')
+
+    def test_authors_single_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/routes/authors/')
+
+        self.assertEqual(response.data, [
+            {'name': 'Анна', 'total_routes': 2, 'active_routes': 2, 'inactive_routes': 0},
+            {'name': 'Борис', 'total_routes': 2, 'active_routes': 1, 'inactive_routes': 1},
+        ])
+
+    def test_colors_accept_route_filters(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/routes/colors/?lane_min=19&lane_max=20&difficulty_min=7a&is_active=true')
+
+        self.assertEqual(response.data, [{'name': 'red', 'total_routes': 1, 'active_routes': 1, 'inactive_routes': 0}])
+        self.assertEqual(self.client.get('/api/routes/colors/?difficulty_min=9z').status_code, 400)
+
+
+class FacetTests(TestCase):
+    """Фасетные счетчики расширенного поиска"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        make_route(21, 'Первая', 'green', author='Анна', difficulty='6b')
+        make_route(21, 'Вторая', 'red', author='Анна', difficulty='6b')
+        make_route(22, 'Третья', 'green', author='Борис', difficulty='7a')
+        make_route(23, 'Четвертая', 'green', author='Анна', difficulty='7a', is_active=False)
+
+    def facets(self, query):
+        return self.client.get(f'/api/routes/search/?facets=true&{query}').data['facets']
+
+    def test_each_facet_ignores_its_own_filter(self):
+        facets = self.facets('author=Анна&color=green&difficulty=6b')
+
+        # Сложность: Анна + green, без фильтра по сложности
+        self.assertEqual(
+            [(item['value'], item['count']) for item in facets['difficulty']],
+            [('6b', 1), ('7a', 1)],
+        )
+        # Цвет: Анна + 6b
+        self.assertEqual(facets['color'], [{'value': 'green', 'count': 1}, {'value': 'red', 'count': 1}])
+        # Автор: green + 6b
+        self.assertEqual(facets['author'], [{'value': 'Анна', 'count': 1}])
+        self.assertEqual(facets['lane'], [{'value': 21, 'count': 1}])
+        self.assertEqual(facets['is_active'], [{'value': True, 'count': 1}])
+
+    def test_facets_are_cached_per_normalized_filter_set(self):
+        self.facets('color=green&is_active=true')
+
+        # Тот же набор фильтров в другом порядке и с посторонними параметрами: без запроса фасетов
+        with CaptureQueriesContext(connection) as captured:
+            facets = self.facets('page_size=5&is_active=True&color=green')
+
+        self.assertFalse(any('GROUP BY' in query['sql'] for query in captured.captured_queries))
+        self.assertEqual(facets['lane'], [{'value': 21, 'count': 1}, {'value': 22, 'count': 1}])
+
+
+class CursorPaginationTests(TestCase):
+    """Курсорная пагинация списка трасс и расширенного поиска"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.routes = []
+        for lane in (26, 27, 28):
+            for i, color in enumerate(['red', 'blue', 'green']):
+                self.routes.append(make_route(
+                    lane, f'Трасса {lane}-{i}', color,
+                    # Часть трасс без даты накрутки: NULL в ключе сортировки
+                    setup_date=None if i == 1 else date(2025, 9, lane - 20),
+                ))
+
+    def walk(self, url, direction='next'):
+        ids = []
+        pages = 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            page_ids = [route['id'] for route in response.data['results']]
+            ids.extend(page_ids if direction == 'next' else reversed(page_ids))
+            url = response.data[direction]
+            pages += 1
+        return ids, pages
+
+    def test_list_pages_follow_default_ordering(self):
+        ids, pages = self.walk('/api/routes/?page_size=4')
+
+        self.assertEqual(pages, 3)
+        self.assertEqual(ids, [route.pk for route in self.routes])
+
+    def test_search_pages_with_nullable_key_forward_and_back(self):
+        expected = list(
+            Route.objects.order_by(F('setup_date').desc(nulls_last=True), '-id').values_list('id', flat=True)
+        )
+
+        ids, _ = self.walk('/api/routes/search/?ordering=-setup_date&page_size=2')
+        self.assertEqual(ids, expected)
+
+        last_page = self.client.get('/api/routes/search/?ordering=-setup_date&page_size=2')
+        while last_page.data['next']:
+            last_page = self.client.get(last_page.data['next'])
+        back_ids, _ = self.walk(last_page.data['previous'], direction='previous')
+        self.assertEqual(list(reversed(back_ids)) + [r['id'] for r in last_page.data['results']], expected)
+
+    def test_deep_page_uses_keyset_without_count(self):
+        first = self.client.get('/api/routes/search/?ordering=name&page_size=3')
+        self.assertNotIn('count', first.data)
+
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(first.data['next'])
+
+        self.assertEqual(len(captured), 1)
+        self.assertNotIn('OFFSET', captured[0]['sql'])
+
+    def test_page_size_cap_and_exact_count(self):
+        response = self.client.get('/api/routes/?page_size=100000&count=exact')
+
+        self.assertEqual(response.data['page_size'], 100)
+        self.assertEqual(response.data['count'], 9)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/routes/search/?cursor=garbage').status_code, 400)
+        next_url = self.client.get('/api/routes/search/?ordering=name&page_size=2').data['next']
+        cursor = parse_qs(urlparse(next_url).query)['cursor'][0]
+        self.assertEqual(self.client.get(f'/api/routes/search/?ordering=author&cursor={cursor}').status_code, 400)
+        self.assertEqual(self.client.get('/api/routes/?cursor=garbage').status_code, 400)
+
+    def test_legacy_page_parameter(self):
+        response = self.client.get('/api/routes/search/?ordering=name&page=2&page_size=4')
+
+        self.assertEqual((response.data['count'], response.data['page'], response.data['total_pages']), (9, 2, 3))
+        self.assertEqual(len(response.data['results']), 4)
+
+    def test_list_rejects_page_parameter(self):
+        response = self.client.get('/api/routes/?page=2')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('cursor', response.data['error'])
+        self.assertIn('count=exact', response.data['error'])
+
+
+class CountModeTests(TestCase):
+    """Режимы подсчета общего количества и кеш счетчиков"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        for lane in (29, 30):
+            make_route(lane, f'Трасса {lane}', 'red')
+            make_route(lane, f'Вторая {lane}', 'blue', is_active=False)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        return response, [q['sql'] for q in captured.captured_queries if 'COUNT(' in q['sql']]
+
+    def test_exact_count_is_cached_per_filter_set_and_version(self):
+        response, counts = self.count_queries('/api/routes/?is_active=true&count=exact')
+        self.assertEqual((response.data['count'], len(counts)), (2, 1))
+
+        # Тот же набор фильтров: счетчик из кеша, в том числе в расширенном поиске
+        response, counts = self.count_queries('/api/routes/search/?count=exact&is_active=True&page_size=1')
+        self.assertEqual((response.data['count'], counts), (2, []))
+
+        Route.objects.filter(track_lane=29).update(is_active=True)
+        response, counts = self.count_queries('/api/routes/?is_active=true&count=exact')
+        self.assertEqual((response.data['count'], len(counts)), (3, 1))
+
+    def test_estimate_uses_last_known_count(self):
+        response = self.client.get('/api/routes/?count=estimate')
+        self.assertEqual((response.data['count'], response.data['count_estimated']), (4, True))
+
+        self.client.get('/api/routes/?count=exact')
+        make_route(31, 'Новая', 'red')
+
+        # Оценка не пересчитывает количество после изменения данных
+        response, counts = self.count_queries('/api/routes/?count=estimate')
+        self.assertEqual((response.data['count'], counts), (4, []))
+
+    def test_no_count_by_default(self):
+        response, counts = self.count_queries('/api/routes/?count=none')
+
+        self.assertNotIn('count', response.data)
+        self.assertEqual(counts, [])
+
+
+class FullTextSearchTests(TestCase):
+    """Полнотекстовый поиск q= по индексу FTS5"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.slab = make_route(32, 'Красная плита', 'желтый', author='Ольга Иванова')
+        self.roof = make_route(32, 'Карниз', 'Красный', author='Пётр Сидоров', description='Длинный карниз над плитой')
+        self.other = make_route(33, 'Траверс', 'синий', author='Анна')
+
+    def search(self, q, **params):
+        response = self.client.get('/api/routes/search/', {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return [route['id'] for route in response.data['results']]
+
+    def test_case_insensitive_cyrillic_across_fields(self):
+        # "красн" совпадает с названием одной трассы и цветом другой, без учета регистра
+        self.assertEqual(sorted(self.search('красн')), sorted([self.slab.pk, self.roof.pk]))
+        self.assertEqual(self.search('СИДОРОВ'), [self.roof.pk])
+        self.assertEqual(self.search('карниз плит'), [self.roof.pk])
+
+    def test_ranked_by_relevance(self):
+        # Совпадение в названии весит больше, чем в описании
+        self.assertEqual(self.search('плит'), [self.slab.pk, self.roof.pk])
+
+    def test_index_follows_writes(self):
+        Route.objects.filter(pk=self.other.pk).update(name='Синяя плита')
+        self.assertIn(self.other.pk, self.search('плита'))
+
+        Route.objects.filter(pk=self.slab.pk).delete()
+        self.assertNotIn(self.slab.pk, self.search('плита'))
+
+    def test_q_in_route_list_and_relevance_cursor(self):
+        response = self.client.get('/api/routes/', {'q': 'анна'})
+        self.assertEqual([route['id'] for route in response.data['results']], [self.other.pk])
+
+        first = self.client.get('/api/routes/search/', {'q': 'плит', 'page_size': 1})
+        second = self.client.get(first.data['next'])
+        self.assertEqual([r['id'] for r in first.data['results'] + second.data['results']], [self.slab.pk, self.roof.pk])
+
+
+class FuzzySearchTests(TestCase):
+    """Нечеткий поиск по триграммному индексу"""
+
+    def setUp(self):
+        fuzzy._indexes.clear()
+        self.client = APIClient()
+        self.vertical = make_route(34, 'Вертикаль', 'red', author='Ольга Иванова')
+        self.coordination = make_route(34, 'Координация', 'blue', author='Пётр Сидоров')
+        self.other = make_route(35, 'Траверс', 'green', author='Анна')
+
+    def search(self, text, **params):
+        response = self.client.get('/api/routes/search/', {'fuzzy': text, **params})
+        self.assertEqual(response.status_code, 200)
+        return [route['id'] for route in response.data['results']]
+
+    def test_typos_are_matched_and_ranked(self):
+        self.assertEqual(self.search('вертекаль'), [self.vertical.pk])
+        self.assertEqual(self.search('кординация'), [self.coordination.pk])
+        # Автор, ё и е не различаются
+        self.assertEqual(self.search('петр сидорв'), [self.coordination.pk])
+        self.assertEqual(self.search('ххх'), [])
+
+    def test_index_catches_up_with_writes(self):
+        self.search('траверс')
+
+        Route.objects.filter(pk=self.other.pk).update(name='Карниз')
+        new = make_route(35, 'Травер', 'white')
+
+        self.assertEqual(self.search('траверс'), [new.pk])
+        self.assertEqual(self.search('карнез'), [self.other.pk])
+
+        Route.objects.filter(pk=new.pk).delete()
+        self.assertEqual(self.search('траверс'), [])
+
+    def test_rebuild_after_change_log_is_pruned(self):
+        index = fuzzy.route_trigram_index()
+        self.assertEqual(index.search('траверс')[0][0], self.other.pk)
+
+        # Журнал очищен дальше версии индекса: индекс перестраивается с нуля
+        Route.objects.filter(pk=self.other.pk).update(name='Карниз')
+        Route.objects.filter(pk=self.vertical.pk).delete()
+        RouteChangeLog.objects.filter(id__lte=index.version).delete()
+
+        self.assertEqual(self.search('карнез'), [self.other.pk])
+        self.assertEqual(self.search('траверс'), [])
+        self.assertEqual(self.search('вертекаль'), [])
+        self.assertEqual(self.search('кординация'), [self.coordination.pk])
+        self.assertEqual(set(index.route_words), {self.other.pk, self.coordination.pk})
+        self.assertEqual(index.version, RouteChangeLog.current_version())
+
+    def test_lookup_cost(self):
+        index = fuzzy.route_trigram_index()
+
+        # Догоняющий запрос к журналу, когда изменений нет
+        with self.assertNumQueries(1):
+            fuzzy.route_trigram_index()
+        self.assertEqual([route_id for route_id, _ in index.search('вертикал')], [self.vertical.pk])
+
+
+class SearchKeyTests(TestCase):
+    """Поиск по автору и цвету без учета регистра, ё, пробелов и алфавита"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.sasha = make_route(26, 'Первая', 'Красный ', author='Саша  Торубарин')
+        self.alex = make_route(25, 'Вторая', 'krasnyy', author='Alex Prikazchikov')
+        self.alex_id = self.alex.pk
+        self.petr = make_route(27, 'Третья', 'синий', author='Пётр Сидоров')
+
+    def search(self, query):
+        response = self.client.get(f'/api/routes/search/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return {route['id'] for route in response.data['results']}
+
+    def test_keys_are_normalized(self):
+        self.assertEqual(search_key('Саша  Торубарин'), 'sasha torubarin')
+        self.assertEqual(search_key(' Alex  Prikazchikov'), search_key('Алекс Приказчиков'))
+        self.assertEqual(search_key('Пётр'), search_key('Петр'))
+        self.assertEqual(search_key('Shchukin'), search_key('Щукин'))
+        self.assertEqual((self.sasha.author_key, self.sasha.color_key), ('sasha torubarin', 'krasnyy'))
+
+    def test_filters_match_across_scripts(self):
+        self.assertEqual(self.search('author=sasha'), {self.sasha.pk})
+        self.assertEqual(self.search('author=Алекс'), {self.alex.pk})
+        self.assertEqual(self.search('author=петр+с'), {self.petr.pk})
+        self.assertEqual(self.search('color=krasn'), {self.sasha.pk, self.alex.pk})
+        self.assertEqual(self.search('color=КРАСН'), {self.sasha.pk, self.alex.pk})
+
+    def test_filters_match_later_words(self):
+        light_green = make_route(24, 'Четвертая', 'Светло-зеленый', author='Мария')
+
+        # Только фамилия, начало фамилии и цвет после дефиса
+        self.assertEqual(self.search('author=Торубарин'), {self.sasha.pk})
+        self.assertEqual(self.search('author=Prikaz'), {self.alex.pk})
+        self.assertEqual(self.search('author=сидоров'), {self.petr.pk})
+        self.assertEqual(self.search('color=зелен'), {light_green.pk})
+        self.assertEqual(self.client.get('/api/stats/?author=Торубарин').data['total_routes'], 1)
+        self.assertIn('Первая', self.client.get('/api/routes/export-csv/?author=Торубарин').getvalue().decode('utf-8'))
+        # Середина слова не подходит
+        self.assertEqual(self.search('author=barin'), set())
+
+    def test_keys_follow_updates(self):
+        bulk_update_routes([{'id': self.petr.pk, 'color': 'Красный'}, {'id': self.sasha.pk, 'author': 'Anna'}])
+        self.client.post('/api/routes/bulk-where/', {
+            'filter': {'author': 'alex'}, 'action': 'update', 'fields': {'author': 'Анна Смирнова'},
+        }, format='json')
+
+        self.assertEqual(self.search('color=красн'), {self.sasha.pk, self.alex.pk, self.petr.pk})
+        self.assertEqual(self.search('author=anna'), {self.sasha.pk, self.alex.pk})
+
+    def test_word_starts_follow_writes(self):
+        self.petr.author = 'Пётр Иванов'
+        self.petr.save()
+        Route.objects.filter(pk=self.sasha.pk).update(author='Мария Торубарина')
+        self.alex.delete()
+
+        self.assertEqual(self.search('author=сидоров'), set())
+        self.assertEqual(self.search('author=иванов'), {self.petr.pk})
+        self.assertEqual(self.search('author=мария'), {self.sasha.pk})
+        # Начала слов удаленной трассы удаляет триггер
+        self.assertFalse(RouteSearchToken.objects.filter(route_id=self.alex_id).exists())
+        self.assertEqual(
+            set(RouteSearchToken.objects.filter(route_id=self.sasha.pk, field='author').values_list('token', flat=True)),
+            {'mariya torubarina', 'torubarina'},
+        )
+
+
+class SuggestTests(TestCase):
+    """Автодополнение названий, авторов и цветов из памяти процесса"""
+
+    def setUp(self):
+        suggest._suggestions.clear()
+        self.client = APIClient()
+        make_route(28, 'Карниз', 'Красный', author='Саша Торубарин')
+        make_route(28, 'Каньон', 'синий', author='Саша Торубарин')
+        make_route(29, 'Кант', 'красный ', author='Alex Prikazchikov')
+        make_route(30, 'Плита', 'krasnyy', author='Анна')
+
+    def suggest(self, query):
+        response = self.client.get(f'/api/routes/suggest/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_completions_are_ranked_and_merged(self):
+        self.assertEqual(self.suggest('q=kr&field=color'), {'color': [{'value': 'krasnyy', 'count': 3}]})
+        self.assertEqual(
+            self.suggest('q=кан&field=name')['name'],
+            [{'value': 'Кант', 'count': 1}, {'value': 'Каньон', 'count': 1}],
+        )
+        data = self.suggest('q=с&limit=1')
+        self.assertEqual(set(data), {'name', 'author', 'color'})
+        self.assertEqual(data['author'], [{'value': 'Саша Торубарин', 'count': 2}])
+        # По началу любого слова и в другом алфавите
+        self.assertEqual(self.suggest('q=тору&field=author')['author'], [{'value': 'Саша Торубарин', 'count': 2}])
+        self.assertEqual(self.suggest('q=алекс&field=author')['author'], [{'value': 'Alex Prikazchikov', 'count': 1}])
+
+    def test_lookups_skip_database(self):
+        self.suggest('q=ка')
+        with self.assertNumQueries(0):
+            self.suggest('q=кар&field=name')
+
+    def test_rebuilt_on_data_change(self):
+        self.suggest('q=ка')
+        make_route(30, 'Карта', 'белый')
+
+        with mock.patch.object(suggest, 'SUGGEST_REFRESH_INTERVAL', 0):
+            names = [item['value'] for item in self.suggest('q=карт&field=name')['name']]
+        self.assertEqual(names, ['Карта'])
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get('/api/routes/suggest/?q=к&field=difficulty')
+        self.assertEqual(response.status_code, 400)
+
+
+class FilterCompilerTests(TestCase):
+    """Общий компилятор фильтров: списки, диапазоны, канонический ключ"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.easy = make_route(1, 'Первая', 'красный', difficulty='6a', author='Саша')
+        self.medium = make_route(2, 'Вторая', 'синий', difficulty='6b', author='Анна')
+        self.hard = make_route(3, 'Третья', 'зеленый', difficulty='7a', author='Sasha', is_active=False)
+
+    def ids(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return {route['id'] for route in response.data['results']}
+
+    def test_multiple_values(self):
+        self.assertEqual(self.ids('/api/routes/?difficulty=6a,6b'), {self.easy.pk, self.medium.pk})
+        self.assertEqual(self.ids('/api/routes/search/?difficulty=6a&difficulty=7a'), {self.easy.pk, self.hard.pk})
+        self.assertEqual(self.ids('/api/routes/?color=krasn,zel'), {self.easy.pk, self.hard.pk})
+        self.assertEqual(self.ids('/api/routes/?track_lane=2,3&lane_min=3'), {self.hard.pk})
+
+    def test_list_and_range_make_one_condition(self):
+        conditions = RouteFilter.compile(QueryDict('difficulty=6a,7a&difficulty_min=6b')).conditions()
+        self.assertEqual(conditions['difficulty'], Q(difficulty__in=['7a']))
+
+        # Пустое пересечение не доходит до базы
+        with self.assertNumQueries(0):
+            self.assertEqual(list(filter_routes(QueryDict('track_lane=1&lane_min=2'))), [])
+
+    def test_canonical_cache_key(self):
+        same = [
+            'difficulty=6b,6a&author=Саша&is_active=true',
+            'is_active=TRUE&author=sasha&difficulty=6a&difficulty=6b&page_size=5',
+            'author=%20САША&difficulty=6a,6b,6a&is_active=1',
+        ]
+        keys = {RouteFilter.compile(QueryDict(query)).cache_key for query in same}
+        self.assertEqual(len(keys), 1)
+        self.assertNotEqual(RouteFilter.compile(QueryDict('difficulty=6a')).cache_key, keys.pop())
+
+    def test_bad_values_are_rejected_everywhere(self):
+        for url in (
+            '/api/routes/?difficulty=6a,9z',
+            '/api/routes/search/?difficulty=9z',
+            '/api/routes/?is_active=maybe',
+            '/api/stats/?lane_min=x',
+            '/api/routes/export-csv/?difficulty=9z',
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 400)
+
+    def test_stats_facets_and_export_share_filters(self):
+        stats = self.client.get('/api/stats/?author=sasha').data
+        self.assertEqual((stats['total_routes'], stats['active_routes']), (2, 1))
+
+        facets = self.client.get('/api/routes/search/?facets=true&difficulty=6a,6b&author=sasha').data['facets']
+        self.assertEqual(facets['difficulty'], [
+            {'value': '6a', 'label': '6a', 'count': 1},
+            {'value': '7a', 'label': '7a', 'count': 1},
+        ])
+
+        export = self.client.get('/api/routes/export-csv/?author=sasha').getvalue().decode('utf-8-sig')
+        self.assertIn('Первая', export)
+        self.assertNotIn('Третья', export)
+        export = self.client.get('/api/routes/export-csv/?author=sasha&is_active=false').getvalue().decode('utf-8-sig')
+        self.assertIn('Третья', export)
+
+
+class SparseFieldsetTests(TestCase):
+    """Параметры fields=/exclude=: только нужные поля в ответе и в запросе к базе"""
+
+    LANE_VIEW = 'track_lane,route_number,difficulty,color'
+
+    def setUp(self):
+        self.client = APIClient()
+        for lane in (4, 5, 6):
+            make_route(lane, f'Трасса {lane}', 'красный', description='Очень длинное описание ' * 20)
+            make_route(lane, f'Вторая {lane}', 'синий', difficulty='6b')
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, [query['sql'] for query in captured.captured_queries if 'routes_route' in query['sql']]
+
+    def test_list_returns_and_selects_requested_fields(self):
+        response, queries = self.get(f'/api/routes/?fields={self.LANE_VIEW}&page_size=2')
+
+        self.assertEqual(list(response.data['results'][0]), ['route_number', 'track_lane', 'difficulty', 'color'])
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('description', queries[0])
+        self.assertNotIn('"name"', queries[0])
+
+        # Курсор следующей страницы строится по загруженному ключу сортировки
+        next_response, queries = self.get(response.data['next'])
+        self.assertEqual(len(next_response.data['results']), 2)
+        self.assertEqual(len(queries), 1)
+
+    def test_search_and_detail(self):
+        response, queries = self.get('/api/routes/search/?exclude=description,difficulty_display&ordering=name')
+        self.assertNotIn('description', response.data['results'][0])
+        self.assertIn('name', response.data['results'][0])
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('description', queries[0])
+
+        response, queries = self.get('/api/routes/search/?fields=id,difficulty_display&page=1')
+        self.assertEqual(list(response.data['results'][0]), ['id', 'difficulty_display'])
+
+        route = Route.objects.first()
+        response, queries = self.get(f'/api/routes/{route.pk}/?fields=id,name')
+        self.assertEqual(response.data, {'id': route.pk, 'name': route.name})
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('description', queries[0])
+
+    def test_unknown_field_is_rejected(self):
+        for url in ('/api/routes/?fields=name,secret', '/api/routes/search/?exclude=secret', '/api/routes/1/?fields=x'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 400)
+
+    def test_write_endpoints_return_requested_fields(self):
+        payload = {'track_lane': 7, 'name': 'Новая', 'difficulty': '6c', 'color': 'белый', 'author': 'Анна', 'setup_date': '01.09.2025'}
+        response = self.client.post('/api/routes/?fields=id,route_number', payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(list(response.data), ['id', 'route_number'])
+        route_id = response.data['id']
+
+        response = self.client.patch(f'/api/routes/{route_id}/?exclude=description,created_at', {'name': 'Другая'}, format='json')
+        self.assertEqual(response.data['name'], 'Другая')
+        self.assertNotIn('description', response.data)
+        self.assertNotIn('created_at', response.data)
+
+        response = self.client.post(f'/api/routes/{route_id}/toggle-active/?fields=is_active')
+        self.assertEqual(response.data['route'], {'is_active': False})
+
+        response = self.client.post('/api/routes/bulk/?fields=name', {'routes': [dict(payload, name='Пакет', color='серый')]}, format='json')
+        self.assertEqual(response.data['created_routes'], [{'name': 'Пакет'}])
+
+        response = self.client.post('/api/routes/bulk-update/?fields=id,author', {
+            'updates': [{'id': route_id, 'author': 'Мария'}],
+        }, format='json')
+        self.assertEqual(response.data['updated_routes'], [{'id': route_id, 'author': 'Мария'}])
+
+    def test_write_endpoints_reject_unknown_field_before_writing(self):
+        route = Route.objects.first()
+        payload = {'track_lane': 7, 'name': 'Новая', 'difficulty': '6c', 'color': 'белый', 'author': 'Анна', 'setup_date': '01.09.2025'}
+        for method, url, data in [
+            ('post', '/api/routes/?fields=secret', payload),
+            ('patch', f'/api/routes/{route.pk}/?fields=secret', {'name': 'Другая'}),
+            ('post', f'/api/routes/{route.pk}/toggle-active/?exclude=secret', {}),
+            ('post', '/api/routes/bulk/?fields=secret', {'routes': [payload]}),
+            ('post', '/api/routes/bulk-update/?fields=secret', {'updates': [{'id': route.pk, 'name': 'Другая'}]}),
+        ]:
+            with self.subTest(url=url):
+                self.assertEqual(getattr(self.client, method)(url, data, format='json').status_code, 400)
+        route.refresh_from_db()
+        self.assertEqual((route.name, route.is_active), ('Трасса 4', True))
+        self.assertFalse(Route.objects.filter(name='Новая').exists())
+
+
+class RouteReadSerializerTests(TestCase):
+    """Быстрая сериализация списков совпадает с RouteSerializer байт в байт"""
+
+    def setUp(self):
+        self.client = APIClient()
+        make_route(7, 'Первая', 'красный', difficulty='6a+', description='Описание "в кавычках"')
+        make_route(7, 'Без даты', 'синий', difficulty='-', setup_date=None, description=None)
+        make_route(8, 'Неактивная', 'белый', difficulty='8c', is_active=False)
+        Route.objects.filter(name='Первая').update(created_at=timezone.now().replace(microsecond=0))
+
+    def assert_same_json(self, fields=None):
+        queryset = Route.objects.order_by('id')
+        expected = JSONRenderer().render(RouteSerializer(queryset, many=True, fields=fields).data)
+        actual = JSONRenderer().render(RouteReadSerializer(fields).data(queryset))
+        self.assertEqual(actual, expected)
+
+    def test_parity_with_model_serializer(self):
+        self.assert_same_json()
+        self.assert_same_json(['track_lane', 'route_number', 'difficulty_display', 'color'])
+        self.assert_same_json(['id', 'created_at', 'setup_date'])
+
+    def test_list_endpoints_use_values_rows(self):
+        expected = JSONRenderer().render(RouteSerializer(Route.objects.all(), many=True).data)
+        response = self.client.get('/api/routes/')
+        self.assertEqual(JSONRenderer().render(response.data['results']), expected)
+
+        with mock.patch.object(Route, '__init__', side_effect=AssertionError('экземпляр модели')):
+            self.assertEqual(self.client.get('/api/routes/search/?ordering=name').status_code, 200)
+            self.assertEqual(self.client.get('/api/routes/search/?page=1').status_code, 200)
+
+
+class RendererTests(TestCase):
+    """orjson и MessagePack: те же данные, что и у стандартного JSONRenderer"""
+
+    PAYLOAD = {
+        'name': 'Трасса "Север" ',
+        'created_at': datetime(2025, 9, 1, 12, 30, 15, 123000, tzinfo=dt_timezone.utc),
+        'setup_date': date(2025, 9, 1),
+        'grade': Decimal('6.5'),
+        'lanes': {1: {'total': 2}, 35: {'total': 0}},
+        'items': [ErrorDetail('Ошибка'), None, True, 1.5],
+    }
+
+    def test_orjson_output_matches_json_renderer(self):
+        self.assertEqual(renderers.ORJSONRenderer().render(self.PAYLOAD), JSONRenderer().render(self.PAYLOAD))
+        # С отступами - стандартный кодировщик
+        indented = renderers.ORJSONRenderer().render(self.PAYLOAD, 'application/json; indent=2')
+        self.assertEqual(indented, JSONRenderer().render(self.PAYLOAD, 'application/json; indent=2'))
+
+    def test_endpoints_render_and_parse_with_orjson(self):
+        make_route(9, 'Первая', 'красный')
+        client = APIClient()
+        self.assertEqual(client.get('/api/routes/').data['results'][0]['name'], 'Первая')
+
+        response = client.post(
+            '/api/routes/bulk/', '{"routes": [{"track_lane": 9, "name": "Вторая", "difficulty": "6a", '
+            '"color": "синий", "author": "Анна", "setup_date": "01.09.2025"}]}',
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created_routes'][0]['name'], 'Вторая')
+
+        with self.assertRaises(ParseError):
+            renderers.ORJSONParser().parse(BytesIO(b'{"routes": ['))
+
+    def test_msgpack_round_trip(self):
+        msgpack = renderers.msgpack
+        make_route(9, 'Первая', 'красный')
+        client = APIClient()
+
+        response = client.get('/api/routes/', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content)['results'][0]['name'], 'Первая')
+
+        body = msgpack.packb({'routes': [{
+            'track_lane': 9, 'name': 'Вторая', 'difficulty': '6a', 'color': 'синий',
+            'author': 'Анна', 'setup_date': '01.09.2025',
+        }]})
+        response = client.post('/api/routes/bulk/', body, content_type='application/msgpack')
+        self.assertEqual(response.status_code, 201)
+
+
+class CompactRoutesTests(TestCase):
+    """Компактная выгрузка трасс по колонкам со словарями авторов и цветов"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        make_route(12, 'Первая', 'красный', author='Анна')
+        make_route(11, 'Вторая', 'синий', difficulty='7a', author='Борис', setup_date=None)
+        make_route(12, 'Третья', 'синий', difficulty='-', author='Анна')
+        make_route(11, 'Снятая', 'зеленый', author='Вера', is_active=False)
+
+    def decode(self, data):
+        """Колонки обратно в строки трасс"""
+        columns = data['columns']
+        return [
+            (
+                columns['lane'][index], data['grades'][columns['grade'][index]],
+                data['colors'][columns['color'][index]], data['authors'][columns['author'][index]],
+                columns['name'][index], columns['setup'][index],
+            )
+            for index in range(data['count'])
+        ]
+
+    def test_columns_and_dictionaries(self):
+        # Версия данных и один запрос values_list; повторно - только версия
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/routes/compact/')
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/routes/compact/').data, response.data)
+
+        data = response.data
+        self.assertEqual(data['authors'], ['Анна', 'Борис'])
+        self.assertEqual(data['colors'], ['красный', 'синий'])
+        self.assertEqual(data['grades'][0], '-')
+        self.assertEqual(data['grades'][Route.DIFFICULTY_RANKS['7a']], '7a')
+        setup_day = (date(2025, 9, 1) - date(1970, 1, 1)).days
+        self.assertEqual(self.decode(data), [
+            (11, '7a', 'синий', 'Борис', 'Вторая', None),
+            (12, '6a', 'красный', 'Анна', 'Первая', setup_day),
+            (12, '-', 'синий', 'Анна', 'Третья', setup_day),
+        ])
+        active = Route.objects.filter(is_active=True).order_by('track_lane', 'route_number')
+        self.assertEqual(data['columns']['id'], list(active.values_list('id', flat=True)))
+        self.assertEqual(data['columns']['number'], list(active.values_list('route_number', flat=True)))
+
+    def test_filters(self):
+        response = self.client.get('/api/routes/compact/?is_active=false')
+        self.assertEqual(self.decode(response.data)[0][4], 'Снятая')
+        self.assertEqual(response.data['authors'], ['Вера'])
+
+        response = self.client.get('/api/routes/compact/?author=anna&difficulty_min=6a')
+        self.assertEqual([row[4] for row in self.decode(response.data)], ['Первая'])
+
+        response = self.client.get('/api/routes/compact/?track_lane=99')
+        self.assertEqual(response.data['count'], 0)
+        self.assertEqual(response.data['columns']['id'], [])
+
+        self.assertEqual(self.client.get('/api/routes/compact/?difficulty_min=9z').status_code, 400)
+
+
+class CSVExportTests(TestCase):
+    """Потоковый экспорт трасс в CSV"""
+
+    def setUp(self):
+        self.client = APIClient()
+        make_route(14, 'Первая', 'красный', description='Стартовая зацепка; "мизер"')
+        make_route(14, 'Вторая', 'синий', setup_date=None)
+        make_route(15, 'Снятая', 'зеленый', is_active=False)
+
+    def export(self, query=''):
+        response = self.client.get(f'/api/routes/export-csv/{query}')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, response.getvalue().decode('utf-8')
+
+    def filename(self, response):
+        # Заголовок с кириллицей Django кодирует по RFC 2047
+        return str(make_header(decode_header(response['Content-Disposition'])))
+
+    def test_stream_keeps_bom_headers_and_filename(self):
+        # COUNT для имени файла и выборка строк порциями
+        with self.assertNumQueries(2):
+            response, content = self.export()
+
+        self.assertTrue(content.startswith('\ufeff№ Трассы,Дорожка,Название,Сложность,Цвет,Автор,Дата накрутки,Описание\r\n'))
+        lines = content.lstrip('\ufeff').splitlines()
+        self.assertEqual(len(lines), 3)
+        first = Route.objects.get(name='Первая')
+        self.assertEqual(
+            lines[1],
+            f'{first.route_number},14,Первая,6a,красный,Иван Петров,01.09.2025,"Стартовая зацепка; ""мизер"""'
+        )
+        self.assertTrue(lines[2].endswith(',Вторая,6a,синий,Иван Петров,,'))
+        self.assertRegex(self.filename(response), r'filename="traссы_2_шт_\d{8}\.csv"')
+
+    def test_inactive_routes_and_filters(self):
+        response, content = self.export('?include_inactive=true')
+        self.assertIn('Снятая', content)
+        self.assertIn('traссы_3_шт_', self.filename(response))
+
+        _, content = self.export('?include_inactive=true&track_lane=15')
+        self.assertEqual(content.lstrip('\ufeff').splitlines()[1:], [
+            f'{Route.objects.get(name="Снятая").route_number},15,Снятая,6a,зеленый,Иван Петров,01.09.2025,'
+        ])
+
+        self.assertEqual(self.client.get('/api/routes/export-csv/?include_inactive=maybe').status_code, 400)
@@ -0,0 +1,204 @@
+"""
+Триггеры базы данных для таблицы трасс.
+
+Django при изменении схемы в SQLite пересоздает таблицу, и триггеры при этом
+удаляются, поэтому они устанавливаются заново после каждой миграции
+(сигнал post_migrate, см. RoutesConfig.ready).
+"""
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .models import CHANGE_LOG_RETENTION, LANE_CAPACITY, LANE_CAPACITY_ERROR
+
+# Старые строки журнала изменений удаляются раз в столько записей
+CHANGE_LOG_PRUNE_EVERY = 1000
+
+# СУБД, для которых устанавливаются триггеры (и ведется журнал изменений трасс)
+TRIGGER_VENDORS = ('sqlite', 'postgresql')
+
+# Таблицы, без которых триггеры не устанавливаются (миграции еще не применены)
+TRIGGER_TABLES = ('routes_route', 'routes_routechangelog', 'routes_routesearchtoken')
+
+SQLITE_TRIGGERS = [
+    # Вместимость дорожки при добавлении трассы
+    ('route_lane_capacity_insert', f"""
+        CREATE TRIGGER route_lane_capacity_insert
+        BEFORE INSERT ON routes_route
+        WHEN (SELECT COUNT(*) FROM routes_route WHERE track_lane = NEW.track_lane) >= {LANE_CAPACITY}
+        BEGIN
+            SELECT RAISE(ABORT, '{LANE_CAPACITY_ERROR}');
+        END
+    """),
+    # Вместимость дорожки при переносе трассы на другую дорожку
+    ('route_lane_capacity_update', f"""
+        CREATE TRIGGER route_lane_capacity_update
+        BEFORE UPDATE OF track_lane ON routes_route
+        WHEN NEW.track_lane IS NOT OLD.track_lane
+            AND (SELECT COUNT(*) FROM routes_route WHERE track_lane = NEW.track_lane) >= {LANE_CAPACITY}
+        BEGIN
+            SELECT RAISE(ABORT, '{LANE_CAPACITY_ERROR}');
+        END
+    """),
+    # Журнал изменений трасс (версия данных для кешей)
+    ('route_change_log_insert', """
+        CREATE TRIGGER route_change_log_insert
+        AFTER INSERT ON routes_route
+        BEGIN
+            INSERT INTO routes_routechangelog (route_id, action) VALUES (NEW.id, 'I');
+        END
+    """),
+    ('route_change_log_update', """
+        CREATE TRIGGER route_change_log_update
+        AFTER UPDATE ON routes_route
+        BEGIN
+            INSERT INTO routes_routechangelog (route_id, action) VALUES (NEW.id, 'U');
+        END
+    """),
+    ('route_change_log_delete', """
+        CREATE TRIGGER route_change_log_delete
+        AFTER DELETE ON routes_route
+        BEGIN
+            INSERT INTO routes_routechangelog (route_id, action) VALUES (OLD.id, 'D');
+        END
+    """),
+    # Начала слов ключей поиска удаляются вместе с трассой (в т.ч. при QuerySet.delete())
+    ('route_search_token_delete', """
+        CREATE TRIGGER route_search_token_delete
+        AFTER DELETE ON routes_route
+        BEGIN
+            DELETE FROM routes_routesearchtoken WHERE route_id = OLD.id;
+        END
+    """),
+    ('route_change_log_prune', f"""
+        CREATE TRIGGER route_change_log_prune
+        AFTER INSERT ON routes_routechangelog
+        WHEN NEW.id % {CHANGE_LOG_PRUNE_EVERY} = 0
+        BEGIN
+            DELETE FROM routes_routechangelog WHERE id <= NEW.id - {CHANGE_LOG_RETENTION};
+        END
+    """),
+]
+
+# Синхронизация полнотекстового индекса FTS5 (таблица создается миграцией 0015,
+# только если SQLite собран с FTS5)
+SQLITE_FTS_TABLE = 'routes_route_fts'
+SQLITE_FTS_TRIGGERS = [
+    ('route_fts_insert', """
+        CREATE TRIGGER route_fts_insert
+        AFTER INSERT ON routes_route
+        BEGIN
+            INSERT INTO routes_route_fts (rowid, name, author, color, description)
+            VALUES (NEW.id, NEW.name, NEW.author, NEW.color, NEW.description);
+        END
+    """),
+    ('route_fts_delete', """
+        CREATE TRIGGER route_fts_delete
+        AFTER DELETE ON routes_route
+        BEGIN
+            INSERT INTO routes_route_fts (routes_route_fts, rowid, name, author, color, description)
+            VALUES ('delete', OLD.id, OLD.name, OLD.author, OLD.color, OLD.description);
+        END
+    """),
+    ('route_fts_update', """
+        CREATE TRIGGER route_fts_update
+        AFTER UPDATE OF name, author, color, description ON routes_route
+        BEGIN
+            INSERT INTO routes_route_fts (routes_route_fts, rowid, name, author, color, description)
+            VALUES ('delete', OLD.id, OLD.name, OLD.author, OLD.color, OLD.description);
+            INSERT INTO routes_route_fts (rowid, name, author, color, description)
+            VALUES (NEW.id, NEW.name, NEW.author, NEW.color, NEW.description);
+        END
+    """),
+]
+
+POSTGRESQL_FUNCTIONS = [
+    # Блокировка по номеру дорожки сериализует параллельные вставки на одну дорожку
+    f"""
+        CREATE OR REPLACE FUNCTION route_lane_capacity_guard() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' OR NEW.track_lane IS DISTINCT FROM OLD.track_lane THEN
+                PERFORM pg_advisory_xact_lock(hashtext('routes_route.track_lane'), NEW.track_lane);
+                IF (SELECT COUNT(*) FROM routes_route WHERE track_lane = NEW.track_lane) >= {LANE_CAPACITY} THEN
+                    RAISE EXCEPTION '{LANE_CAPACITY_ERROR}' USING ERRCODE = 'check_violation';
+                END IF;
+            END IF;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+    """,
+    # Журнал изменений трасс (версия данных для кешей)
+    f"""
+        CREATE OR REPLACE FUNCTION route_change_log_record() RETURNS trigger AS $$
+        DECLARE
+            log_id bigint;
+        BEGIN
+            INSERT INTO routes_routechangelog (route_id, action)
+            VALUES (CASE WHEN TG_OP = 'DELETE' THEN OLD.id ELSE NEW.id END, LEFT(TG_OP, 1))
+            RETURNING id INTO log_id;
+            IF log_id % {CHANGE_LOG_PRUNE_EVERY} = 0 THEN
+                DELETE FROM routes_routechangelog WHERE id <= log_id - {CHANGE_LOG_RETENTION};
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """,
+    # Начала слов ключей поиска удаляются вместе с трассой
+    """
+        CREATE OR REPLACE FUNCTION route_search_token_cleanup() RETURNS trigger AS $$
+        BEGIN
+            DELETE FROM routes_routesearchtoken WHERE route_id = OLD.id;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """,
+]
+
+POSTGRESQL_TRIGGERS = [
+    ('route_lane_capacity', """
+        CREATE TRIGGER route_lane_capacity
+        BEFORE INSERT OR UPDATE OF track_lane ON routes_route
+        FOR EACH ROW EXECUTE FUNCTION route_lane_capacity_guard()
+    """),
+    ('route_change_log', """
+        CREATE TRIGGER route_change_log
+        AFTER INSERT OR UPDATE OR DELETE ON routes_route
+        FOR EACH ROW EXECUTE FUNCTION route_change_log_record()
+    """),
+    ('route_search_token_cleanup', """
+        CREATE TRIGGER route_search_token_cleanup
+        AFTER DELETE ON routes_route
+        FOR EACH ROW EXECUTE FUNCTION route_search_token_cleanup()
+    """),
+]
+
+
+def install_route_triggers(using=DEFAULT_DB_ALIAS, **kwargs):
+    """Пересоздать триггеры таблицы трасс (идемпотентно)"""
+    connection = connections[using]
+    if connection.vendor == 'sqlite':
+        functions, triggers = [], SQLITE_TRIGGERS
+        drop_sql = 'DROP TRIGGER IF EXISTS {name}'
+    elif connection.vendor == 'postgresql':
+        functions, triggers = POSTGRESQL_FUNCTIONS, POSTGRESQL_TRIGGERS
+        drop_sql = 'DROP TRIGGER IF EXISTS {name} ON routes_route'
+    else:
+        # Для остальных СУБД правила дорожки проверяются только в Route.clean(),
+        # а журнал изменений не ведется (версия данных не меняется)
+        return
+
+    table_names = set(connection.introspection.table_names())
+    if not set(TRIGGER_TABLES) <= table_names:
+        return
+    fts_enabled = connection.vendor == 'sqlite' and SQLITE_FTS_TABLE in table_names
+    if fts_enabled:
+        triggers = triggers + SQLITE_FTS_TRIGGERS
+
+    with connection.cursor() as cursor:
+        for sql in functions:
+            cursor.execute(sql)
+        for name, sql in triggers:
+            cursor.execute(drop_sql.format(name=name))
+            cursor.execute(sql)
+        if fts_enabled:
+            # Пока триггеров не было (пересоздание таблицы в миграции), индекс мог разойтись с данными
+            cursor.execute(f"INSERT INTO {SQLITE_FTS_TABLE} ({SQLITE_FTS_TABLE}) VALUES ('rebuild')")
@@ -9,9 +9,12 @@ urlpatterns = [
     # Массовые операции
     path('routes/bulk/', views.RouteBulkOperationsView.as_view(), name='route-bulk-operations'),
     path('routes/bulk-update/', views.route_bulk_update, name='route-bulk-update'),
+    path('routes/bulk-where/', views.route_bulk_where, name='route-bulk-where'),
     
     # Дополнительные endpoints
     path('routes/search/', views.route_search, name='route-search'),
+    path('routes/suggest/', views.route_suggest, name='route-suggest'),
+    path('routes/compact/', views.route_compact, name='route-compact'),
     path('routes/authors/', views.route_authors, name='route-authors'),
     path('routes/colors/', views.route_colors, name='route-colors'),
     path('routes/<int:pk>/toggle-active/', views.route_toggle_active, name='route-toggle-active'),
@@ -2,71 +2,110 @@ from rest_framework import generics, status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from django.db.models import Q
-from django.db import transaction
+from django.db import IntegrityError, transaction
 from django.core.exceptions import ValidationError
 from django.shortcuts import render, redirect
 from django.contrib import messages
 from django.utils import timezone
 import logging
 import csv
-from datetime import datetime
-from django.http import HttpResponse
+from datetime import datetime, timedelta
+from django.http import HttpResponse, StreamingHttpResponse
 from .models import Route, AdminUser
-from .serializers import RouteSerializer
+from .serializers import (
+    FieldsetError, RouteReadSerializer, RouteSerializer, requested_fields, route_model_fields,
+)
+from .filters import FILTER_PARAMS, RouteFilter, RouteFilterError, filter_routes, parse_flag
+from .pagination import DEFAULT_ORDERING, SEARCH_ORDERINGS, InvalidCursor, RouteCursorPagination, filtered_count
+from .fuzzy import fuzzy_similarity
+from .search import relevance, search_terms
+from .suggest import SUGGEST_FIELDS, SUGGEST_LIMIT, SUGGEST_MAX_LIMIT, route_suggestions
+from .compact import cached_compact_routes
+from .stats import STATS_BREAKDOWNS, cached_facets, cached_route_stats, dimension_counts
+from .bulk import (
+    FILTER_UPDATE_FIELDS, bulk_create_routes, bulk_delete_routes, bulk_update_routes, delete_routes_where,
+    filter_update_values, validation_errors,
+)
 # from .google_sheets import RoutesGoogleSheetsSync  # Отключено, используем SQLite
 
 logger = logging.getLogger(__name__)
 
+# Сколько трасс читать из базы за раз при потоковом экспорте CSV
+CSV_EXPORT_CHUNK_SIZE = 2000
+
+def only_requested_fields(queryset, request, extra=()):
+    """Загружать из базы только поля, нужные ответу с fields=/exclude=
+
+    ``extra`` - другие поля, нужные представлению. Без fields=/exclude=
+    выборка не меняется.
+    """
+    fields = requested_fields(request.query_params)
+    if fields is None:
+        return queryset
+    return queryset.only(*route_model_fields(fields, extra))
+
+
+def setup_age_counts(routes):
+    """Количество новых (не старше 30 дней) и старых (старше 90 дней) трасс
+
+    Оба подсчета - индексные условия по дате накрутки.
+    """
+    today = timezone.localdate()
+    new_routes = routes.filter(setup_date__gte=today - timedelta(days=30)).count()
+    old_routes = routes.filter(setup_date__lt=today - timedelta(days=90)).count()
+    return new_routes, old_routes
+
 
 class RouteListCreateView(generics.ListCreateAPIView):
     """Представление для получения списка трасс и создания новой трассы"""
     queryset = Route.objects.all()
     serializer_class = RouteSerializer
+    pagination_class = RouteCursorPagination
 
     def get_queryset(self):
         """Фильтрация трасс по параметрам запроса"""
         try:
-            queryset = Route.objects.all()
-            
-            # Фильтр по сложности
-            difficulty = self.request.query_params.get('difficulty', None)
-            if difficulty:
-                if difficulty not in [choice[0] for choice in Route.DifficultyLevel.choices]:
-                    logger.warning(f"Некорректный уровень сложности: {difficulty}")
-                    return Route.objects.none()
-                queryset = queryset.filter(difficulty=difficulty)
-            
-            # Фильтр по автору
-            author = self.request.query_params.get('author', None)
-            if author:
-                queryset = queryset.filter(author__icontains=author)
-            
-            # Фильтр по цвету
-            color = self.request.query_params.get('color', None)
-            if color:
-                queryset = queryset.filter(color__icontains=color)
-            
-            # Фильтр по активности
-            is_active = self.request.query_params.get('is_active', None)
-            if is_active is not None:
-                queryset = queryset.filter(is_active=is_active.lower() == 'true')
-            
-            # Поиск по названию
-            search = self.request.query_params.get('search', None)
-            if search:
-                queryset = queryset.filter(name__icontains=search)
-            
+            queryset = filter_routes(self.request.query_params)
             logger.info(f"Выполнен поиск трасс с параметрами: {self.request.query_params}")
             return queryset
-            
+
+        except RouteFilterError:
+            raise
         except Exception as e:
             logger.error(f"Ошибка при получении списка трасс: {str(e)}")
             return Route.objects.none()
 
+    def list(self, request, *args, **kwargs):
+        """Список трасс из строк values() (RouteReadSerializer) с fields=/exclude=
+
+        Некорректный фильтр или поле - 400, как в расширенном поиске. Номера
+        страниц (page) список больше не принимает: без ошибки прежний клиент
+        молча получал бы первую страницу снова и снова.
+        """
+        if self.paginator.page_query_param in request.query_params:
+            return Response(
+                {'error': 'Список трасс листается курсором: переходите по ссылкам next/previous '
+                          '(параметр cursor), размер страницы - page_size, общее количество - count=exact'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            reader = RouteReadSerializer(requested_fields(request.query_params))
+            queryset = self.filter_queryset(self.get_queryset())
+            routes = self.paginator.paginate_queryset(
+                reader.rows(queryset, extra=self.paginator.key_names), request, view=self
+            )
+            return self.paginator.get_paginated_response(reader.serialize(routes))
+        except (RouteFilterError, FieldsetError) as e:
+            logger.warning(str(e))
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
     def create(self, request, *args, **kwargs):
-        """Создание новой трассы с логированием"""
+        """Создание новой трассы с логированием (fields=/exclude= - поля ответа)"""
         try:
+            try:
+                fields = requested_fields(request.query_params)
+            except FieldsetError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
             serializer = self.get_serializer(data=request.data)
             if serializer.is_valid():
                 try:
@@ -75,7 +114,7 @@ class RouteListCreateView(generics.ListCreateAPIView):
                     logger.warning(f"Ошибка валидации модели при создании трассы: {ve.message_dict if hasattr(ve, 'message_dict') else str(ve)}")
                     return Response(getattr(ve, 'message_dict', {'__all__': [str(ve)]}), status=status.HTTP_400_BAD_REQUEST)
                 logger.info(f"Создана новая трасса: {route.name} (ID: {route.id})")
-                return Response(serializer.data, status=status.HTTP_201_CREATED)
+                return Response(RouteSerializer(route, fields=fields).data, status=status.HTTP_201_CREATED)
             else:
                 logger.warning(f"Ошибка валидации при создании трассы: {serializer.errors}")
                 return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -96,11 +135,17 @@ class RouteDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = RouteSerializer
 
     def retrieve(self, request, *args, **kwargs):
-        """Получение конкретной трассы с логированием"""
+        """Получение конкретной трассы с логированием (fields=/exclude= - только нужные поля)"""
         try:
+            try:
+                fields = requested_fields(request.query_params)
+            except FieldsetError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            if fields is not None:
+                self.queryset = only_requested_fields(self.get_queryset(), request, extra=['name'])
             instance = self.get_object()
             logger.info(f"Запрошена трасса: {instance.name} (ID: {instance.id})")
-            serializer = self.get_serializer(instance)
+            serializer = self.get_serializer(instance, fields=fields)
             return Response(serializer.data)
         except Route.DoesNotExist:
             logger.warning(f"Трасса с ID {kwargs.get('pk')} не найдена")
@@ -116,8 +161,12 @@ class RouteDetailView(generics.RetrieveUpdateDestroyAPIView):
             )
 
     def update(self, request, *args, **kwargs):
-        """Обновление трассы с логированием"""
+        """Обновление трассы с логированием (fields=/exclude= - поля ответа)"""
         try:
+            try:
+                fields = requested_fields(request.query_params)
+            except FieldsetError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
             instance = self.get_object()
             serializer = self.get_serializer(instance, data=request.data, partial=kwargs.get('partial', False))
             if serializer.is_valid():
@@ -127,7 +176,7 @@ class RouteDetailView(generics.RetrieveUpdateDestroyAPIView):
                     logger.warning(f"Ошибка валидации модели при обновлении трассы: {ve.message_dict if hasattr(ve, 'message_dict') else str(ve)}")
                     return Response(getattr(ve, 'message_dict', {'__all__': [str(ve)]}), status=status.HTTP_400_BAD_REQUEST)
                 logger.info(f"Обновлена трасса: {route.name} (ID: {route.id})")
-                return Response(serializer.data)
+                return Response(RouteSerializer(route, fields=fields).data)
             else:
                 logger.warning(f"Ошибка валидации при обновлении трассы: {serializer.errors}")
                 return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -153,10 +202,10 @@ class RouteDetailView(generics.RetrieveUpdateDestroyAPIView):
             instance = self.get_object()
             route_name = instance.name
             route_id = instance.id
-            instance.delete()
-            
-            # Перенумеровываем оставшиеся трассы
-            Route.renumber_routes()
+            with transaction.atomic():
+                instance.delete()
+                # Перенумеровываем оставшиеся трассы только на затронутой дорожке
+                Route.renumber_routes(lanes=[instance.track_lane])
             logger.info(f"Удалена трасса: {route_name} (ID: {route_id}) и выполнена перенумерация")
             return Response(status=status.HTTP_204_NO_CONTENT)
         except Route.DoesNotExist:
@@ -185,39 +234,35 @@ def difficulty_levels(request):
 
 @api_view(['GET'])
 def route_stats(request):
-    """API endpoint для получения статистики по трассам"""
-    total_routes = Route.objects.count()
-    active_routes = Route.objects.filter(is_active=True).count()
-    
-    difficulty_stats = {}
-    for choice in Route.DifficultyLevel.choices:
-        count = Route.objects.filter(difficulty=choice[0]).count()
-        difficulty_stats[choice[0]] = {
-            'label': choice[1],
-            'count': count
-        }
-    
-    color_stats = {}
-    colors = Route.objects.values_list('color', flat=True).distinct()
-    for color in colors:
-        count = Route.objects.filter(color=color).count()
-        color_stats[color] = count
-    
-    return Response({
-        'total_routes': total_routes,
-        'active_routes': active_routes,
-        'inactive_routes': total_routes - active_routes,
-        'difficulty_distribution': difficulty_stats,
-        'color_distribution': color_stats
-    })
+    """API endpoint для получения статистики по трассам
+
+    Параметр breakdown (через запятую): lane - распределение по дорожкам,
+    active - распределения отдельно для активных и неактивных трасс.
+    Принимает те же фильтры, что и список трасс.
+    """
+    breakdowns = [value.strip() for value in request.query_params.get('breakdown', '').split(',') if value.strip()]
+    unknown = [value for value in breakdowns if value not in STATS_BREAKDOWNS]
+    if unknown:
+        return Response(
+            {'error': f'Неизвестный разрез статистики: {", ".join(unknown)}. Доступны: {", ".join(STATS_BREAKDOWNS)}'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        return Response(cached_route_stats(breakdowns, request.query_params))
+    except RouteFilterError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
 class RouteBulkOperationsView(APIView):
     """Представление для массовых операций с трассами"""
 
     def post(self, request):
-        """Массовое создание трасс"""
+        """Массовое создание трасс (fields=/exclude= - поля созданных трасс в ответе)"""
         try:
+            try:
+                fields = requested_fields(request.query_params)
+            except FieldsetError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
             routes_data = request.data.get('routes', [])
             if not routes_data:
                 return Response(
@@ -225,34 +270,26 @@ class RouteBulkOperationsView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            created_routes = []
-            errors = []
+            # ids_only=true - вернуть только ID созданных трасс вместо полных данных
+            ids_only = str(request.query_params.get('ids_only', request.data.get('ids_only', ''))).lower() == 'true'
 
-            with transaction.atomic():
-                for i, route_data in enumerate(routes_data):
-                    serializer = RouteSerializer(data=route_data)
-                    if serializer.is_valid():
-                        route = serializer.save()
-                        created_routes.append(serializer.data)
-                        logger.info(f"Создана трасса в массовой операции: {route.name} (ID: {route.id})")
-                    else:
-                        errors.append({
-                            'index': i,
-                            'data': route_data,
-                            'errors': serializer.errors
-                        })
+            routes, errors = bulk_create_routes(routes_data)
+            if ids_only:
+                result_key, created_routes = 'created_ids', [route.id for route in routes]
+            else:
+                result_key, created_routes = 'created_routes', RouteSerializer(routes, many=True, fields=fields).data
 
             if errors:
                 logger.warning(f"Ошибки при массовом создании трасс: {errors}")
                 return Response({
-                    'created_routes': created_routes,
+                    result_key: created_routes,
                     'errors': errors,
                     'message': f'Создано {len(created_routes)} трасс, {len(errors)} ошибок'
                 }, status=status.HTTP_207_MULTI_STATUS)
             else:
                 logger.info(f"Успешно создано {len(created_routes)} трасс в массовой операции")
                 return Response({
-                    'created_routes': created_routes,
+                    result_key: created_routes,
                     'message': f'Успешно создано {len(created_routes)} трасс'
                 }, status=status.HTTP_201_CREATED)
 
@@ -273,25 +310,9 @@ class RouteBulkOperationsView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            deleted_count = 0
-            not_found_ids = []
-
-            with transaction.atomic():
-                for route_id in route_ids:
-                    try:
-                        route = Route.objects.get(id=route_id)
-                        route_name = route.name
-                        route.delete()
-                        deleted_count += 1
-                        logger.info(f"Удалена трасса в массовой операции: {route_name} (ID: {route_id})")
-                    except Route.DoesNotExist:
-                        not_found_ids.append(route_id)
-                        logger.warning(f"Трасса с ID {route_id} не найдена для массового удаления")
-
-            # Перенумеровываем оставшиеся трассы
-            if deleted_count > 0:
-                Route.renumber_routes()
-                logger.info(f"Выполнена перенумерация после удаления {deleted_count} трасс")
+            deleted_count, not_found_ids = bulk_delete_routes(route_ids)
+            for route_id in not_found_ids:
+                logger.warning(f"Трасса с ID {route_id} не найдена для массового удаления")
 
             response_data = {
                 'deleted_count': deleted_count,
@@ -315,8 +336,12 @@ class RouteBulkOperationsView(APIView):
 
 @api_view(['POST'])
 def route_bulk_update(request):
-    """Массовое обновление трасс"""
+    """Массовое обновление трасс (fields=/exclude= - поля обновленных трасс в ответе)"""
     try:
+        try:
+            fields = requested_fields(request.query_params)
+        except FieldsetError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         updates_data = request.data.get('updates', [])
         if not updates_data:
             return Response(
@@ -324,37 +349,17 @@ def route_bulk_update(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        updated_routes = []
-        errors = []
-
-        with transaction.atomic():
-            for update_data in updates_data:
-                route_id = update_data.get('id')
-                if not route_id:
-                    errors.append({
-                        'data': update_data,
-                        'error': 'Не указан ID трассы'
-                    })
-                    continue
-
-                try:
-                    route = Route.objects.get(id=route_id)
-                    serializer = RouteSerializer(route, data=update_data, partial=True)
-                    if serializer.is_valid():
-                        updated_route = serializer.save()
-                        updated_routes.append(serializer.data)
-                        logger.info(f"Обновлена трасса в массовой операции: {updated_route.name} (ID: {route_id})")
-                    else:
-                        errors.append({
-                            'id': route_id,
-                            'data': update_data,
-                            'errors': serializer.errors
-                        })
-                except Route.DoesNotExist:
-                    errors.append({
-                        'id': route_id,
-                        'error': 'Трасса не найдена'
-                    })
+        try:
+            routes, errors = bulk_update_routes(updates_data)
+        except IntegrityError as e:
+            # Нарушения правил дорожек возвращаются ошибками отдельных трасс; сюда
+            # доходят только прочие ограничения базы, пакет откачен целиком
+            logger.warning(f"Массовое обновление трасс отклонено базой: {str(e)}")
+            return Response(
+                {'error': 'Изменения нарушают ограничения базы данных'},
+                status=status.HTTP_409_CONFLICT
+            )
+        updated_routes = RouteSerializer(routes, many=True, fields=fields).data
 
         if errors:
             logger.warning(f"Ошибки при массовом обновлении трасс: {errors}")
@@ -378,96 +383,170 @@ def route_bulk_update(request):
         )
 
 
-@api_view(['GET'])
-def route_search(request):
-    """Расширенный поиск трасс с множественными критериями"""
+@api_view(['POST'])
+def route_bulk_where(request):
+    """Массовое обновление или удаление трасс по фильтру
+
+    Тело запроса: filter - параметры фильтра (как в списке трасс и поиске),
+    action - update или delete, fields - новые значения полей (для update),
+    dry_run - только посчитать подходящие трассы.
+    """
     try:
-        queryset = Route.objects.all()
-        
-        # Поиск по названию
-        name = request.query_params.get('name', None)
-        if name:
-            queryset = queryset.filter(name__icontains=name)
-        
-        # Поиск по автору
-        author = request.query_params.get('author', None)
-        if author:
-            queryset = queryset.filter(author__icontains=author)
-        
-        # Фильтр по сложности
-        difficulty = request.query_params.get('difficulty', None)
-        if difficulty:
-            if difficulty not in [choice[0] for choice in Route.DifficultyLevel.choices]:
+        filter_params = request.data.get('filter') or {}
+        action = request.data.get('action')
+        dry_run = str(request.data.get('dry_run', '')).lower() == 'true'
+
+        if action not in ('update', 'delete'):
+            return Response(
+                {'error': 'Параметр action должен быть update или delete'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not isinstance(filter_params, dict):
+            return Response(
+                {'error': 'Параметр filter должен быть объектом'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        # Опечатка в имени параметра не должна превращать фильтр в "все трассы"
+        unknown = sorted(set(filter_params) - set(FILTER_PARAMS))
+        if unknown:
+            return Response(
+                {'error': f'Неизвестные параметры фильтра: {", ".join(unknown)}'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            route_filter = RouteFilter.compile(filter_params)
+        except RouteFilterError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if not route_filter.values:
+            return Response(
+                {'error': 'Не задан фильтр: массовое изменение всех трасс запрещено'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        queryset = route_filter.apply()
+
+        fields = {}
+        if action == 'update':
+            fields = request.data.get('fields') or {}
+            if not isinstance(fields, dict) or not fields:
                 return Response(
-                    {'error': f'Некорректный уровень сложности: {difficulty}'}, 
+                    {'error': 'Не предоставлены поля для обновления'}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            queryset = queryset.filter(difficulty=difficulty)
-        
-        # Фильтр по цвету
-        color = request.query_params.get('color', None)
-        if color:
-            queryset = queryset.filter(color__icontains=color)
-        
-        # Фильтр по активности
-        is_active = request.query_params.get('is_active', None)
-        if is_active is not None:
-            queryset = queryset.filter(is_active=is_active.lower() == 'true')
-        
-        # Фильтр по дате создания (от)
-        created_after = request.query_params.get('created_after', None)
-        if created_after:
-            try:
-                from datetime import datetime
-                date_obj = datetime.fromisoformat(created_after.replace('Z', '+00:00'))
-                queryset = queryset.filter(created_at__gte=date_obj)
-            except ValueError:
+            forbidden = sorted(set(fields) - set(FILTER_UPDATE_FIELDS))
+            if forbidden:
                 return Response(
-                    {'error': 'Некорректный формат даты для created_after'}, 
+                    {'error': f'По фильтру можно менять только поля {", ".join(FILTER_UPDATE_FIELDS)}, '
+                              f'недопустимые поля: {", ".join(forbidden)}'}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
+            serializer = RouteSerializer(data=fields, partial=True)
+            if not serializer.is_valid():
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                values = filter_update_values(serializer.validated_data)
+            except ValidationError as e:
+                return Response(validation_errors(e), status=status.HTTP_400_BAD_REQUEST)
+            fields = dict(serializer.validated_data)
+
+        if dry_run:
+            matched_count = queryset.count()
+            return Response({
+                'matched_count': matched_count,
+                'dry_run': True,
+                'message': f'Под фильтр попадает {matched_count} трасс'
+            })
+
+        if action == 'update':
+            updated_count = queryset.update(**values)
+            logger.info(f"Обновлено {updated_count} трасс по фильтру {filter_params}: {list(fields)}")
+            return Response({
+                'updated_count': updated_count,
+                'message': f'Обновлено {updated_count} трасс'
+            })
+
+        deleted_count = delete_routes_where(queryset)
+        logger.info(f"Удалено {deleted_count} трасс по фильтру {filter_params}")
+        return Response({
+            'deleted_count': deleted_count,
+            'message': f'Удалено {deleted_count} трасс'
+        })
+
+    except Exception as e:
+        logger.error(f"Ошибка при изменении трасс по фильтру: {str(e)}")
+        return Response(
+            {'error': 'Внутренняя ошибка сервера'}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@api_view(['GET'])
+def route_search(request):
+    """Расширенный поиск трасс с множественными критериями"""
+    try:
+        try:
+            queryset = filter_routes(request.query_params)
+            reader = RouteReadSerializer(requested_fields(request.query_params))
+        except (RouteFilterError, FieldsetError) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Сортировка (неизвестная сортировка - порядок списка трасс по умолчанию);
+        # с нечетким поиском fuzzy по умолчанию - по сходству, с запросом q - по релевантности
+        search_text = request.query_params.get('q', '')
+        fuzzy_text = request.query_params.get('fuzzy', '').strip()
+        if fuzzy_text:
+            default_ordering = 'similarity'
+        elif search_terms(search_text):
+            default_ordering = 'relevance'
+        else:
+            default_ordering = '-created_at'
+        ordering = request.query_params.get('ordering', default_ordering)
+        if ordering == 'relevance':
+            if not search_terms(search_text):
+                ordering = '-created_at'
+            else:
+                queryset = queryset.annotate(search_rank=relevance(search_text))
+        if ordering == 'similarity':
+            if not fuzzy_text:
+                ordering = '-created_at'
+            else:
+                queryset = queryset.annotate(similarity=fuzzy_similarity(fuzzy_text))
+        paginator = RouteCursorPagination(ordering=SEARCH_ORDERINGS.get(ordering, DEFAULT_ORDERING))
         
-        # Фильтр по дате создания (до)
-        created_before = request.query_params.get('created_before', None)
-        if created_before:
+        if paginator.page_query_param in request.query_params:
+            # Постраничный режим прежних клиентов (page/page_size, OFFSET и полный подсчет)
             try:
-                from datetime import datetime
-                date_obj = datetime.fromisoformat(created_before.replace('Z', '+00:00'))
-                queryset = queryset.filter(created_at__lte=date_obj)
+                page = max(int(request.query_params[paginator.page_query_param]), 1)
             except ValueError:
                 return Response(
-                    {'error': 'Некорректный формат даты для created_before'}, 
+                    {'error': 'Некорректный номер страницы'}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
+            page_size = paginator.get_page_size(request)
+            start = (page - 1) * page_size
+            total_count, _ = filtered_count(queryset, request.query_params, 'exact')
+            routes = reader.rows(queryset.order_by(*paginator.order_by()))[start:start + page_size]
+            response_data = {
+                'results': reader.serialize(routes),
+                'count': total_count,
+                'page': page,
+                'page_size': page_size,
+                'total_pages': (total_count + page_size - 1) // page_size
+            }
+        else:
+            # Курсорная пагинация: next/previous, общее количество - по count=exact|estimate
+            try:
+                routes = paginator.paginate_queryset(reader.rows(queryset, extra=paginator.key_names), request)
+            except InvalidCursor as e:
+                return Response({'error': str(e.detail)}, status=status.HTTP_400_BAD_REQUEST)
+            response_data = paginator.get_paginated_data(reader.serialize(routes))
         
-        # Сортировка
-        ordering = request.query_params.get('ordering', '-created_at')
-        if ordering:
-            allowed_fields = ['name', 'author', 'difficulty', 'created_at', '-name', '-author', '-difficulty', '-created_at']
-            if ordering in allowed_fields:
-                queryset = queryset.order_by(ordering)
-        
-        # Пагинация
-        page_size = int(request.query_params.get('page_size', 20))
-        page = int(request.query_params.get('page', 1))
-        
-        start = (page - 1) * page_size
-        end = start + page_size
-        
-        total_count = queryset.count()
-        routes = queryset[start:end]
-        
-        serializer = RouteSerializer(routes, many=True)
-        
-        logger.info(f"Выполнен расширенный поиск: найдено {total_count} трасс")
+        logger.info(f"Выполнен расширенный поиск: найдено {len(response_data['results'])} трасс на странице")
         
-        return Response({
-            'results': serializer.data,
-            'count': total_count,
-            'page': page,
-            'page_size': page_size,
-            'total_pages': (total_count + page_size - 1) // page_size
-        })
+        # facets=true - счетчики по сложности, цвету, автору, дорожке и активности
+        if request.query_params.get('facets', '').lower() == 'true':
+            response_data['facets'] = cached_facets(request.query_params)
+        return Response(response_data)
         
     except Exception as e:
         logger.error(f"Ошибка при расширенном поиске: {str(e)}")
@@ -477,22 +556,66 @@ def route_search(request):
         )
 
 
+@api_view(['GET'])
+def route_suggest(request):
+    """Подсказки для ввода: названия, авторы и цвета, начинающиеся с q
+
+    field - одно из полей (name, author, color), по умолчанию - все; limit -
+    количество подсказок на поле (не больше SUGGEST_MAX_LIMIT). Подсказки
+    отдаются из памяти процесса, без запросов к базе на каждое нажатие.
+    """
+    field = request.query_params.get('field')
+    if field is not None and field not in SUGGEST_FIELDS:
+        return Response(
+            {'error': f'Неизвестное поле подсказок: {field}. Доступны: {", ".join(SUGGEST_FIELDS)}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        limit = int(request.query_params.get('limit', SUGGEST_LIMIT))
+    except ValueError:
+        limit = SUGGEST_LIMIT
+    limit = max(1, min(limit, SUGGEST_MAX_LIMIT))
+
+    suggestions = route_suggestions()
+    prefix = request.query_params.get('q', '')
+    return Response({
+        name: [
+            {'value': value, 'count': count}
+            for value, count in suggestions.complete(name, prefix, limit)
+        ]
+        for name in ([field] if field else SUGGEST_FIELDS)
+    })
+
+
+@api_view(['GET'])
+def route_compact(request):
+    """Компактная выгрузка трасс по колонкам для клиентской фильтрации
+
+    Колонки целых чисел плюс словари авторов, цветов и категорий сложности (см.
+    routes/compact.py). Принимает те же фильтры, что и список трасс; по
+    умолчанию - только активные трассы.
+    """
+    params = request.query_params.copy()
+    params.setdefault('is_active', 'true')
+    try:
+        return Response(cached_compact_routes(params))
+    except RouteFilterError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
 @api_view(['GET'])
 def route_authors(request):
-    """Получить список всех авторов трасс"""
+    """Получить список всех авторов трасс
+
+    Принимает те же фильтры, что и список трасс (is_active, lane_min/lane_max,
+    difficulty_min/difficulty_max и т.д.).
+    """
     try:
-        authors = Route.objects.values_list('author', flat=True).distinct().order_by('author')
-        author_stats = []
-        
-        for author in authors:
-            route_count = Route.objects.filter(author=author).count()
-            active_count = Route.objects.filter(author=author, is_active=True).count()
-            author_stats.append({
-                'name': author,
-                'total_routes': route_count,
-                'active_routes': active_count,
-                'inactive_routes': route_count - active_count
-            })
+        try:
+            queryset = filter_routes(request.query_params)
+        except RouteFilterError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        author_stats = dimension_counts('author', queryset)
         
         logger.info(f"Запрошен список авторов: {len(author_stats)} авторов")
         return Response(author_stats)
@@ -507,20 +630,16 @@ def route_authors(request):
 
 @api_view(['GET'])
 def route_colors(request):
-    """Получить список всех цветов трасс"""
+    """Получить список всех цветов трасс
+
+    Принимает те же фильтры, что и список трасс.
+    """
     try:
-        colors = Route.objects.values_list('color', flat=True).distinct().order_by('color')
-        color_stats = []
-        
-        for color in colors:
-            route_count = Route.objects.filter(color=color).count()
-            active_count = Route.objects.filter(color=color, is_active=True).count()
-            color_stats.append({
-                'name': color,
-                'total_routes': route_count,
-                'active_routes': active_count,
-                'inactive_routes': route_count - active_count
-            })
+        try:
+            queryset = filter_routes(request.query_params)
+        except RouteFilterError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        color_stats = dimension_counts('color', queryset)
         
         logger.info(f"Запрошен список цветов: {len(color_stats)} цветов")
         return Response(color_stats)
@@ -535,8 +654,12 @@ def route_colors(request):
 
 @api_view(['POST'])
 def route_toggle_active(request, pk):
-    """Переключить статус активности трассы"""
+    """Переключить статус активности трассы (fields=/exclude= - поля трассы в ответе)"""
     try:
+        try:
+            fields = requested_fields(request.query_params)
+        except FieldsetError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         try:
             route = Route.objects.get(id=pk)
         except Route.DoesNotExist:
@@ -551,7 +674,7 @@ def route_toggle_active(request, pk):
         status_text = 'активна' if route.is_active else 'неактивна'
         logger.info(f"Изменен статус трассы {route.name} (ID: {pk}): {status_text}")
         
-        serializer = RouteSerializer(route)
+        serializer = RouteSerializer(route, fields=fields)
         return Response({
             'message': f'Трасса "{route.name}" теперь {status_text}',
             'route': serializer.data
@@ -568,42 +691,12 @@ def route_toggle_active(request, pk):
 def home_view(request):
     """Главная страница веб-приложения для управления API"""
     try:
-        from datetime import datetime, timedelta
-        
         # Получаем данные из SQLite базы данных
         all_routes = Route.objects.all().order_by('track_lane', 'route_number')
         active_routes = Route.objects.filter(is_active=True).order_by('track_lane', 'route_number')
         
-        # Получаем текущую дату
-        today = datetime.now().date()
-        
-        # Считаем новые трассы (младше 30 дней)
-        new_routes = 0
-        for route in active_routes:
-            setup_date_str = route.setup_date
-            if setup_date_str:
-                try:
-                    # Парсим дату в формате DD.MM.YYYY
-                    setup_date = datetime.strptime(setup_date_str, '%d.%m.%Y').date()
-                    if (today - setup_date).days <= 30:
-                        new_routes += 1
-                except ValueError:
-                    # Если дата в неправильном формате, пропускаем
-                    continue
-        
-        # Считаем трассы, которые скоро обновятся (старше 90 дней)
-        old_routes = 0
-        for route in active_routes:
-            setup_date_str = route.setup_date
-            if setup_date_str:
-                try:
-                    # Парсим дату в формате DD.MM.YYYY
-                    setup_date = datetime.strptime(setup_date_str, '%d.%m.%Y').date()
-                    if (today - setup_date).days > 90:
-                        old_routes += 1
-                except ValueError:
-                    # Если дата в неправильном формате, пропускаем
-                    continue
+        # Новые трассы (младше 30 дней) и трассы, которые скоро обновятся (старше 90 дней)
+        new_routes, old_routes = setup_age_counts(active_routes)
         
         # Получаем статистику для отображения
         total_routes = all_routes.count()
@@ -650,8 +743,7 @@ def export_to_google_sheets(request):
     """Экспорт всех трасс в Google Sheets"""
     try:
         # Получаем все трассы
-        routes = Route.objects.all()
-        routes_data = RouteSerializer(routes, many=True).data
+        routes_data = RouteReadSerializer().data(Route.objects.all())
         
         # Синхронизируем с Google Sheets
         sync = RoutesGoogleSheetsSync()
@@ -785,43 +877,17 @@ def google_sheets_routes(request):
 def admin_panel_view(request):
     """Админ-панель для управления трассами"""
     try:
-        from datetime import datetime, timedelta
-        
         # Получаем данные из SQLite базы данных
         all_routes = Route.objects.all()
         active_routes = Route.objects.filter(is_active=True)
         
-        # Получаем текущую дату
-        today = datetime.now().date()
-        
         # Считаем статистику
         total_routes = all_routes.count()
         active_routes_count = active_routes.count()
         inactive_routes_count = total_routes - active_routes_count
         
-        # Считаем новые трассы (младше 30 дней)
-        new_routes = 0
-        for route in active_routes:
-            setup_date_str = route.setup_date
-            if setup_date_str:
-                try:
-                    setup_date = datetime.strptime(setup_date_str, '%d.%m.%Y').date()
-                    if (today - setup_date).days <= 30:
-                        new_routes += 1
-                except ValueError:
-                    continue
-        
-        # Считаем трассы, которые скоро обновятся (старше 90 дней)
-        old_routes = 0
-        for route in active_routes:
-            setup_date_str = route.setup_date
-            if setup_date_str:
-                try:
-                    setup_date = datetime.strptime(setup_date_str, '%d.%m.%Y').date()
-                    if (today - setup_date).days > 90:
-                        old_routes += 1
-                except ValueError:
-                    continue
+        # Новые трассы (младше 30 дней) и трассы, которые скоро обновятся (старше 90 дней)
+        new_routes, old_routes = setup_age_counts(active_routes)
         
         context = {
             'routes': all_routes,  # Показываем все трассы в админке
@@ -850,39 +916,70 @@ def admin_panel_view(request):
         })
 
 
-def export_routes_csv(request):
-    """Экспорт всех трасс в CSV формате"""
+class CSVLineBuffer:
+    """Псевдофайл для csv.writer: write() возвращает строку вместо записи"""
+
+    def write(self, value):
+        return value
+
+
+def csv_export_lines(rows, total):
+    """Строки CSV экспорта по одной: BOM, заголовки, трассы из ``rows`` (values_list)"""
+    writer = csv.writer(CSVLineBuffer())
+    
+    # BOM для корректного отображения кириллицы в Excel
+    yield '\ufeff'
+    yield writer.writerow(['№ Трассы', 'Дорожка', 'Название', 'Сложность', 'Цвет', 'Автор', 'Дата накрутки', 'Описание'])
+    
+    exported = 0
     try:
-        # Получаем все активные трассы
-        routes = Route.objects.filter(is_active=True).order_by('route_number')
-        
-        # Создаем HTTP ответ с CSV
-        response = HttpResponse(content_type='text/csv; charset=utf-8')
-        response['Content-Disposition'] = f'attachment; filename="traссы_{len(routes)}_шт_{datetime.now().strftime("%Y%m%d")}.csv"'
-        
-        # Добавляем BOM для корректного отображения кириллицы в Excel
-        response.write('\ufeff')
-        
-        # Создаем CSV writer
-        writer = csv.writer(response)
-        
-        # Записываем заголовки
-        writer.writerow(['№ Трассы', 'Дорожка', 'Название', 'Сложность', 'Цвет', 'Автор', 'Дата накрутки', 'Описание'])
-        
-        # Записываем данные
-        for route in routes:
-            writer.writerow([
-                route.route_number,
-                route.track_lane,
-                route.name,
-                route.difficulty,
-                route.color,
-                route.author,
-                route.setup_date,
-                route.description or ''
+        for route_number, track_lane, name, difficulty, color, author, setup_date, description in rows.iterator(
+            chunk_size=CSV_EXPORT_CHUNK_SIZE
+        ):
+            yield writer.writerow([
+                route_number,
+                track_lane,
+                name,
+                difficulty,
+                color,
+                author,
+                setup_date.strftime('%d.%m.%Y') if setup_date else '',
+                description or ''
             ])
+            exported += 1
+    except Exception as e:
+        # Заголовки ответа уже отправлены - остается только записать ошибку в лог
+        logger.error(f"Ошибка при экспорте CSV после {exported} из {total} трасс: {str(e)}")
+        raise
+    
+    logger.info(f"Экспортировано {exported} трасс в CSV")
+
+
+def export_routes_csv(request):
+    """Экспорт трасс в CSV формате
+
+    Принимает те же фильтры, что и список трасс; по умолчанию - только активные
+    трассы, include_inactive=true - все. Файл отдается потоком: строки читаются
+    из базы порциями по CSV_EXPORT_CHUNK_SIZE, поэтому память не растет с
+    количеством трасс.
+    """
+    try:
+        params = request.GET.copy()
+        try:
+            if not parse_flag('include_inactive', params.get('include_inactive', 'false')):
+                params.setdefault('is_active', 'true')
+            routes = filter_routes(params).order_by('route_number')
+        except RouteFilterError as e:
+            return HttpResponse(str(e), status=400)
+        
+        # Количество трасс для имени файла - отдельный COUNT, без загрузки строк
+        total = routes.count()
+        rows = routes.values_list(
+            'route_number', 'track_lane', 'name', 'difficulty', 'color', 'author', 'setup_date', 'description'
+        )
         
-        logger.info(f"Экспортировано {len(routes)} трасс в CSV")
+        response = StreamingHttpResponse(csv_export_lines(rows, total), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="traссы_{total}_шт_{datetime.now().strftime("%Y%m%d")}.csv"'
         return response
         
     except Exception as e:
@@ -3,6 +3,20 @@
 let allRoutes = [];
 let filteredRoutes = [];
 
+// Компактная выгрузка трасс по колонкам (/api/routes/compact/): фильтры
+// сравнивают номера авторов, цветов и категорий вместо текста из таблицы
+let compactRoutes = null;
+
+// Периоды фильтра по дате накрутки (дней назад)
+const DATE_FILTER_DAYS = {
+    today: 0,
+    week: 7,
+    month: 30,
+    '3months': 90,
+    '6months': 180,
+    year: 365
+};
+
 // Функция для принудительного применения стилей сложности
 function applyDifficultyStyles() {
     // Находим все бейджи сложности в основной таблице
@@ -81,6 +95,9 @@ document.addEventListener('DOMContentLoaded', function() {
     // Инициализируем фильтры
     initializeFilters();
     
+    // Загружаем колонки трасс для быстрой фильтрации
+    loadCompactRoutes();
+    
     console.log('Инициализация фильтрации завершена');
 });
 
@@ -142,6 +159,71 @@ function collectRoutesFromTable() {
     console.log(`Загружено ${allRoutes.length} трасс для фильтрации`);
 }
 
+// Загрузка компактной выгрузки трасс; без нее фильтры работают по тексту таблицы
+function loadCompactRoutes() {
+    return fetch('/api/routes/compact/', { headers: { 'Accept': 'application/json' } })
+        .then(response => response.ok ? response.json() : null)
+        .then(data => {
+            if (!data) return;
+            compactRoutes = data;
+            const positions = new Map(data.columns.id.map((id, index) => [String(id), index]));
+            allRoutes.forEach(route => {
+                route.compactIndex = positions.get(String(route.id));
+            });
+            console.log(`Загружена компактная выгрузка: ${data.count} трасс`);
+        })
+        .catch(error => console.warn('Не удалось загрузить компактную выгрузку трасс:', error));
+}
+
+// Номер дня (с 1970-01-01), как в колонке setup компактной выгрузки
+function dayNumber(date) {
+    return Math.floor(Date.UTC(date.getFullYear(), date.getMonth(), date.getDate()) / 86400000);
+}
+
+// Значение без лишних пробелов и регистра: в таблице текст обрезан, а в
+// словарях выгрузки значения лежат как в базе
+function normalizeFilterValue(value) {
+    return value.trim().replace(/\s+/g, ' ').toLowerCase();
+}
+
+// Номера значений словаря выгрузки, совпадающих с выбранным значением фильтра
+function dictionaryIds(dictionary, value) {
+    const normalized = normalizeFilterValue(value);
+    const ids = new Set();
+    dictionary.forEach((entry, index) => {
+        if (normalizeFilterValue(entry) === normalized) ids.add(index);
+    });
+    return ids;
+}
+
+// Условие фильтров по колонкам компактной выгрузки: функция от номера трассы в колонках
+function compactFilter(filters) {
+    const columns = compactRoutes.columns;
+    const grade = filters.difficulty ? compactRoutes.grades.indexOf(filters.difficulty) : null;
+    const lane = filters.lane ? parseInt(filters.lane, 10) : null;
+    const authors = filters.author ? dictionaryIds(compactRoutes.authors, filters.author) : null;
+    const colors = filters.color ? dictionaryIds(compactRoutes.colors, filters.color) : null;
+    const maxAge = filters.dateFilter ? DATE_FILTER_DAYS[filters.dateFilter] : undefined;
+    const today = dayNumber(new Date());
+    
+    return index => {
+        if (grade !== null && columns.grade[index] !== grade) return false;
+        if (lane !== null && columns.lane[index] !== lane) return false;
+        if (authors !== null && !authors.has(columns.author[index])) return false;
+        if (colors !== null && !colors.has(columns.color[index])) return false;
+        if (maxAge !== undefined) {
+            const setup = columns.setup[index];
+            if (setup === null) return false;
+            const age = today - setup;
+            if (maxAge === 0 ? age !== 0 : age > maxAge) return false;
+        }
+        if (filters.searchText && !columns.name[index].toLowerCase().includes(filters.searchText)) {
+            return false;
+        }
+        return true;
+    };
+}
+
 // Инициализация фильтров
 function initializeFilters() {
     // Заполняем выпадающие списки авторов и цветов
@@ -218,7 +300,15 @@ function filterRoutes() {
         });
     }
     
+    const matchesCompact = compactRoutes ?
+        compactFilter({ difficulty, lane, author, dateFilter, searchText, color }) : null;
+    
     filteredRoutes = allRoutes.filter(route => {
+        // По колонкам компактной выгрузки, если трасса в ней есть
+        if (matchesCompact && route.compactIndex !== undefined) {
+            return matchesCompact(route.compactIndex);
+        }
+        
         // Фильтр по сложности (извлекаем чистую сложность из текста с иконками)
         if (difficulty) {
             const cleanDifficulty = route.difficulty.replace(/[^\w\s+-]/g, '').trim();
@@ -464,4 +554,5 @@ function clearAllFilters() {
 function refreshRoutesData() {
     collectRoutesFromTable();
     initializeFilters();
+    loadCompactRoutes();
 }
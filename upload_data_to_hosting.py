@@ -63,7 +63,7 @@ def upload_data_to_hosting():
                 'difficulty': route.difficulty,
                 'color': route.color,
                 'author': route.author,
-                'setup_date': str(route.setup_date) if route.setup_date else '',
+                'setup_date': route.setup_date.strftime('%d.%m.%Y') if route.setup_date else '',
                 'description': route.description or '',
                 'is_active': route.is_active
             }